@@ -0,0 +1,126 @@
+"""Micro-benchmark of the compiled record codec
+
+Compares gbp_archive.codec against the generic path, dataclasses.asdict() and
+utils.decode_to(), for encoding and decoding records like those in a dump's
+records.json.
+
+    python benchmarks/records_codec.py [--records N] [--repeat N]
+"""
+
+import argparse
+import dataclasses
+import datetime as dt
+import sys
+import timeit
+from typing import Any, Callable
+
+import orjson
+
+from gbp_archive import codec, utils
+
+
+@dataclasses.dataclass(frozen=True)
+class Record:  # pylint: disable=too-many-instance-attributes
+    """Stand-in for gentoo_build_publisher's BuildRecord"""
+
+    machine: str
+    build_id: str
+    note: str | None = None
+    logs: str | None = None
+    keep: bool = False
+    submitted: dt.datetime | None = None
+    completed: dt.datetime | None = None
+    built: dt.datetime | None = None
+
+
+@utils.convert_to(Record, "built")
+@utils.convert_to(Record, "completed")
+@utils.convert_to(Record, "submitted")
+def _(value: str | None) -> dt.datetime | None:
+    return None if value is None else dt.datetime.fromisoformat(value)
+
+
+def make_records(count: int) -> list[Record]:
+    """Return count records"""
+    now = dt.datetime.now(tz=dt.UTC)
+
+    return [
+        Record(
+            machine=f"machine{i % 20}",
+            build_id=str(i),
+            note="This is a test" if i % 3 == 0 else None,
+            logs="x" * 200,
+            keep=i % 7 == 0,
+            submitted=now,
+            completed=now,
+            built=now,
+        )
+        for i in range(count)
+    ]
+
+
+def generic_dump(records: list[Record]) -> bytes:
+    """Serialize the records the generic way"""
+    serialized = [dataclasses.asdict(record) for record in records]
+
+    return orjson.dumps(serialized)  # pylint: disable=no-member
+
+
+def compiled_dump(records: list[Record]) -> bytes:
+    """Serialize the records with the compiled encoder"""
+    encode = codec.encoder(Record)
+
+    serialized = [encode(record) for record in records]
+
+    return orjson.dumps(serialized)  # pylint: disable=no-member
+
+
+def generic_load(data: bytes) -> list[Record]:
+    """Deserialize the records the generic way"""
+    items = orjson.loads(data)  # pylint: disable=no-member
+
+    return [utils.decode_to(Record, item) for item in items]
+
+
+def compiled_load(data: bytes) -> list[Record]:
+    """Deserialize the records with the compiled decoder"""
+    decode = codec.decoder(Record)
+
+    items = orjson.loads(data)  # pylint: disable=no-member
+
+    return [decode(item) for item in items]
+
+
+def best(func: Callable[[Any], Any], arg: Any, repeat: int) -> float:
+    """Return the best time, in seconds, of repeat calls of func(arg)"""
+    return min(timeit.repeat(lambda: func(arg), number=1, repeat=repeat))
+
+
+def main() -> None:
+    """Run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = make_records(args.records)
+    data = generic_dump(records)
+    assert compiled_dump(records) == data
+    assert compiled_load(data) == generic_load(data) == records
+
+    for name, generic, compiled, arg in [
+        ("encode", generic_dump, compiled_dump, records),
+        ("decode", generic_load, compiled_load, data),
+    ]:
+        generic_time = best(generic, arg, args.repeat)
+        compiled_time = best(compiled, arg, args.repeat)
+        sys.stdout.write(
+            f"{name} {args.records} records:"
+            f" generic {generic_time * 1000:.1f} ms,"
+            f" compiled {compiled_time * 1000:.1f} ms"
+            f" ({generic_time / compiled_time:.1f}x)\n"
+        )
+
+
+if __name__ == "__main__":
+    main()
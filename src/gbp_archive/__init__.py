@@ -1,12 +1,28 @@
 """gbp-archive: dump and restore builds in Gentoo Build Publisher"""
 
-import importlib.metadata
+from typing import Any
 
-__version__ = importlib.metadata.version("gbp-archive")
 
-# Plugin definition
-plugin = {
-    "name": "gbp-archive",
-    "version": __version__,
-    "description": "Dump and restore builds in Gentoo Build Publisher",
-}
+def __getattr__(name: str) -> Any:
+    """Lazily compute the package version and plugin definition
+
+    gbpcli imports this package on every `gbp` invocation (in order to build its
+    argument parser) so we don't want to pay for the importlib.metadata lookup unless
+    something actually asks for it.
+    """
+    # pylint: disable=import-outside-toplevel
+    if name == "__version__":
+        import importlib.metadata
+
+        return importlib.metadata.version("gbp-archive")
+
+    if name == "plugin":
+        # Plugin definition
+        return {
+            "name": "gbp-archive",
+            "app": "gbp_archive.django.gbp_archive.apps.GBPArchiveConfig",
+            "version": __getattr__("__version__"),
+            "description": "Dump and restore builds in Gentoo Build Publisher",
+        }
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,277 @@
+"""Cache of the dumped storage of builds
+
+Pulled builds don't change, yet each full dump walks, reads and archives the storage of
+every build again. Instead each build's part of the storage archive, its segment, can
+be kept in a cache under the storage root and copied as is into the next dump.
+
+A segment depends on more than its build. Its tags are part of it, the dump's options
+change what is written and deltas refer to the machine's build dumped before it. So
+segments are keyed by a digest of all of these along with a fingerprint of the build's
+storage. A segment whose key doesn't match is written again and replaces the cached
+one. Hard links refer to the first link of their file dumped, in an earlier build.
+Those builds are only known once the segment is written, so they are kept alongside
+it, each with the machine's build dumped before it. The segment is reused only if they
+are dumped again, after the same builds. Purging a build then only misses the cache for
+the builds that link to it, or delta-encode against it. Also alongside each segment
+are the names of its files with more than one link. These are needed to find the hard
+links of later builds that aren't cached.
+
+The cache has a size cap. Once over it, the least recently used segments are evicted.
+Segments of builds that have since been purged, and those over the cap, are dropped at
+the start of each dump that uses the cache.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from types import TracebackType
+from typing import IO, Callable, Iterable, Iterator, Mapping, NamedTuple, Self
+
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build
+
+from gbp_archive.types import DumpOptions
+from gbp_archive.utils import stat_key
+
+CACHE_DIR = Path(".gbp-archive", "segments")
+INDEX_NAME = "index.sqlite"
+VERSION = 2
+"""Version of the segments' format. Changing it invalidates all of the cache"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    build TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+)
+"""
+
+
+class Segment(NamedTuple):
+    """A build's cached segment of the storage archive"""
+
+    path: Path
+    """Path of the segment's data"""
+
+    links: list[str]
+    """Names of the segment's regular files with more than one link, in order"""
+
+    needs: dict[str, str | None]
+    """Ids of its hard links' targets' builds, each with the machine's build before it"""
+
+    def usable(self, dumped: Mapping[str, str | None]) -> bool:
+        """Return whether the segment can be reused in a dump
+
+        dumped maps the ids of the builds dumped so far to that of the machine's build
+        dumped before each. The builds the segment needs must have been dumped, after
+        the same builds as when it was written. Otherwise its hard links may refer to
+        other files.
+        """
+        return all(
+            build in dumped and dumped[build] == before
+            for build, before in self.needs.items()
+        )
+
+
+class SegmentCache:
+    """Cache of storage archive segments under the given root, of at most max_size"""
+
+    def __init__(self, root: Path, max_size: int) -> None:
+        self.directory = root / CACHE_DIR
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self.connection = sqlite3.connect(self.directory / INDEX_NAME, timeout=30)
+        self.connection.execute(SCHEMA)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def get(self, build: Build, key: str) -> Segment | None:
+        """Return the given build's segment if it's cached with the given key"""
+        row = self.connection.execute(
+            "SELECT key FROM segments WHERE build = ?", (str(build),)
+        ).fetchone()
+
+        if row is None or row[0] != key:
+            return None
+
+        try:
+            data = json.loads(self.links_path(build).read_text(encoding="utf8"))
+        except FileNotFoundError:
+            self.remove(build)
+            return None
+
+        self.connection.execute(
+            "UPDATE segments SET used = ? WHERE build = ?", (now(), str(build))
+        )
+        self.connection.commit()
+
+        return Segment(self.segment_path(build), data["links"], data["needs"])
+
+    @contextmanager
+    def add(
+        self, build: Build, key: str
+    ) -> Iterator[tuple[IO[bytes], list[str], dict[str, str | None]]]:
+        """Context to add the given build's segment to the cache
+
+        Yield the file to write the segment to, the list to append its names of files
+        with more than one link to and the dict to set the builds it needs in (see
+        Segment). The segment is only added if the context exits without error.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".", suffix=".partial")
+        links: list[str] = []
+        needs: dict[str, str | None] = {}
+
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                yield fp, links, needs
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        self.put(build, key, Path(tmp), links, needs)
+
+    def put(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        build: Build,
+        key: str,
+        path: Path,
+        links: Iterable[str],
+        needs: Mapping[str, str | None],
+    ) -> None:
+        """Move the given segment file into the cache as the build's segment
+
+        Segments larger than the cache are discarded. Evict the least recently used
+        segments if the cache is then over its size.
+        """
+        size = path.stat().st_size
+        self.remove(build)
+
+        if size > self.max_size:
+            path.unlink()
+            return
+
+        data = {"links": list(links), "needs": dict(needs)}
+        self.links_path(build).write_text(json.dumps(data), encoding="utf8")
+        os.replace(path, self.segment_path(build))
+        self.connection.execute(
+            "INSERT INTO segments VALUES (?, ?, ?, ?)", (str(build), key, size, now())
+        )
+        self.evict()
+        self.connection.commit()
+
+    def evict(self) -> list[Build]:
+        """Remove the least recently used segments until the cache fits its size
+
+        Return the builds whose segments were removed.
+        """
+        evicted: list[Build] = []
+        size = self.size
+        rows = self.connection.execute(
+            "SELECT build, size FROM segments ORDER BY used, rowid"
+        ).fetchall()
+
+        for build_id, segment_size in rows:
+            if size <= self.max_size:
+                break
+            build = Build.from_id(build_id)
+            self.remove(build)
+            evicted.append(build)
+            size -= segment_size
+
+        return evicted
+
+    def prune(self, exists: Callable[[Build], bool]) -> list[Build]:
+        """Remove the segments of the builds that no longer exist
+
+        Return the builds whose segments were removed.
+        """
+        rows = self.connection.execute("SELECT build FROM segments").fetchall()
+        builds = [Build.from_id(build_id) for (build_id,) in rows]
+        pruned = [build for build in builds if not exists(build)]
+
+        for build in pruned:
+            self.remove(build)
+
+        self.connection.commit()
+
+        return pruned
+
+    def remove(self, build: Build) -> None:
+        """Remove the given build's segment, if any"""
+        self.connection.execute("DELETE FROM segments WHERE build = ?", (str(build),))
+        self.segment_path(build).unlink(missing_ok=True)
+        self.links_path(build).unlink(missing_ok=True)
+
+    @property
+    def size(self) -> int:
+        """Total size of the cached segments"""
+        row = self.connection.execute("SELECT SUM(size) FROM segments").fetchone()
+
+        return int(row[0] or 0)
+
+    def __len__(self) -> int:
+        row = self.connection.execute("SELECT COUNT(*) FROM segments").fetchone()
+
+        return int(row[0])
+
+    def segment_path(self, build: Build) -> Path:
+        """Return the path of the given build's segment"""
+        return self.directory / f"{build}.tar"
+
+    def links_path(self, build: Build) -> Path:
+        """Return the path of the given build's links data
+
+        That is its names of files with more than one link and the builds it needs.
+        """
+        return self.directory / f"{build}.links"
+
+    def close(self) -> None:
+        """Save the cache's index and close it"""
+        self.connection.commit()
+        self.connection.close()
+
+
+def segment_key(build: Build, base: Build | None, options: DumpOptions) -> str:
+    """Return the cache key of the given build's segment
+
+    base is the build its files are delta-encoded against, if any. The build's storage
+    is fingerprinted by its Content directories' inode numbers and timestamps, which
+    change if the directory is replaced or its entries are.
+    """
+    storage = publisher.storage
+    fingerprint = {
+        "version": VERSION,
+        "build": str(build),
+        "base": None if base is None else str(base),
+        "tags": sorted(storage.get_tags(build)),
+        "contents": [content.value for content in options.contents],
+        "reproducible": options.reproducible,
+        "checksums": options.checksums,
+        "compress": options.compress,
+        "delta": options.delta,
+        "storage": [
+            stat_key(storage.get_path(build, content)) for content in options.contents
+        ],
+    }
+
+    return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()
+
+
+def now() -> float:
+    """Return the current time as a timestamp"""
+    return dt.datetime.now(tz=dt.UTC).timestamp()
@@ -0,0 +1,200 @@
+"""Catalog of the dumps in a directory
+
+Finding which of hundreds of dumps has a given build would otherwise mean reading the
+metadata of each one. The catalog reads it once and keeps each dump's manifest, size,
+creation time and hostname in a SQLite database under the storage root. Updating the
+catalog only reads the dumps that are new or whose size or mtime have changed, and
+drops those that are gone.
+"""
+
+import datetime as dt
+import json
+import os
+import sqlite3
+import tarfile as tar
+from pathlib import Path
+from types import TracebackType
+from typing import NamedTuple, Self
+
+from gentoo_build_publisher.types import Build
+
+from gbp_archive.core import read_metadata
+
+CATALOG_PATH = Path(".gbp-archive", "catalog.sqlite")
+PATTERN = "*.tar"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    created TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    hostname TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS builds (
+    path TEXT NOT NULL REFERENCES archives (path) ON DELETE CASCADE,
+    build TEXT NOT NULL,
+    machine TEXT NOT NULL,
+    PRIMARY KEY (path, build)
+);
+CREATE INDEX IF NOT EXISTS builds_by_build ON builds (build);
+CREATE INDEX IF NOT EXISTS builds_by_machine ON builds (machine);
+"""
+
+
+class Archive(NamedTuple):
+    """A dump in the catalog"""
+
+    path: Path
+    """Absolute path of the dump"""
+
+    size: int
+    """Size of the dump in bytes"""
+
+    created: str
+    """When the dump was created, as an ISO 8601 timestamp"""
+
+    hostname: str
+    """Host name of the instance that created the dump"""
+
+
+class Update(NamedTuple):
+    """What an update of the catalog did"""
+
+    read: list[Path]
+    """Dumps (re)read into the catalog"""
+
+    removed: list[Path]
+    """Dumps dropped from the catalog as they no longer exist"""
+
+    unreadable: list[Path]
+    """Files that looked like dumps but whose metadata couldn't be read"""
+
+
+class Catalog:
+    """Catalog of dumps, stored at the given path"""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def update(self, directory: Path) -> Update:
+        """Bring the catalog's entries for the dumps in the given directory up to date
+
+        Dumps ("*.tar" files) are looked for in the directory and its subdirectories.
+        """
+        directory = directory.absolute()
+        result = Update([], [], [])
+        known = {
+            Path(path): (size, mtime)
+            for path, size, mtime in self.connection.execute(
+                "SELECT path, size, mtime FROM archives"
+            )
+            if Path(path).is_relative_to(directory)
+        }
+
+        for path in sorted(directory.rglob(PATTERN)):
+            if not path.is_file():
+                continue
+
+            stat_result = path.stat()
+            key = (stat_result.st_size, stat_result.st_mtime_ns)
+
+            if known.pop(path, None) == key:
+                continue
+
+            self.remove(path)
+            if self.add(path, stat_result):
+                result.read.append(path)
+            else:
+                result.unreadable.append(path)
+
+        for path in known:
+            self.remove(path)
+            result.removed.append(path)
+
+        self.connection.commit()
+
+        return result
+
+    def add(self, path: Path, stat_result: os.stat_result) -> bool:
+        """Add the given dump to the catalog
+
+        Return False, and don't add it, if the dump's metadata can't be read.
+        """
+        try:
+            with open(path, "rb") as fp:
+                metadata = read_metadata(fp)
+            timestamp = dt.datetime.fromisoformat(metadata["created"]).timestamp()
+        except (tar.ReadError, json.JSONDecodeError, KeyError, ValueError):
+            return False
+
+        self.connection.execute(
+            "INSERT INTO archives VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                str(path),
+                stat_result.st_size,
+                stat_result.st_mtime_ns,
+                metadata["created"],
+                timestamp,
+                metadata["hostname"],
+            ),
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO builds VALUES (?, ?, ?)",
+            (
+                (str(path), build, Build.from_id(build).machine)
+                for build in metadata["manifest"]
+            ),
+        )
+
+        return True
+
+    def remove(self, path: Path) -> None:
+        """Remove the given dump, and its builds, from the catalog"""
+        self.connection.execute("DELETE FROM archives WHERE path = ?", (str(path),))
+
+    def find(self, spec: str) -> list[Archive]:
+        """Return the dumps with the builds given by spec, newest first
+
+        The spec is either a machine name, for dumps with any of the machine's builds,
+        or a build id ("machine.build_id").
+        """
+        rows = self.connection.execute(
+            """
+            SELECT DISTINCT archives.path, size, created, hostname, timestamp
+            FROM archives JOIN builds ON builds.path = archives.path
+            WHERE build = ? OR machine = ?
+            ORDER BY timestamp DESC, archives.path
+            """,
+            (spec, spec),
+        )
+
+        return [
+            Archive(Path(path), size, created, hostname)
+            for path, size, created, hostname, _ in rows
+        ]
+
+    def __len__(self) -> int:
+        row = self.connection.execute("SELECT COUNT(*) FROM archives").fetchone()
+
+        return int(row[0])
+
+    def close(self) -> None:
+        """Save the catalog and close it"""
+        self.connection.commit()
+        self.connection.close()
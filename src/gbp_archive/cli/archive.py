@@ -0,0 +1,425 @@
+"""Work with gbp dumps and the jobs that make them
+
+Dumps can be merged, filtered, split, consolidated and verified. Dumped builds can be
+found in the catalog. The digest cache can be pruned, and background jobs listed and
+cancelled.
+"""
+
+# gbpcli imports every subcommand module in order to build its parser. Heavy modules are
+# therefore imported inside the functions that need them.
+# pylint: disable=import-outside-toplevel
+
+from __future__ import annotations
+
+import argparse
+import sys
+import tarfile as tar
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, TYPE_CHECKING
+
+from gbpcli.gbp import GBP
+from gbpcli.types import Console
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gbp_archive.catalog import Archive
+    from gbp_archive.types import Job
+
+HELP = """Merge, filter, split, consolidate, verify and catalog dumps and manage jobs.
+
+merge, filter, split and consolidate work on the dump files alone. Builds are not
+restored to (nor dumped from) the GBP instance.
+
+    merge:  combine dumps into one. Builds in more than one dump are taken from the
+            first
+    filter: copy only the given builds. These are machine names (for example
+            "lighthouse") and/or build ids (for example "lighthouse.12345")
+    split:  split a dump into a dump per machine
+    consolidate:
+            merge a chain of dumps, a full dump and its incrementals (see
+            `gbp dump --newer`), into a new full dump. Builds purged from the
+            instance are dropped. Old links of the chain can then be removed
+    verify: check the instance's storage against the digests recorded in a dump (see
+            `gbp dump --checksums`)
+    prune-digests:
+            remove the entries of deleted, or changed, files from the cache of file
+            digests
+    catalog:
+            update the catalog of the dumps in a directory. Only new and changed dumps
+            are read, and only their metadata
+    find:   print the newest dump in the catalog with the given builds
+    jobs:   show the state of the jobs submitted by `gbp dump --background` and
+            `gbp restore --background`
+    cancel: cancel the given jobs
+"""
+
+
+def handler(args: argparse.Namespace, _gbp: GBP, console: Console) -> int:
+    """Merge, filter, split, consolidate, verify and catalog dumps and manage jobs"""
+    from gbp_archive import rewrite
+
+    actions = {
+        "consolidate": consolidate,
+        "verify": check_digests,
+        "prune-digests": check_digests,
+        "catalog": use_catalog,
+        "find": use_catalog,
+        "jobs": manage_jobs,
+        "cancel": manage_jobs,
+    }
+
+    if (action := actions.get(args.action)) is not None:
+        return action(args, console)
+
+    try:
+        with ExitStack() as stack:
+            if args.action == "split":
+                infile = input_file(stack, args.file)
+                for path in rewrite.split(infile, Path(args.directory)):
+                    console.out.print(str(path), highlight=False)
+                return 0
+
+            outfile = output_file(stack, args.output)
+
+            if args.action == "merge":
+                infiles = [input_file(stack, filename) for filename in args.files]
+                rewrite.merge(infiles, outfile)
+            else:
+                infile = input_file(stack, args.file)
+                select = rewrite.select_builds(args.builds)
+                rewrite.copy([infile], outfile, select=select)
+    except tar.ReadError as error:
+        console.err.print(f"{error}.")
+        return 1
+
+    return 0
+
+
+def consolidate(args: argparse.Namespace, console: Console) -> int:
+    """Consolidate a chain of dumps and then apply the retention policy to it
+
+    Return the exit status.
+    """
+    from gbp_archive import rewrite
+
+    output = Path(args.output)
+    chain = [Path(filename) for filename in args.files]
+
+    if any(path.resolve() == output.resolve() for path in chain):
+        console.err.print("The output can't be one of the dumps consolidated.")
+        return 1
+
+    select = rewrite.select_all if args.keep_purged else rewrite.select_existing
+
+    try:
+        chain = rewrite.chain_order(chain)
+        with ExitStack() as stack:
+            infiles = [stack.enter_context(path.open("rb")) for path in chain]
+            outfile = stack.enter_context(output.open("wb"))
+            rewrite.consolidate(infiles, outfile, select=select)
+    except tar.ReadError as error:
+        output.unlink(missing_ok=True)
+        console.err.print(f"{error}.")
+        return 1
+
+    if args.keep is not None:
+        for path in rewrite.expire(chain, args.keep):
+            console.out.print(f"removed {path}", highlight=False)
+
+    return 0
+
+
+def check_digests(args: argparse.Namespace, console: Console) -> int:
+    """Verify the instance's storage against a dump, or prune the digest cache
+
+    Return the exit status. Verifying fails if any of the dump's files is modified or
+    missing in the instance, or if the dump has no digests.
+    """
+    from gentoo_build_publisher import publisher
+
+    from gbp_archive import core
+    from gbp_archive.digests import DigestCache
+
+    checked = failed = 0
+
+    try:
+        with ExitStack() as stack:
+            digests = stack.enter_context(DigestCache(publisher.storage.root))
+
+            if args.action == "prune-digests":
+                removed = digests.prune()
+                console.out.print(f"removed {removed} stale digests", highlight=False)
+                return 0
+
+            infile = input_file(stack, args.file)
+            for name, status in core.verify_storage(infile, digests):
+                checked += 1
+                if status != "ok":
+                    failed += 1
+                    console.out.print(f"{status} {name}", highlight=False)
+    except tar.ReadError as error:
+        console.err.print(f"{error}.")
+        return 1
+
+    if not checked:
+        console.err.print("The dump has no digests. See `gbp dump --checksums`.")
+        return 1
+
+    console.out.print(f"{checked} files checked, {failed} failed", highlight=False)
+
+    return 1 if failed else 0
+
+
+def use_catalog(args: argparse.Namespace, console: Console) -> int:
+    """Update the catalog of dumps, or find builds in it
+
+    Return the exit status. Finding fails if no dump in the catalog has the builds.
+    """
+    from gentoo_build_publisher import publisher
+
+    from gbp_archive.catalog import CATALOG_PATH, Catalog
+
+    with Catalog(publisher.storage.root / CATALOG_PATH) as catalog:
+        if args.action == "catalog":
+            update = catalog.update(Path(args.directory))
+            for path in update.unreadable:
+                console.err.print(f"{path} is not a dump.", highlight=False)
+            console.out.print(
+                f"{len(update.read)} read, {len(update.removed)} removed,"
+                f" {len(catalog)} in the catalog",
+                highlight=False,
+            )
+            return 0
+
+        archives = catalog.find(args.build)
+
+    if not archives:
+        console.err.print(f"{args.build} not found in the catalog.")
+        return 1
+
+    if args.all:
+        print_archives(archives, console)
+    else:
+        console.out.print(str(archives[0].path), highlight=False)
+
+    return 0
+
+
+def print_archives(archives: list[Archive], console: Console) -> None:
+    """Print a table of the given cataloged dumps to Console.out"""
+    from rich import box
+    from rich.table import Table
+
+    from gbp_archive.utils import format_size
+
+    table = Table(box=box.ROUNDED, title_style="header", style="box")
+    table.add_column("Created")
+    table.add_column("Host")
+    table.add_column("Size", justify="right")
+    table.add_column("Path")
+
+    for archive in archives:
+        table.add_row(
+            archive.created,
+            archive.hostname,
+            format_size(archive.size),
+            str(archive.path),
+        )
+
+    console.out.print(table)
+
+
+def manage_jobs(args: argparse.Namespace, console: Console) -> int:
+    """Show, or cancel, background jobs
+
+    Return the exit status.
+    """
+    from gbp_archive import jobs
+
+    try:
+        if args.action == "cancel":
+            selected = [jobs.cancel(job_id) for job_id in args.jobs]
+        elif args.jobs:
+            selected = [jobs.get(job_id) for job_id in args.jobs]
+        else:
+            selected = jobs.list_jobs()
+    except jobs.JobNotFoundError as error:
+        console.err.print(f"Job {error.args[0]} not found.")
+        return 1
+
+    print_jobs(selected, console)
+
+    return 0
+
+
+def print_jobs(job_list: list[Job], console: Console) -> None:
+    """Print a table of the given jobs to Console.out"""
+    from rich import box
+    from rich.table import Table
+
+    table = Table(box=box.ROUNDED, title_style="header", style="box")
+    table.add_column("Job")
+    table.add_column("Type")
+    table.add_column("State")
+    table.add_column("Progress", justify="right")
+    table.add_column("Path")
+    table.add_column("Info")
+
+    for job in job_list:
+        progress = f"{job['progress']}/{job['total']}" if job["total"] else "-"
+        table.add_row(
+            job["id"],
+            job["type"],
+            job["state"],
+            progress,
+            job["path"],
+            job.get("error", job["current"]),
+        )
+
+    console.out.print(table)
+
+
+def input_file(stack: ExitStack, filename: str) -> IO[bytes]:
+    """Open the given file for reading ("-" for standard in)"""
+    if filename == "-":
+        return sys.stdin.buffer
+
+    return stack.enter_context(open(filename, "rb"))
+
+
+def output_file(stack: ExitStack, filename: str) -> IO[bytes]:
+    """Open the given file for writing ("-" for standard out)"""
+    if filename == "-":
+        return sys.stdout.buffer
+
+    return stack.enter_context(open(filename, "wb"))
+
+
+def parse_args(parser: argparse.ArgumentParser) -> None:
+    """Set subcommand arguments"""
+    subparsers = parser.add_subparsers(dest="action", required=True)
+
+    merge = subparsers.add_parser("merge", help="Merge dumps into one")
+    merge.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help='Filename to write the merged dump to ("-" for standard out)',
+    )
+    merge.add_argument("files", nargs="+", metavar="FILE", help="Dumps to merge")
+
+    filter_ = subparsers.add_parser("filter", help="Copy only the given builds")
+    filter_.add_argument(
+        "-f",
+        "--file",
+        default="-",
+        help='Filename to read the dump from ("-" for standard in)',
+    )
+    filter_.add_argument(
+        "-o",
+        "--output",
+        default="-",
+        help='Filename to write the filtered dump to ("-" for standard out)',
+    )
+    filter_.add_argument(
+        "builds", nargs="+", metavar="BUILD", help="Machines and/or builds to copy"
+    )
+
+    split = subparsers.add_parser("split", help="Split a dump into one per machine")
+    split.add_argument(
+        "-f",
+        "--file",
+        default="-",
+        help='Filename to read the dump from ("-" for standard in)',
+    )
+    split.add_argument(
+        "-d",
+        "--directory",
+        default=".",
+        help="Directory to write the dumps to (default: current directory)",
+    )
+
+    consolidate_ = subparsers.add_parser(
+        "consolidate", help="Consolidate a dump and its incrementals into a full dump"
+    )
+    consolidate_.add_argument(
+        "-o", "--output", required=True, help="Filename to write the full dump to"
+    )
+    consolidate_.add_argument(
+        "--keep",
+        type=non_negative_int,
+        default=None,
+        metavar="N",
+        help=(
+            "After consolidating, remove all but the N most recently created of the"
+            " given dumps (default: remove none)"
+        ),
+    )
+    consolidate_.add_argument(
+        "--keep-purged",
+        action="store_true",
+        default=False,
+        help="Keep builds that no longer exist in the instance",
+    )
+    consolidate_.add_argument(
+        "files",
+        nargs="+",
+        metavar="FILE",
+        help="The full dump and its incrementals, in any order",
+    )
+
+    verify = subparsers.add_parser(
+        "verify", help="Check the instance's storage against a dump's digests"
+    )
+    verify.add_argument(
+        "-f",
+        "--file",
+        default="-",
+        help='Filename to read the dump from ("-" for standard in)',
+    )
+
+    subparsers.add_parser(
+        "prune-digests", help="Remove stale entries from the cache of file digests"
+    )
+
+    catalog = subparsers.add_parser(
+        "catalog", help="Update the catalog of the dumps in a directory"
+    )
+    catalog.add_argument(
+        "directory", help="Directory of dumps, including its subdirectories"
+    )
+
+    find = subparsers.add_parser(
+        "find", help="Print the newest dump in the catalog with the given builds"
+    )
+    find.add_argument(
+        "-a",
+        "--all",
+        action="store_true",
+        default=False,
+        help="Show all the dumps with the builds, newest first",
+    )
+    find.add_argument(
+        "build", help='Machine (for example "lighthouse") or build id to find'
+    )
+
+    jobs = subparsers.add_parser("jobs", help="Show background jobs")
+    jobs.add_argument(
+        "jobs", nargs="*", metavar="JOB", help="Jobs to show (default: all)"
+    )
+
+    cancel = subparsers.add_parser("cancel", help="Cancel background jobs")
+    cancel.add_argument("jobs", nargs="+", metavar="JOB", help="Jobs to cancel")
+
+
+def non_negative_int(value: str) -> int:
+    """Parse the given non-negative integer"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid integer: {value!r}") from None
+
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative: {value!r}")
+
+    return number
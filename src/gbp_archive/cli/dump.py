@@ -1,19 +1,32 @@
 """Dump builds to a file"""
 
+# gbpcli imports every subcommand module in order to build its parser. Heavy modules are
+# therefore imported inside the functions that need them.
+# pylint: disable=import-outside-toplevel
+
+from __future__ import annotations
+
 import argparse
+import datetime as dt
 import sys
-from typing import Iterable
+from typing import IO, TYPE_CHECKING, Any, Iterable
 
-import dateparser  # type: ignore
 from gbpcli.gbp import GBP
 from gbpcli.types import Console
 from gbpcli.utils import EPOCH
-from gentoo_build_publisher import publisher
-from gentoo_build_publisher.records import BuildRecord
-from gentoo_build_publisher.types import TAG_SYM, Build
 
-import gbp_archive.core as archive
-from gbp_archive.types import DumpPhase, DumpType
+from gbp_archive.cli.utils import (
+    add_content_args,
+    contents_from_args,
+    parse_rate,
+    parse_size,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gentoo_build_publisher.records import BuildRecord
+    from gentoo_build_publisher.types import Build, Content
+
+    from gbp_archive.types import DumpOptions, DumpPhase, DumpType
 
 HELP = """Dump builds to a file.
 
@@ -23,7 +36,11 @@ The machines argument(s) take the following forms
     - machine@tag (for example "lighthouse@stable" or "lighthouse@")
     - any combination of the above
 
-If no machines arguments are given, all builds from all machines are dumped.
+If no machines arguments are given, all builds from all machines are dumped. For large
+batches, the machines arguments can instead be read from a file (see --from-file).
+
+With --directory, the dump is written as a dump file per machine and a checkpoint of
+the machines finished. Should the dump fail, it can be continued with --resume.
 """
 
 
@@ -33,33 +50,203 @@ class BuildSpecLookupError(LookupError):
 
 def handler(args: argparse.Namespace, _gbp: GBP, console: Console) -> int:
     """Dump builds to a file"""
+    if (contents := contents_from_args(args, console)) is None:
+        return 1
+
     try:
-        builds = builds_to_dump(args.machines)
+        builds = builds_to_dump(buildspecs_from_args(args))
     except BuildSpecLookupError as error:
         console.err.print(f"{error.args[0]} not found.")
         return 1
+    except (OSError, ValueError) as error:
+        console.err.print(f"{error}.")
+        return 1
 
     builds = {build for build in builds if build.completed > args.newer}
 
+    if args.resume and not args.directory:
+        console.err.print("--resume requires --directory.")
+        return 1
+
     if args.list:
-        print_builds(builds, console)
+        print_builds(builds, console, contents=contents)
         return 0
 
+    return dump(builds, args, console, contents=contents)
+
+
+def dump(
+    builds: Iterable[Build],
+    args: argparse.Namespace,
+    console: Console,
+    *,
+    contents: tuple[Content, ...],
+) -> int:
+    """Dump the builds of the given Content types as the arguments say
+
+    Return the exit status.
+    """
+    from gbp_archive.throttle import TokenBucket, set_idle_io_priority
+    from gbp_archive.types import DumpOptions
+
     def verbose_callback(_type: DumpType, phase: DumpPhase, build: Build) -> None:
         console.err.print(f"dumping {phase} for {build}", highlight=False)
 
     filename = args.file
-    is_stdout = filename == "-"
-    kwargs = {"callback": verbose_callback} if args.verbose else {}
+    kwargs: dict[str, Any] = {"callback": verbose_callback} if args.verbose else {}
+    limiter = TokenBucket(args.max_rate) if args.max_rate else None
+    kwargs["options"] = DumpOptions(
+        contents=contents,
+        limiter=limiter,
+        reproducible=args.reproducible,
+        checksums=args.checksums,
+        compress=args.compress,
+        delta=args.delta,
+        cache_size=args.cache,
+    )
+
+    if args.background:
+        return submit(builds, filename, console, options=kwargs["options"])
+
+    if args.idle:
+        try:
+            set_idle_io_priority()
+        except OSError as error:
+            console.err.print(f"Could not set idle I/O priority: {error}")
+
+    if args.sync:
+        return sync(args.sync, builds, console, **kwargs)
+
+    if args.directory:
+        return write_segments(
+            builds, args.directory, console, resume=args.resume, **kwargs
+        )
+
+    return write(builds, filename, console, **kwargs)
+
+
+def write(
+    builds: Iterable[Build], filename: str, console: Console, **kwargs: Any
+) -> int:
+    """Dump the builds to the given file, or URL, or ("-") standard out
+
+    Return the exit status.
+    """
+    import gbp_archive.core as archive
+    from gbp_archive.remote import RemoteError, open_archive
+
+    if filename == "-":
+        archive.dump(builds, sys.stdout.buffer, **kwargs)
+        return 0
 
     try:
-        # I'm using try/finally. Leave me alone pylint!
-        # pylint: disable=consider-using-with
-        fp = sys.stdout.buffer if is_stdout else open(filename, "wb")
-        archive.dump(builds, fp, **kwargs)
-    finally:
-        if not is_stdout:
-            fp.close()
+        with open_archive(filename, "wb") as fp:
+            archive.dump(builds, fp, **kwargs)
+    except RemoteError as error:
+        console.err.print(f"{error}.")
+        return 1
+
+    return 0
+
+
+def write_segments(
+    builds: Iterable[Build],
+    directory: str,
+    console: Console,
+    *,
+    resume: bool = False,
+    **kwargs: Any,
+) -> int:
+    """Dump the builds to a dump file per machine in the given directory
+
+    Return the exit status.
+    """
+    from pathlib import Path
+
+    from gbp_archive import segments
+
+    try:
+        segments.dump(builds, Path(directory), resume=resume, **kwargs)
+    except OSError as error:
+        console.err.print(f"{error}. Continue the dump with --resume.")
+        return 1
+
+    return 0
+
+
+def submit(
+    builds: Iterable[Build], filename: str, console: Console, *, options: DumpOptions
+) -> int:
+    """Submit a background job to dump the builds to the given file
+
+    The job's id is printed. Return the exit status.
+    """
+    from gbp_archive import jobs
+
+    if filename == "-":
+        console.err.print("--background requires --file.")
+        return 1
+
+    job = jobs.submit_dump(builds, filename, options=options)
+    console.out.print(job["id"])
+
+    return 0
+
+
+def buildspecs_from_args(args: argparse.Namespace) -> list[str]:
+    """Return the buildspecs given on the command line and/or in the --from-file file
+
+    Raise ValueError if a --from-file file was given but there are no buildspecs, as
+    that would otherwise mean dumping every build.
+    """
+    buildspecs = list(args.machines)
+
+    if not args.from_file:
+        return buildspecs
+
+    if args.from_file == "-":
+        buildspecs.extend(read_buildspecs(sys.stdin))
+    else:
+        with open(args.from_file, encoding="utf8") as fp:
+            buildspecs.extend(read_buildspecs(fp))
+
+    if not buildspecs:
+        raise ValueError(f"No buildspecs in {args.from_file}")
+
+    return buildspecs
+
+
+def sync(command: str, builds: Iterable[Build], console: Console, **kwargs: Any) -> int:
+    """Send the builds that the receiver lacks to the given (receiver) command
+
+    Return the exit status.
+    """
+    import contextlib
+    import shlex
+    import subprocess
+
+    from gbp_archive.sync import ProtocolError, send
+
+    with subprocess.Popen(
+        shlex.split(command), stdin=subprocess.PIPE, stdout=subprocess.PIPE
+    ) as proc:
+        assert proc.stdin is not None and proc.stdout is not None
+
+        try:
+            send(builds, proc.stdout, proc.stdin, **kwargs)
+        except ProtocolError as error:
+            console.err.print(f"{error}.")
+            return 1
+        except BrokenPipeError:
+            # The receiver went away. Its exit status will tell us why
+            pass
+        finally:
+            with contextlib.suppress(BrokenPipeError):
+                proc.stdin.close()
+
+    if proc.returncode:
+        console.err.print(f"Sync command failed with exit status {proc.returncode}.")
+        return 1
 
     return 0
 
@@ -70,7 +257,7 @@ def parse_args(parser: argparse.ArgumentParser) -> None:
         "-N",
         "--newer",
         "--after-date",
-        type=lambda s: dateparser.parse(s).astimezone(),
+        type=parse_date,
         default=EPOCH,
         help="Only dump builds newer than this date(time)",
     )
@@ -81,49 +268,222 @@ def parse_args(parser: argparse.ArgumentParser) -> None:
         default=False,
         help="verbose mode: list builds dumped",
     )
+    add_content_args(parser, "dump")
+    parser.add_argument(
+        "--max-rate",
+        type=parse_rate,
+        default=None,
+        metavar="RATE",
+        help=(
+            "Limit the dump's storage reads and archive writes, together, to RATE"
+            " bytes per second. RATE may have a K, M or G suffix"
+        ),
+    )
+    parser.add_argument(
+        "--idle",
+        action="store_true",
+        default=False,
+        help="Run the dump at idle I/O priority",
+    )
+    parser.add_argument(
+        "--reproducible",
+        action="store_true",
+        default=False,
+        help=(
+            "Create a reproducible dump: unchanged builds produce the same bytes from"
+            " dump to dump, which suits deduplicating backup tools"
+        ),
+    )
+    parser.add_argument(
+        "--checksums",
+        action="store_true",
+        default=False,
+        help=(
+            "Record the digest of each file in the dump, for `gbp archive verify`."
+            " Digests are cached so that only new files are read to compute them"
+        ),
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        default=False,
+        help=(
+            "Compress the files of the builds' storage that are worth it. Already"
+            " compressed files, like binpkgs, are stored as is"
+        ),
+    )
+    parser.add_argument(
+        "--delta",
+        action="store_true",
+        default=False,
+        help=(
+            "Store the files that have changed since a machine's previous build as"
+            " deltas against that build's"
+        ),
+    )
+    parser.add_argument(
+        "--cache",
+        type=parse_size,
+        default=None,
+        metavar="SIZE",
+        help=(
+            "Keep each build's part of the dump in a cache, under the storage root, of"
+            " at most SIZE bytes (K, M and G suffixes are accepted) and reuse it in"
+            " later dumps with this option"
+        ),
+    )
+    parser.add_argument(
+        "--background",
+        action="store_true",
+        default=False,
+        help=(
+            "Submit the dump as a background job to GBP's worker and print the job's"
+            " id. Requires --file, which must be writable by the worker. See"
+            " `gbp archive jobs`"
+        ),
+    )
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "-t",
         "--list",
         action="store_true",
         default=False,
-        help="Don't create dump, but display what builds would be dumped",
+        help=(
+            "Don't create dump, but display what builds would be dumped along with the"
+            " estimated size of the dump"
+        ),
     )
     group.add_argument(
         "-f",
         "--file",
         default="-",
-        help='Filename to dump builds to ("-" for standard out)',
+        help=(
+            'Filename to dump builds to ("-" for standard out). This may also be the'
+            " URL of an object in an S3-compatible store, which is uploaded in parts"
+        ),
+    )
+    group.add_argument(
+        "-d",
+        "--directory",
+        default=None,
+        help=(
+            "Dump builds to a dump file per machine in DIRECTORY. The machines"
+            " finished are checkpointed so that a failed dump can be resumed"
+        ),
+    )
+    group.add_argument(
+        "--sync",
+        metavar="COMMAND",
+        default=None,
+        help=(
+            "Sync builds to the receiver started by COMMAND (for example"
+            ' "ssh standby gbp restore --sync"), dumping only the builds it lacks'
+        ),
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help=(
+            "Continue the --directory dump from its checkpoint, dumping only the"
+            " machines not yet finished, or whose builds have since changed"
+        ),
+    )
+    parser.add_argument(
+        "--from-file",
+        metavar="FILE",
+        default=None,
+        help=(
+            'Also dump the machines given in FILE ("-" for standard in), separated by'
+            ' whitespace. Text after a "#" is ignored'
+        ),
     )
     parser.add_argument("machines", nargs="*", help="machine(s) to dump")
 
 
-def print_builds(builds: Iterable[BuildRecord], console: Console) -> None:
-    """Print the given builds to Console.out"""
-    for build in builds:
-        console.out.print(str(build))
+def parse_date(value: str) -> dt.datetime:
+    """Parse the given (natural language) date string into an aware datetime"""
+    import dateparser  # type: ignore
+
+    date: dt.datetime = dateparser.parse(value)
+
+    return date.astimezone()
+
+
+def print_builds(
+    builds: Iterable[BuildRecord],
+    console: Console,
+    *,
+    contents: Iterable[Content] | None = None,
+) -> None:
+    """Print the given builds, and their estimated archive sizes, to Console.out"""
+    from gbp_archive.summary import estimate
+    from gbp_archive.utils import format_size
+
+    result = (
+        estimate(builds) if contents is None else estimate(builds, contents=contents)
+    )
+    width = max((len(build) for build in result["builds"]), default=0)
+
+    for build, size in result["builds"].items():
+        console.out.print(f"{build:{width}}  {format_size(size):>10}", highlight=False)
+
+    console.out.print(f"Estimated size: {format_size(result['size'])}", highlight=False)
 
 
 def builds_to_dump(buildspecs: list[str]) -> set[BuildRecord]:
-    """Return the set of builds to be dumped according to the given buildspecs"""
+    """Return the set of builds to be dumped according to the given buildspecs
+
+    If no buildspecs are given, all builds are dumped. Otherwise only the records of
+    the machines that the buildspecs mention are loaded.
+    """
+    from gentoo_build_publisher import publisher
+
     records = publisher.repo.build_records
-    all_builds = {
-        build
-        for machine in records.list_machines()
-        for build in records.for_machine(machine)
-    }
+
     if not buildspecs:
-        return all_builds
+        return {
+            build
+            for machine in records.list_machines()
+            for build in records.for_machine(machine)
+        }
 
+    index = BuildIndex()
     to_backup: set[BuildRecord] = set()
 
     for buildspec in buildspecs:
-        to_backup.update(builds_from_spec(buildspec, all_builds))
+        to_backup.update(builds_from_spec(buildspec, index))
 
     return to_backup
 
 
-def builds_from_spec(buildspec: str, builds: set[BuildRecord]) -> set[BuildRecord]:
+class BuildIndex:
+    """Index of the BuildRecords by machine and build_id
+
+    A machine's records are loaded the first time that the machine is looked up.
+    """
+
+    def __init__(self) -> None:
+        self.machines: dict[str, dict[str, BuildRecord]] = {}
+
+    def builds(self, machine: str) -> dict[str, BuildRecord]:
+        """Return the given machine's records keyed by build_id"""
+        from gentoo_build_publisher import publisher
+
+        if (builds := self.machines.get(machine)) is None:
+            records = publisher.repo.build_records.for_machine(machine)
+            builds = self.machines[machine] = {
+                record.build_id: record for record in records
+            }
+
+        return builds
+
+    def get(self, machine: str, build_id: str) -> BuildRecord | None:
+        """Return the record of the given build if there is one"""
+        return self.builds(machine).get(build_id)
+
+
+def builds_from_spec(buildspec: str, index: BuildIndex) -> set[BuildRecord]:
     """Return the set of BuildRecords matching the given buildspec
 
     buildspec can be:
@@ -135,26 +495,38 @@ def builds_from_spec(buildspec: str, builds: set[BuildRecord]) -> set[BuildRecor
     If the given machine or build doesn't exist in the build records,
     BuildSpecLookupError is raised.
     """
-    subset: set[BuildRecord]
+    from gentoo_build_publisher import publisher
+    from gentoo_build_publisher.types import TAG_SYM
+
+    subset: set[BuildRecord] = set()
     machine, _, build_id = buildspec.partition(".")
 
     if build_id:
-        subset = {b for b in builds if b.machine == machine and b.build_id == build_id}
+        if (record := index.get(machine, build_id)) is not None:
+            subset.add(record)
     else:
         machine, tag_sym, _ = buildspec.partition(TAG_SYM)
         if tag_sym:
-            storage = publisher.storage
-            records = publisher.repo.build_records
             try:
-                subset = {records.get(storage.resolve_tag(buildspec))}
+                build = publisher.storage.resolve_tag(buildspec)
             except FileNotFoundError:
-                subset = set()
+                pass
+            else:
+                if (record := index.get(build.machine, build.build_id)) is not None:
+                    subset.add(record)
         else:
-            subset = {build for build in builds if build.machine == machine}
-
-    subset = subset & builds
+            subset.update(index.builds(machine).values())
 
     if not subset:
         raise BuildSpecLookupError(buildspec)
 
     return subset
+
+
+def read_buildspecs(fp: IO[str]) -> list[str]:
+    """Return the buildspecs in the given file
+
+    Buildspecs are separated by whitespace. Blank lines and everything after a "#" are
+    ignored.
+    """
+    return [buildspec for line in fp for buildspec in line.partition("#")[0].split()]
@@ -1,35 +1,85 @@
 """Restore a gbp dump"""
 
+# gbpcli imports every subcommand module in order to build its parser. Heavy modules are
+# therefore imported inside the functions that need them.
+# pylint: disable=import-outside-toplevel
+
+from __future__ import annotations
+
 import argparse
 import sys
-from typing import IO
+from typing import IO, TYPE_CHECKING, Any
 
 from gbpcli.gbp import GBP
 from gbpcli.types import Console
-from gentoo_build_publisher.types import Build
 
-import gbp_archive.core as archive
-from gbp_archive.types import DumpPhase, DumpType
+from gbp_archive.cli.utils import add_content_args, contents_from_args
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gentoo_build_publisher.types import Build
+
+    from gbp_archive.types import DumpPhase, DumpType, RestoreOptions
 
 HELP = "Restore a gbp dump"
 
 
 def handler(args: argparse.Namespace, _gbp: GBP, console: Console) -> int:
     """Restore a gbp dump"""
+    from gbp_archive.remote import RemoteError
+    from gbp_archive.storage import InsufficientSpaceError
+    from gbp_archive.types import RestoreOptions
+
+    if (contents := contents_from_args(args, console)) is None:
+        return 1
 
     def verbose_callback(_type: DumpType, phase: DumpPhase, build: Build) -> None:
         console.err.print(f"restoring {phase} for {build}", highlight=False)
 
+    kwargs: dict[str, Any] = {"callback": verbose_callback} if args.verbose else {}
+    kwargs["options"] = RestoreOptions(
+        contents=contents,
+        staged=args.staged,
+        preflight=not args.skip_preflight,
+        priority=args.priority,
+    )
+
+    if args.background:
+        return submit(args.file, console, options=kwargs["options"])
+
+    try:
+        return restore(args, console, **kwargs)
+    except InsufficientSpaceError as error:
+        console.err.print(f"{error}. Use --skip-preflight to restore anyway.")
+        return 1
+    except RemoteError as error:
+        console.err.print(f"{error}.")
+        return 1
+
+
+def restore(args: argparse.Namespace, console: Console, **kwargs: Any) -> int:
+    """Restore (or list or inspect) the builds of the dump given by the args
+
+    Return the exit status.
+    """
+    import gbp_archive.core as archive
+    from gbp_archive.remote import open_archive
+
+    if args.sync:
+        from gbp_archive.sync import receive
+
+        receive(sys.stdin.buffer, sys.stdout.buffer, **kwargs)
+        return 0
+
     filename = args.file
     is_stdin = filename == "-"
-    kwargs = {"callback": verbose_callback} if args.verbose else {}
+
+    fp = sys.stdin.buffer if is_stdin else open_archive(filename, "rb")
 
     try:
-        # I'm using try/finally. Leave me alone pylint!
-        # pylint: disable=consider-using-with
-        fp = sys.stdin.buffer if is_stdin else open(filename, "rb")
         if args.list:
             print_builds(fp, console)
+        elif args.inspect:
+            return print_summary(fp, console)
         else:
             archive.restore(fp, **kwargs)
     finally:
@@ -39,12 +89,72 @@ def handler(args: argparse.Namespace, _gbp: GBP, console: Console) -> int:
     return 0
 
 
+def submit(filename: str, console: Console, *, options: RestoreOptions) -> int:
+    """Submit a background job to restore builds from the given file
+
+    The job's id is printed. Return the exit status.
+    """
+    from gbp_archive import jobs
+
+    if filename == "-":
+        console.err.print("--background requires --file.")
+        return 1
+
+    job = jobs.submit_restore(filename, options=options)
+    console.out.print(job["id"])
+
+    return 0
+
+
 def print_builds(fp: IO[bytes], console: Console) -> None:
     "Print the list of builds in the fp archive to stdout" ""
+    import gbp_archive.core as archive
+
     for build in archive.tabulate(fp):
         console.out.print(str(build))
 
 
+def print_summary(fp: IO[bytes], console: Console) -> int:
+    """Print the storage summary of the builds in the fp archive to stdout
+
+    Return the exit status.
+    """
+    from rich import box
+    from rich.table import Table
+
+    import gbp_archive.core as archive
+    from gbp_archive.utils import format_size
+
+    try:
+        summary = archive.inspect(fp)
+    except LookupError as error:
+        console.err.print(f"{error.args[0]}.")
+        return 1
+
+    table = Table(box=box.ROUNDED, title_style="header", style="box")
+    table.add_column("Build")
+    table.add_column("Size", justify="right")
+    table.add_column("Files", justify="right")
+    table.add_column("Binpkgs", justify="right")
+
+    for build, build_summary in summary["builds"].items():
+        table.add_row(
+            build,
+            format_size(build_summary["size"]),
+            str(build_summary["files"]),
+            str(build_summary["binpkgs"]),
+        )
+
+    console.out.print(table)
+    console.out.print(
+        f"Total (after hard-link dedupe): {format_size(summary['size'])},"
+        f" {summary['files']} files, {summary['inodes']} inodes",
+        highlight=False,
+    )
+
+    return 0
+
+
 # pylint: disable=R0801
 def parse_args(parser: argparse.ArgumentParser) -> None:
     """Set subcommand arguments"""
@@ -55,16 +165,76 @@ def parse_args(parser: argparse.ArgumentParser) -> None:
         default=False,
         help="verbose mode: list builds restored",
     )
+    add_content_args(parser, "restore")
+    parser.add_argument(
+        "--staged",
+        action="store_true",
+        default=False,
+        help=(
+            "Restore each build into a staging area and move it into place once it is"
+            " complete, so that half-restored builds are never served"
+        ),
+    )
+    parser.add_argument(
+        "--priority",
+        action="store_true",
+        default=False,
+        help=(
+            "Restore the published and tagged builds first, then the rest from newest"
+            " to oldest, each made available as soon as it is restored. Implies"
+            " --staged"
+        ),
+    )
     parser.add_argument(
+        "--skip-preflight",
+        action="store_true",
+        default=False,
+        help=(
+            "Don't check, before restoring, that the storage has the space and inodes"
+            " for the dump's builds"
+        ),
+    )
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--background",
+        action="store_true",
+        default=False,
+        help=(
+            "Submit the restore as a background job to GBP's worker and print the"
+            " job's id. Requires --file, which must be readable by the worker. See"
+            " `gbp archive jobs`"
+        ),
+    )
+    group.add_argument(
         "-t",
         "--list",
         action="store_true",
         default=False,
         help="Don't restore dump, but display what builds would be restored",
     )
+    group.add_argument(
+        "-i",
+        "--inspect",
+        action="store_true",
+        default=False,
+        help="Don't restore dump, but display the sizes of the builds it contains",
+    )
+    group.add_argument(
+        "--sync",
+        action="store_true",
+        default=False,
+        help=(
+            "Receive builds from `gbp dump --sync`. The builds that we already have"
+            " are written to standard out and the rest are restored from standard in"
+        ),
+    )
     parser.add_argument(
         "-f",
         "--file",
         default="-",
-        help='Filename to restore builds from ("-" for standard in)',
+        help=(
+            'Filename to restore builds from ("-" for standard in). This may also be'
+            " an HTTP(S) URL, in which case only the parts of the dump needed are"
+            " downloaded"
+        ),
     )
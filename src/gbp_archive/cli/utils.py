@@ -0,0 +1,89 @@
+"""Utilities shared by the gbp-archive subcommands"""
+
+# As with the subcommand modules, heavy modules are imported inside the functions that
+# need them.
+# pylint: disable=import-outside-toplevel
+
+from __future__ import annotations
+
+import argparse
+from typing import TYPE_CHECKING
+
+from gbpcli.types import Console
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gentoo_build_publisher.types import Content
+
+CONTENT_NAMES = ("repos", "binpkgs", "etc-portage", "var-lib-portage", "aux")
+"""The values of GBP's Content types, for the help
+
+Importing gentoo_build_publisher.types would slow down every gbp invocation.
+"""
+
+
+def add_content_args(parser: argparse.ArgumentParser, verb: str) -> None:
+    """Add the Content type selection arguments to the given parser"""
+    names = ", ".join(CONTENT_NAMES)
+    parser.add_argument(
+        "--content",
+        action="append",
+        default=None,
+        metavar="CONTENT",
+        help=(
+            f"Only {verb} the given content type ({names})."
+            " May be given more than once"
+        ),
+    )
+    parser.add_argument(
+        "--exclude-content",
+        action="append",
+        default=[],
+        metavar="CONTENT",
+        help=f"Don't {verb} the given content type. May be given more than once",
+    )
+
+
+def contents_from_args(
+    args: argparse.Namespace, console: Console
+) -> tuple[Content, ...] | None:
+    """Return the Content types selected by the arguments of add_content_args()
+
+    If they name something that isn't a Content type, print the error and return None.
+    """
+    from gbp_archive.storage import select_contents
+
+    try:
+        return select_contents(args.content, args.exclude_content)
+    except ValueError as error:
+        console.err.print(f"{error}.")
+        return None
+
+
+def parse_rate(value: str) -> int:
+    """Parse the given rate (bytes per second) with optional K, M or G suffix"""
+    return parse_bytes(value, "rate")
+
+
+def parse_size(value: str) -> int:
+    """Parse the given size (bytes) with optional K, M or G suffix"""
+    return parse_bytes(value, "size")
+
+
+def parse_bytes(value: str, name: str) -> int:
+    """Parse the given positive number of bytes with optional K, M or G suffix
+
+    name is what the number is of, for error messages.
+    """
+    multipliers = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    multiplier = multipliers.get(value[-1:].upper(), 1)
+    number = value[:-1] if multiplier > 1 else value
+
+    try:
+        result = int(float(number) * multiplier)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid {name}: {value!r}") from None
+
+    if result <= 0:
+        raise argparse.ArgumentTypeError(f"{name} must be positive: {value!r}")
+
+    return result
@@ -0,0 +1,143 @@
+"""Per-file compression of dumped storage
+
+Compressing a whole dump spends most of its time on binpkgs, which are already
+compressed, for next to no gain. Instead files are compressed one by one, and only
+those that are worth it. Binpkgs, and other files whose names say they're compressed,
+are stored as is. So are small files. For the rest, a sample from the start of the file
+is compressed and the file is only compressed if the sample shrinks.
+
+A compressed file's codec and original size are recorded in its pax headers. The
+member's data, and size, are then those of the compressed file.
+"""
+
+import tarfile as tar
+import tempfile
+import zlib
+from pathlib import Path
+from typing import IO
+
+from gbp_archive.summary import BINPKG_SUFFIXES
+from gbp_archive.utils import BUFSIZE, tarfile_extract, tarfile_set_attrs
+
+HEADER = "GBP.compression"
+"""pax header of the codec of compressed files"""
+SIZE_HEADER = "GBP.size"
+"""pax header of the original size of compressed files"""
+CODEC = "zlib"
+LEVEL = 6
+
+COMPRESSED_SUFFIXES = (
+    *BINPKG_SUFFIXES,
+    ".bz2",
+    ".gz",
+    ".lz",
+    ".lz4",
+    ".lzma",
+    ".tgz",
+    ".xz",
+    ".zip",
+    ".zst",
+)
+MIN_SIZE = 4096
+SAMPLE_SIZE = 64 * 1024
+MAX_RATIO = 0.9
+"""Files are only compressed if their sample compresses to less than this ratio"""
+SPOOL_SIZE = 16 * 1024 * 1024
+
+
+def worthwhile(path: Path, size: int, fileobj: IO[bytes]) -> bool:
+    """Return True if the given file should be compressed
+
+    The file is sampled from the start and left at the start.
+    """
+    if size < MIN_SIZE or path.name.endswith(COMPRESSED_SUFFIXES):
+        return False
+
+    sample = fileobj.read(SAMPLE_SIZE)
+    fileobj.seek(0)
+
+    return len(zlib.compress(sample, 1)) < MAX_RATIO * len(sample)
+
+
+def compress(tarinfo: tar.TarInfo, fileobj: IO[bytes]) -> IO[bytes]:
+    """Return a temporary file of the given regular file's data, compressed
+
+    The tarinfo's size is changed to that of the compressed data and the compression is
+    recorded in its pax headers.
+    """
+    # pylint: disable=consider-using-with
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+    compressor = zlib.compressobj(LEVEL)
+
+    while chunk := fileobj.read(BUFSIZE):
+        spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+
+    tarinfo.pax_headers = {
+        **tarinfo.pax_headers,
+        HEADER: CODEC,
+        SIZE_HEADER: str(tarinfo.size),
+    }
+    tarinfo.size = spool.tell()
+    spool.seek(0)
+
+    return spool
+
+
+def is_compressed(tarinfo: tar.TarInfo) -> bool:
+    """Return True if the given member's data is compressed"""
+    return HEADER in tarinfo.pax_headers
+
+
+def file_size(tarinfo: tar.TarInfo) -> int:
+    """Return the size of the given member's file
+
+    If the member is compressed this is its original size, not that of its data.
+    """
+    return int(tarinfo.pax_headers.get(SIZE_HEADER, tarinfo.size))
+
+
+def decompress(tarinfo: tar.TarInfo, data: bytes) -> bytes:
+    """Return the given compressed member's data, decompressed
+
+    Raise ReadError if the member's codec isn't supported or its data is corrupt.
+    """
+    if (codec := tarinfo.pax_headers[HEADER]) != CODEC:
+        raise tar.ReadError(f"Unsupported compression for {tarinfo.name}: {codec}")
+
+    try:
+        decompressed = zlib.decompress(data)
+    except zlib.error as error:
+        raise tar.ReadError(f"Corrupt data for {tarinfo.name}: {error}") from None
+
+    if len(decompressed) != file_size(tarinfo):
+        raise tar.ReadError(f"Corrupt data for {tarinfo.name}")
+
+    return decompressed
+
+
+def extract(tarfile: tar.TarFile, tarinfo: tar.TarInfo) -> None:
+    """Extract the given compressed regular file from the tarfile
+
+    This is like TarFile.extract() except that the file is decompressed. Raise ReadError
+    if the file's codec isn't supported or its data is corrupt.
+    """
+    if (codec := tarinfo.pax_headers[HEADER]) != CODEC:
+        raise tar.ReadError(f"Unsupported compression for {tarinfo.name}: {codec}")
+
+    fp = tarfile_extract(tarfile, tarinfo)
+    decompressor = zlib.decompressobj()
+    size = 0
+
+    with open(tarinfo.name, "wb") as out:
+        try:
+            while chunk := fp.read(BUFSIZE):
+                size += out.write(decompressor.decompress(chunk))
+            size += out.write(decompressor.flush())
+        except zlib.error as error:
+            raise tar.ReadError(f"Corrupt data for {tarinfo.name}: {error}") from None
+
+    if not decompressor.eof or size != file_size(tarinfo):
+        raise tar.ReadError(f"Corrupt data for {tarinfo.name}")
+
+    tarfile_set_attrs(tarfile, tarinfo)
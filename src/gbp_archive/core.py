@@ -1,17 +1,50 @@
 """Core functions for gbp-archive"""
 
+import dataclasses
+import io
+import itertools
+import os
+import stat
 import tarfile as tar
 import tempfile
-from typing import IO, Iterable
+from contextlib import ExitStack
+from types import ModuleType
+from typing import IO, Iterable, Iterator, cast
 
 from gentoo_build_publisher import publisher, signals
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher.types import Build, Content
 
 from gbp_archive import metadata, records, storage
-from gbp_archive.types import DumpCallback, default_dump_callback
-from gbp_archive.utils import tarfile_extract, tarfile_next
+from gbp_archive.digests import DigestCache
+from gbp_archive.staging import Stage
+from gbp_archive.throttle import ThrottledWriter
+from gbp_archive.types import (
+    DumpCallback,
+    DumpOptions,
+    FileStatus,
+    Member,
+    Metadata,
+    RestoreOptions,
+    Summary,
+    default_dump_callback,
+)
+from gbp_archive.utils import (
+    DigestReader,
+    DigestWriter,
+    build_sort_key,
+    seekable,
+    tarfile_extract,
+    tarfile_members,
+    tarfile_next,
+    tarfile_read_mode,
+)
 
-ARCHIVE_ITEMS = (metadata, records, storage)
+ARCHIVE_ITEMS = (records, storage)
+"""The archive items described by the metadata's member table
+
+The metadata itself is always the first member of the archive.
+"""
+ITEMS_BY_TYPE = {item.MEMBER_TYPE: item for item in ARCHIVE_ITEMS}
 
 
 def dump(
@@ -19,45 +52,440 @@ def dump(
     outfile: IO[bytes],
     *,
     callback: DumpCallback = default_dump_callback,
+    options: DumpOptions = DumpOptions(),
 ) -> None:
     """Dump the given builds to the given outfile"""
-    builds = sorted(builds, key=lambda build: (build.machine, int(build.build_id)))
+    builds = sorted(builds, key=build_sort_key)
+
+    if options.limiter is not None:
+        outfile = cast(IO[bytes], ThrottledWriter(outfile, options.limiter))
+
+    with tar.open(fileobj=outfile, mode="w|") as tarfile, ExitStack() as stack:
+        members: list[tuple[Member, IO[bytes]]] = []
 
-    with tar.open(fileobj=outfile, mode="w|") as tarfile:
         for item in ARCHIVE_ITEMS:
-            with tempfile.TemporaryFile(mode="w+b") as fp:
-                item.dump(builds, fp, callback=callback)
-                fp.seek(0)
-                tarinfo = tarfile.gettarinfo(arcname=item.ARCHIVE_NAME, fileobj=fp)
-                tarfile.addfile(tarinfo, fp)
+            fp = stack.enter_context(tempfile.TemporaryFile(mode="w+b"))
+            writer = DigestWriter(fp)
+            item.dump(
+                builds, cast(IO[bytes], writer), callback=callback, options=options
+            )
+            members.append((make_member(item, writer), fp))
+
+        with tempfile.TemporaryFile(mode="w+b") as fp:
+            table = [member for member, _ in members]
+            metadata.dump(builds, fp, callback=callback, options=options, members=table)
+            ordered: list[tuple[str, IO[bytes]]] = [(metadata.ARCHIVE_NAME, fp)]
+            ordered.extend((member["name"], member_fp) for member, member_fp in members)
+
+            if options.reproducible:
+                # The metadata changes with every dump so it goes last, where it
+                # doesn't shift the data that hasn't
+                ordered.append(ordered.pop(0))
+
+            for name, member_fp in ordered:
+                add_member(tarfile, name, member_fp, reproducible=options.reproducible)
+
+
+def make_member(item: ModuleType, writer: DigestWriter) -> Member:
+    """Return the member table entry for the given archive item written by writer"""
+    return {
+        "name": item.ARCHIVE_NAME,
+        "type": item.MEMBER_TYPE,
+        "codec": item.CODEC,
+        "compression": "none",
+        "size": writer.size,
+        "digest": writer.digest,
+    }
+
+
+def add_member(
+    tarfile: tar.TarFile, name: str, fp: IO[bytes], *, reproducible: bool = False
+) -> None:
+    """Add the contents of the given (seekable) file to the tarfile as the given name
+
+    If reproducible is True, the member's header doesn't depend on the file's owner,
+    mode or timestamp.
+    """
+    fp.seek(0)
+    tarinfo = tarfile.gettarinfo(arcname=name, fileobj=fp)
+
+    if reproducible:
+        # Not a deep copy, which would copy the TarFile and its file object with it
+        tarinfo = tarinfo.replace(
+            mtime=0, mode=0o644, uid=0, gid=0, uname="", gname="", deep=False
+        )
+
+    tarfile.addfile(tarinfo, fp)
 
 
 def tabulate(infile: IO[bytes]) -> list[Build]:
     """Return the list of builds in the archive"""
-    with tar.open(fileobj=infile, mode="r|") as tarfile:
-        fp = tarfile_extract(tarfile, tarfile_next(tarfile))
-        m = metadata.restore(fp, callback=None)
+    m = read_metadata(infile)
+
     return [Build.from_id(i) for i in m["manifest"]]
 
 
+def inspect(infile: IO[bytes]) -> Summary:
+    """Return the storage Summary of the builds in the archive
+
+    This is read from the archive's metadata so the storage is not scanned. Raise
+    LookupError if the archive does not contain a summary, as is the case for archives
+    created by older versions of gbp-archive.
+    """
+    m = read_metadata(infile)
+
+    if (summary := m.get("summary")) is None:
+        raise LookupError("The archive does not contain a summary")
+
+    return summary
+
+
+def read_metadata(infile: IO[bytes]) -> Metadata:
+    """Return the Metadata of the archive
+
+    The metadata is normally the first member of the archive but is the last member of
+    reproducible archives. Raise ReadError if the archive has no metadata.
+    """
+    # When we can seek, the (possibly large) members before the metadata are skipped
+    # rather than read
+    with tar.open(fileobj=infile, mode=tarfile_read_mode(infile)) as tarfile:
+        for tarinfo in tarfile_members(tarfile):
+            if tarinfo.name == metadata.ARCHIVE_NAME:
+                fp = tarfile_extract(tarfile, tarinfo)
+                return metadata.restore(fp, callback=None)
+
+    raise tar.ReadError("Archive metadata not found")
+
+
+def verify_storage(
+    infile: IO[bytes], digests: DigestCache
+) -> Iterator[tuple[str, FileStatus]]:
+    """Check the files in the archive against those in the instance's storage
+
+    Yield the name and status of each file whose digest was recorded in the archive
+    (see DumpOptions.checksums). The digests of the instance's files are taken from the
+    given DigestCache. When the archive is seekable only its headers are read. Raise
+    ReadError if the archive has no storage.
+    """
+    with tar.open(fileobj=infile, mode=tarfile_read_mode(infile)) as tarfile:
+        for tarinfo in tarfile_members(tarfile):
+            if tarinfo.name != storage.ARCHIVE_NAME:
+                continue
+
+            fp = tarfile_extract(tarfile, tarinfo)
+
+            with tar.open(fileobj=fp, mode=tarfile_read_mode(fp)) as storage_tarfile:
+                for member in tarfile_members(storage_tarfile):
+                    digest = member.pax_headers.get(storage.DIGEST_HEADER)
+                    if digest is not None:
+                        yield member.name, file_status(member.name, digest, digests)
+            return
+
+    raise tar.ReadError("Archive storage not found")
+
+
+def file_status(name: str, digest: str, digests: DigestCache) -> FileStatus:
+    """Return the status of the given storage file compared to the given digest"""
+    try:
+        stat_result = os.lstat(digests.root / name)
+    except (FileNotFoundError, NotADirectoryError):
+        return "missing"
+
+    if not stat.S_ISREG(stat_result.st_mode):
+        return "modified"
+
+    return "ok" if digests.digest(name, stat_result) == digest else "modified"
+
+
 def restore(
-    infile: IO[bytes], *, callback: DumpCallback = default_dump_callback
+    infile: IO[bytes],
+    *,
+    callback: DumpCallback = default_dump_callback,
+    options: RestoreOptions = RestoreOptions(),
 ) -> None:
-    """Restore builds from the given infile"""
-    with tar.open(fileobj=infile, mode="r|") as tarfile:
-        fp = tarfile_extract(tarfile, tarfile_next(tarfile))
-        manifest = metadata.restore(fp, callback=callback)["manifest"]
-        builds = [Build.from_id(build_str) for build_str in manifest]
+    """Restore builds from the given infile
+
+    Only the Content types given in the options, and that are present in the archive,
+    are restored, and only the records of the builds whose storage was restored.
+
+    The archive's members are dispatched according to the metadata's member table.
+    Members of types that we don't know about are skipped. Raise ReadError if the
+    archive is of an unsupported version, if a member listed in the table is missing
+    or if a member's digest doesn't match. Note that, as the archive is read as a
+    stream, a member is verified only after it has been restored.
+
+    If the options say so, the restore is staged: builds are extracted to a staging
+    area and each is moved into place, and then its record saved, once it is complete.
+    Priority restores are staged and each build's postpull signal is emitted as soon as
+    it is in place. Seekable archives are then restored in priority order, each member
+    being verified by reading it through before anything of it is restored. Other
+    archives can only be verified once they have been read, so their builds are held in
+    the stage until they have been.
+
+    Unless the options say otherwise, a preflight check is done before anything is
+    written. Raise InsufficientSpaceError if the storage root doesn't have the space or
+    inodes for the archive's builds. The check needs the archive's summary so is
+    skipped for archives without one. It is also skipped for reproducible archives that
+    are not seekable, as their metadata is at the end.
+    """
+    checked = False
+
+    if options.preflight and infile.seekable():
+        start = infile.tell()
+        preflight(read_metadata(infile))
+        infile.seek(start)
+        checked = True
+
+    # When we can seek, members that aren't restored are skipped rather than read
+    mode = tarfile_read_mode(infile)
+
+    with tar.open(fileobj=infile, mode=mode) as tarfile, ExitStack() as stack:
+        tarinfo = tarfile_next(tarfile)
+
+        if tarinfo.name != metadata.ARCHIVE_NAME:
+            # The member table is only known once the whole archive has been read
+            stage = new_stage(stack, options, deferred=True)
+            restore_reproducible(
+                tarfile, tarinfo, callback=callback, options=options, stage=stage
+            )
+            return
+
+        fp = tarfile_extract(tarfile, tarinfo)
+        m = metadata.restore(fp, callback=callback)
+
+        if options.preflight and not checked:
+            preflight(m)
+
+        stage = new_stage(stack, options, deferred=mode == "r|")
+        table = {member["name"]: member for member in metadata.member_table(m)}
+        builds = [Build.from_id(build_str) for build_str in m["manifest"]]
+        options = dataclasses.replace(
+            options, contents=restorable_contents(m, options.contents)
+        )
 
         emit_prepull_signals(builds)
 
-        fp = tarfile_extract(tarfile, tarfile_next(tarfile))
-        records.restore(fp, callback=callback)
+        for tarinfo in tarfile_members(tarfile):
+            if (member := table.pop(tarinfo.name, None)) is not None:
+                restore_member(
+                    tarfile_extract(tarfile, tarinfo),
+                    member,
+                    callback=callback,
+                    options=options,
+                    stage=stage,
+                )
 
-        fp = tarfile_extract(tarfile, tarfile_next(tarfile))
-        storage.restore(fp, callback=callback)
+        if table:
+            raise tar.ReadError(f"Archive members missing: {', '.join(table)}")
 
-        emit_postpull_signals(builds)
+        stage.finish()
+
+        emit_postpull_signals(unsignalled(builds, stage))
+
+
+def new_stage(
+    stack: ExitStack, options: RestoreOptions, *, deferred: bool = False
+) -> Stage:
+    """Return the entered Stage of a restore with the given options
+
+    If the restore isn't staged, the Stage only holds the records. The stages of
+    priority restores emit each build's postpull signal once committed.
+    If deferred is True, and the restore is a priority restore, its builds are only
+    committed when the stage is finished, once the archive has been verified.
+    """
+    if options.priority:
+        stage = Stage(
+            on_commit=lambda build: emit_postpull_signals([build]), deferred=deferred
+        )
+    else:
+        stage = Stage(staged=options.staged)
+
+    return stack.enter_context(stage)
+
+
+def unsignalled(builds: Iterable[Build], stage: Stage | None) -> list[Build]:
+    """Return the builds whose postpull signals the stage hasn't emitted"""
+    if stage is None or stage.on_commit is None:
+        return list(builds)
+
+    committed = {str(build) for build in stage.committed}
+
+    return [build for build in builds if str(build) not in committed]
+
+
+def preflight(m: Metadata) -> None:
+    """Check that the storage root has room for the builds of the archive
+
+    Raise InsufficientSpaceError if it doesn't. Archives without a summary are not
+    checked.
+    """
+    if (summary := m.get("summary")) is not None:
+        storage.check_space(summary)
+
+
+def restore_member(
+    fp: IO[bytes],
+    member: Member,
+    *,
+    callback: DumpCallback,
+    options: RestoreOptions,
+    stage: Stage | None = None,
+) -> None:
+    """Restore the given extracted member according to its member table entry"""
+    if (item := ITEMS_BY_TYPE.get(member["type"])) is None:
+        return
+
+    check_member(member, item.CODEC)
+    restore_item(
+        item,
+        fp,
+        member_reader(fp, member),
+        member=member,
+        callback=callback,
+        options=options,
+        stage=stage,
+    )
+
+
+def restore_item(  # pylint: disable=too-many-arguments
+    item: ModuleType,
+    fp: IO[bytes],
+    reader: DigestReader,
+    *,
+    member: Member | None,
+    callback: DumpCallback,
+    options: RestoreOptions,
+    stage: Stage | None = None,
+) -> None:
+    """Restore the archive item from its member's file object, read through reader
+
+    If the member's table entry is given, what the reader read is verified against it.
+    Otherwise the reader reads the rest of the member, for it to be verified later.
+
+    Priority restores read seekable members out of order, so they restore from the
+    member's file object, once the reader has read it through. Builds are committed as
+    they are restored, so the member is then verified beforehand. Otherwise the item is
+    restored from the reader, and the member verified afterwards.
+    """
+    if options.priority and seekable(fp):
+        reader.drain()
+        if member is not None:
+            verify_member(reader, member)
+        fp.seek(0)
+        item.restore(fp, callback=callback, options=options, stage=stage)
+        return
+
+    item.restore(
+        cast(IO[bytes], reader), callback=callback, options=options, stage=stage
+    )
+    reader.drain()
+
+    if member is not None:
+        verify_member(reader, member)
+
+
+def restore_reproducible(
+    tarfile: tar.TarFile,
+    first: tar.TarInfo,
+    *,
+    callback: DumpCallback,
+    options: RestoreOptions,
+    stage: Stage,
+) -> None:
+    """Restore the rest of a reproducible archive given its first member
+
+    The metadata of reproducible archives is the last member so the other members are
+    those of the implicit (version 1) member table: the records followed by the
+    storage. The builds are taken from the records and the members are verified against
+    the member table once the metadata has been read. Raise ReadError if the metadata
+    is missing or a member is missing or corrupt.
+    """
+    table = {member["name"]: member for member in metadata.V1_MEMBERS}
+    readers: dict[str, DigestReader] = {}
+    builds: list[Build] = []
+
+    for tarinfo in itertools.chain([first], tarfile_members(tarfile)):
+        if tarinfo.name == metadata.ARCHIVE_NAME:
+            break
+
+        if (member := table.pop(tarinfo.name, None)) is None:
+            continue
+
+        fp = tarfile_extract(tarfile, tarinfo)
+        reader = member_reader(fp, member)
+        readers[member["name"]] = reader
+
+        if member["type"] == records.MEMBER_TYPE:
+            data = reader.read()
+            builds = records.load_builds(data)
+            emit_prepull_signals(builds)
+            records.restore(
+                io.BytesIO(data), callback=callback, options=options, stage=stage
+            )
+        else:
+            restore_item(
+                storage,
+                fp,
+                reader,
+                member=None,
+                callback=callback,
+                options=options,
+                stage=stage,
+            )
+    else:
+        raise tar.ReadError("Archive metadata not found")
+
+    m = metadata.restore(tarfile_extract(tarfile, tarinfo), callback=callback)
+
+    for member in metadata.member_table(m):
+        if member["name"] not in readers:
+            raise tar.ReadError(f"Archive members missing: {member['name']}")
+        verify_member(readers[member["name"]], member)
+
+    stage.finish()
+
+    emit_postpull_signals(unsignalled(builds, stage))
+
+
+def check_member(member: Member, codec: str) -> None:
+    """Check that we can decode the given member
+
+    Raise ReadError if the member is not of the given codec or is compressed.
+    """
+    if member["codec"] != codec:
+        raise tar.ReadError(f"Unsupported codec for {member['name']}")
+
+    if member["compression"] != "none":
+        raise tar.ReadError(f"Unsupported compression for {member['name']}")
+
+
+def member_reader(fp: IO[bytes], member: Member) -> DigestReader:
+    """Return a DigestReader of the given member's file object
+
+    The digest algorithm is that of the member's digest, if it has one.
+    """
+    algorithm, _, _ = member.get("digest", "sha256:").partition(":")
+
+    return DigestReader(fp, algorithm)
+
+
+def verify_member(reader: DigestReader, member: Member) -> None:
+    """Verify what was read by reader against the member's size and digest
+
+    Members of version 1 archives don't have a digest so are not verified. Raise
+    ReadError if the member is corrupt.
+    """
+    if "digest" in member:
+        reader.verify(member["size"], member["digest"])
+
+
+def restorable_contents(
+    m: Metadata, contents: Iterable[Content]
+) -> tuple[Content, ...]:
+    """Return the given Content types that are in the archive given its Metadata"""
+    archived = m.get("contents", [content.value for content in Content])
+
+    return tuple(content for content in contents if content.value in archived)
 
 
 def emit_prepull_signals(builds: Iterable[Build]) -> None:
@@ -69,10 +497,16 @@ def emit_prepull_signals(builds: Iterable[Build]) -> None:
 
 
 def emit_postpull_signals(builds: Iterable[Build]) -> None:
-    """Emit postpull signals for the given builds"""
+    """Emit postpull signals for the given builds
+
+    Builds whose storage is incomplete, for example because only some of their Content
+    types were restored, have not been pulled and so are skipped.
+    """
     dispatcher = signals.dispatcher
 
     for build in builds:
+        if not publisher.storage.pulled(build):
+            continue
         dispatcher.emit(
             "postpull",
             build=publisher.record(build),
@@ -0,0 +1,196 @@
+"""Delta encoding of dumped storage against the previous build
+
+Consecutive builds of a machine differ only slightly. Files that haven't changed are
+hard links to the previous build's and are already dumped as such. But a file that has
+changed, say the Packages index or a repo's metadata, is dumped in full although most of
+it is the same as in the previous build. Instead such a file can be stored as a delta
+against the previous build's version, when that makes it much smaller.
+
+The delta's base, the previous build's file, is earlier in the same dump. So by the
+time a restore comes to the delta the base has been restored and the file is rebuilt
+from it. Deltas are line-based: runs of the base's lines are copied and the rest of the
+file is inserted as is. Binpkgs, and other compressed files, are left alone.
+
+A delta's base and the file's original size are recorded in its pax headers. The
+member's data, and size, are then those of the delta.
+"""
+
+import io
+import itertools
+import os
+import stat
+import struct
+import tarfile as tar
+from pathlib import Path
+from typing import IO
+
+from gbp_archive.compression import COMPRESSED_SUFFIXES, SIZE_HEADER, file_size
+from gbp_archive.utils import tarfile_extract, tarfile_set_attrs
+
+HEADER = "GBP.delta"
+"""pax header of the base (the name of the previous build's file) of delta files"""
+
+MIN_SIZE = 4096
+MAX_SIZE = 256 * 1024 * 1024
+"""Files, and their bases, are held in memory so larger ones are stored as is"""
+MAX_RATIO = 0.5
+"""Deltas are only used if they are less than this ratio of the file's size"""
+MIN_COPY = 32
+"""Runs of the base shorter than this are inserted rather than copied"""
+
+COPY = struct.Struct(">cQQ")
+INSERT = struct.Struct(">cQ")
+
+
+def worthwhile(path: Path, size: int, base: Path) -> bool:
+    """Return True if the given file should be delta-encoded against base"""
+    if not MIN_SIZE <= size <= MAX_SIZE or path.name.endswith(COMPRESSED_SUFFIXES):
+        return False
+
+    try:
+        stat_result = os.lstat(base)
+    except (FileNotFoundError, NotADirectoryError):
+        return False
+
+    return stat.S_ISREG(stat_result.st_mode) and stat_result.st_size <= MAX_SIZE
+
+
+def encode(tarinfo: tar.TarInfo, fileobj: IO[bytes], base: Path) -> IO[bytes]:
+    """Return a file of the given regular file's data, delta-encoded against base
+
+    If the delta isn't worth it the file's data is returned as is. Otherwise the
+    tarinfo's size is changed to that of the delta and the base is recorded in its pax
+    headers.
+    """
+    data = fileobj.read()
+    delta = diff(base.read_bytes(), data)
+
+    if len(delta) >= MAX_RATIO * len(data):
+        return io.BytesIO(data)
+
+    tarinfo.pax_headers = {
+        **tarinfo.pax_headers,
+        HEADER: base.as_posix(),
+        SIZE_HEADER: str(tarinfo.size),
+    }
+    tarinfo.size = len(delta)
+
+    return io.BytesIO(delta)
+
+
+def diff(base: bytes, data: bytes) -> bytes:
+    """Return the delta that turns base into data
+
+    Each line of data that starts, or continues, a run of the base's lines is copied
+    from the base. The other lines are inserted.
+    """
+    lines = base.splitlines(keepends=True)
+    offsets = [0, *itertools.accumulate(map(len, lines))]
+    first: dict[bytes, int] = {}
+
+    for number, line in enumerate(lines):
+        first.setdefault(line, number)
+
+    # Runs (ranges of line numbers) of the base to copy, and data to insert
+    ops: list[range | bytes] = []
+
+    for line in data.splitlines(keepends=True):
+        last = ops[-1] if ops else None
+
+        if (
+            isinstance(last, range)
+            and last.stop < len(lines)
+            and lines[last.stop] == line
+        ):
+            ops[-1] = range(last.start, last.stop + 1)
+        elif (match := first.get(line)) is not None:
+            ops.append(range(match, match + 1))
+        else:
+            ops.append(line)
+
+    delta = bytearray()
+    pending = bytearray()
+
+    for op in ops:
+        if isinstance(op, range):
+            start, stop = offsets[op.start], offsets[op.stop]
+            if stop - start >= MIN_COPY:
+                if pending:
+                    delta += INSERT.pack(b"I", len(pending)) + pending
+                    pending.clear()
+                delta += COPY.pack(b"C", start, stop - start)
+                continue
+            op = base[start:stop]
+        pending += op
+
+    if pending:
+        delta += INSERT.pack(b"I", len(pending)) + pending
+
+    return bytes(delta)
+
+
+def patch(base: bytes, delta: bytes) -> bytes:
+    """Return the data given by applying the delta to base
+
+    Raise ValueError if the delta is corrupt.
+    """
+    data = bytearray()
+    position = 0
+
+    try:
+        while position < len(delta):
+            if delta[position : position + 1] == b"C":
+                _, start, size = COPY.unpack_from(delta, position)
+                position += COPY.size
+                chunk = base[start : start + size]
+            else:
+                op, size = INSERT.unpack_from(delta, position)
+                if op != b"I":
+                    raise ValueError(f"Unknown delta operation: {op!r}")
+                position += INSERT.size
+                chunk = delta[position : position + size]
+                position += size
+            if len(chunk) != size:
+                raise ValueError("Delta runs past the end of its data")
+            data += chunk
+    except struct.error as error:
+        raise ValueError(str(error)) from None
+
+    return bytes(data)
+
+
+def is_delta(tarinfo: tar.TarInfo) -> bool:
+    """Return True if the given member's data is a delta"""
+    return HEADER in tarinfo.pax_headers
+
+
+def decode(tarinfo: tar.TarInfo, delta: bytes, base: bytes) -> bytes:
+    """Return the given delta member's file, given its data and base
+
+    Raise ReadError if the delta is corrupt.
+    """
+    try:
+        data = patch(base, delta)
+    except ValueError as error:
+        raise tar.ReadError(f"Corrupt delta for {tarinfo.name}: {error}") from None
+
+    if len(data) != file_size(tarinfo):
+        raise tar.ReadError(f"Corrupt delta for {tarinfo.name}")
+
+    return data
+
+
+def extract(tarfile: tar.TarFile, tarinfo: tar.TarInfo, base: Path) -> None:
+    """Extract the given delta regular file from the tarfile
+
+    This is like TarFile.extract() except that the file is rebuilt from its base, which
+    must already have been extracted. Raise ReadError if the delta is corrupt.
+    """
+    try:
+        base_data = base.read_bytes()
+    except FileNotFoundError:
+        raise tar.ReadError(f"Delta base of {tarinfo.name} not found: {base}") from None
+
+    data = decode(tarinfo, tarfile_extract(tarfile, tarinfo).read(), base_data)
+    Path(tarinfo.name).write_bytes(data)
+    tarfile_set_attrs(tarfile, tarinfo)
@@ -0,0 +1,117 @@
+"""Persistent cache of the digests of the files in storage
+
+Builds don't change once they have been pulled, so there is no need to re-read their
+files each time their digests are needed. The cache is a SQLite database under the
+storage root. Entries are keyed by device and inode and are only used if the file's
+size and mtime are unchanged. Otherwise the file is hashed and its entry replaced.
+
+Entries of files that have since been deleted are left behind until pruned.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+from gbp_archive.utils import SQLiteStore
+
+CACHE_PATH = Path(".gbp-archive", "digests.sqlite")
+ALGORITHM = "sha256"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS digests (
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (device, inode)
+)
+"""
+
+Key = tuple[int, int, int, int]
+
+
+class DigestCache(SQLiteStore):
+    """Cache of the digests of the files under the given root
+
+    Paths given to the cache are relative to the root.
+    """
+
+    database = CACHE_PATH
+    schema = SCHEMA
+    table = "digests"
+
+    def digest(
+        self, path: str | Path, stat_result: os.stat_result | None = None
+    ) -> str:
+        """Return the digest of the given file, as "algorithm:hexdigest"
+
+        If the file's stat_result is given it is not stat-ed again.
+        """
+        if stat_result is None:
+            stat_result = os.lstat(self.root / path)
+
+        device, inode, size, mtime = key(stat_result)
+        row = self.connection.execute(
+            "SELECT size, mtime, digest FROM digests WHERE device = ? AND inode = ?",
+            (device, inode),
+        ).fetchone()
+
+        if row is not None and row[:2] == (size, mtime):
+            return str(row[2])
+
+        with open(self.root / path, "rb") as fp:
+            digest = f"{ALGORITHM}:{hashlib.file_digest(fp, ALGORITHM).hexdigest()}"
+
+        self.connection.execute(
+            "INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?)",
+            (device, inode, size, mtime, str(path), digest),
+        )
+
+        return digest
+
+    def prune(self) -> int:
+        """Remove the entries of files that have been deleted or changed
+
+        Return the number of entries removed.
+        """
+        stale: list[tuple[int, int]] = []
+        rows = self.connection.execute(
+            "SELECT device, inode, size, mtime, path FROM digests"
+        )
+
+        for device, inode, size, mtime, path in rows:
+            try:
+                current = key(os.lstat(self.root / path))
+            except (FileNotFoundError, NotADirectoryError):
+                current = None
+
+            if current != (device, inode, size, mtime):
+                stale.append((device, inode))
+
+        self.connection.executemany(
+            "DELETE FROM digests WHERE device = ? AND inode = ?", stale
+        )
+        self.connection.commit()
+
+        return len(stale)
+
+
+def key(stat_result: os.stat_result) -> Key:
+    """Return the cache key (device, inode, size and mtime) of the given file
+
+    SQLite integers are signed 64-bit so the device and inode numbers are stored as
+    such.
+    """
+    return (
+        signed(stat_result.st_dev),
+        signed(stat_result.st_ino),
+        stat_result.st_size,
+        stat_result.st_mtime_ns,
+    )
+
+
+def signed(number: int) -> int:
+    """Return the given unsigned 64-bit integer as a signed one"""
+    return number - (1 << 64) if number >= 1 << 63 else number
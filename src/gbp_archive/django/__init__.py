@@ -0,0 +1 @@
+"""Django apps of gbp-archive"""
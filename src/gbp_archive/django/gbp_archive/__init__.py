@@ -0,0 +1 @@
+"""The gbp-archive Django app, which GBP loads as the plugin's app"""
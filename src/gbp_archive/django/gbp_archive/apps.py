@@ -0,0 +1,23 @@
+"""AppConfig for gbp-archive"""
+
+from django.apps import AppConfig
+
+
+class GBPArchiveConfig(AppConfig):
+    """AppConfig for gbp-archive
+
+    The app has no models. It's only there to bind gbp-archive's signal handlers once
+    GBP has started.
+    """
+
+    name = "gbp_archive.django.gbp_archive"
+    label = "gbp_archive"
+    verbose_name = "GBP Archive"
+
+    def ready(self) -> None:
+        # pylint: disable=import-outside-toplevel
+        from gentoo_build_publisher.signals import dispatcher
+
+        from gbp_archive.manifests import handle_postpull
+
+        dispatcher.bind(postpull=handle_postpull)
@@ -0,0 +1,298 @@
+"""Dump and restore as background jobs
+
+Jobs are submitted to GBP's worker, the same task queue that GBP pulls builds with. A
+job's state is kept as JSON in the jobs directory, under the storage root, so that it
+can be queried (and the job cancelled) from any process: the server, the worker or the
+gbp CLI. The archive is written to, or read from, the job's file (or URL) and the job's
+progress is logged, as the verbose `gbp dump`/`gbp restore` would print it, next to its
+state.
+
+A job is cancelled by placing a marker file next to its state. The job checks for the
+marker each time its callback is called and, if present, stops the dump or restore.
+"""
+
+import datetime as dt
+import json
+import logging
+import os
+import tempfile
+import uuid
+from pathlib import Path
+from typing import IO, Iterable, cast
+
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+
+from gbp_archive.remote import is_url, open_archive
+from gbp_archive.throttle import TokenBucket
+from gbp_archive.types import (
+    DumpOptions,
+    DumpPhase,
+    DumpType,
+    Job,
+    JobState,
+    RestoreOptions,
+)
+
+JOBS_DIR = Path(".gbp-archive", "jobs")
+ACTIVE_STATES: tuple[JobState, ...] = ("queued", "running")
+VERBS: dict[DumpType, str] = {"dump": "dumping", "restore": "restoring"}
+
+logger = logging.getLogger(__name__)
+
+
+class JobNotFoundError(LookupError):
+    """There is no job with the given id"""
+
+
+class JobCancelled(Exception):
+    """The job was cancelled while running"""
+
+
+def submit_dump(
+    builds: Iterable[Build], path: str | Path, *, options: DumpOptions = DumpOptions()
+) -> Job:
+    """Submit a job to dump the given builds to the given path
+
+    Return the job as submitted.
+    """
+    build_ids = [str(build) for build in builds]
+    job = new_job("dump", path, builds=build_ids, total=2 * len(build_ids))
+    job["contents"] = [content.value for content in options.contents]
+    job["reproducible"] = options.reproducible
+    job["checksums"] = options.checksums
+    job["compress"] = options.compress
+    job["delta"] = options.delta
+    job["cache_size"] = options.cache_size
+    job["max_rate"] = options.limiter.rate if options.limiter else None
+
+    return enqueue(job)
+
+
+def submit_restore(
+    path: str | Path, *, options: RestoreOptions = RestoreOptions()
+) -> Job:
+    """Submit a job to restore builds from the given path
+
+    Return the job as submitted.
+    """
+    job = new_job("restore", path)
+    job["contents"] = [content.value for content in options.contents]
+    job["staged"] = options.staged
+    job["preflight"] = options.preflight
+    job["priority"] = options.priority
+
+    return enqueue(job)
+
+
+def new_job(type_: DumpType, path: str | Path, **fields: object) -> Job:
+    """Return a new (queued) job"""
+    job = {
+        "id": uuid.uuid4().hex[:12],
+        "type": type_,
+        "state": "queued",
+        "path": str(path) if is_url(str(path)) else str(Path(path).absolute()),
+        "submitted": dt.datetime.now(tz=dt.UTC).isoformat(),
+        "progress": 0,
+        "total": 0,
+        "current": "",
+        **fields,
+    }
+    return cast(Job, job)
+
+
+def enqueue(job: Job) -> Job:
+    """Save the job and submit it to the worker"""
+    # pylint: disable=import-outside-toplevel
+    from gentoo_build_publisher import worker
+
+    save(job)
+    worker.run(run_job, job["id"])
+
+    return job
+
+
+def run_job(job_id: str) -> None:
+    """Run the job with the given id. This is the task that the worker runs"""
+    # The Celery worker runs tasks without globals so everything must be imported here
+    # pylint: disable=import-outside-toplevel,import-self,redefined-outer-name
+    from gbp_archive import jobs
+
+    jobs.execute(jobs.get(job_id))
+
+
+def execute(job: Job) -> None:
+    """Run the given job, keeping its state up to date
+
+    Errors are logged and recorded in the job's state rather than raised.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gbp_archive import core
+
+    if cancel_requested(job["id"]):
+        finish(job, "cancelled")
+        return
+
+    job["state"] = "running"
+    job["started"] = dt.datetime.now(tz=dt.UTC).isoformat()
+    save(job)
+    contents = tuple(Content(value) for value in job["contents"])
+
+    with log_path(job["id"]).open("a", encoding="utf8") as log:
+
+        def callback(type_: DumpType, phase: DumpPhase, build: Build) -> None:
+            if cancel_requested(job["id"]):
+                raise JobCancelled(job["id"])
+
+            job["progress"] += 1
+            job["current"] = f"{VERBS[type_]} {phase} for {build}"
+            log.write(f"{job['current']}\n")
+            log.flush()
+            save(job)
+
+        try:
+            if job["type"] == "dump":
+                rate = job.get("max_rate")
+                dump_options = DumpOptions(
+                    contents=contents,
+                    limiter=TokenBucket(rate) if rate else None,
+                    reproducible=job.get("reproducible", False),
+                    checksums=job.get("checksums", False),
+                    compress=job.get("compress", False),
+                    delta=job.get("delta", False),
+                    cache_size=job.get("cache_size"),
+                )
+                builds = [Build.from_id(build) for build in job.get("builds", [])]
+                with open_archive(job["path"], "wb") as outfile:
+                    core.dump(builds, outfile, callback=callback, options=dump_options)
+            else:
+                restore_options = RestoreOptions(
+                    contents=contents,
+                    staged=job.get("staged", False),
+                    preflight=job.get("preflight", True),
+                    priority=job.get("priority", False),
+                )
+                with open_archive(job["path"], "rb") as infile:
+                    job["total"] = 2 * len(core.tabulate(infile))
+                    infile.seek(0)
+                    core.restore(infile, callback=callback, options=restore_options)
+        except JobCancelled:
+            discard_output(job)
+            finish(job, "cancelled")
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            logger.exception("Archive job %s failed", job["id"])
+            log.write(f"error: {error}\n")
+            discard_output(job)
+            finish(job, "failed", error=str(error))
+        else:
+            finish(job, "done")
+
+
+def finish(job: Job, state: JobState, error: str | None = None) -> None:
+    """Record that the job has finished with the given state"""
+    job["state"] = state
+    job["finished"] = dt.datetime.now(tz=dt.UTC).isoformat()
+
+    if error is not None:
+        job["error"] = error
+
+    save(job)
+    cancel_path(job["id"]).unlink(missing_ok=True)
+
+
+def discard_output(job: Job) -> None:
+    """Remove the (partial) archive of an unfinished dump job
+
+    Uploads are aborted, so leave nothing behind, when the dump fails.
+    """
+    if job["type"] == "dump" and not is_url(job["path"]):
+        Path(job["path"]).unlink(missing_ok=True)
+
+
+def get(job_id: str) -> Job:
+    """Return the job with the given id
+
+    Raise JobNotFoundError if there is no such job.
+    """
+    try:
+        with state_path(job_id).open("rb") as fp:
+            return load(fp)
+    except FileNotFoundError:
+        raise JobNotFoundError(job_id) from None
+
+
+def list_jobs() -> list[Job]:
+    """Return all the jobs, oldest first"""
+    jobs = []
+
+    for path in jobs_dir().glob("*.json"):
+        with path.open("rb") as fp:
+            jobs.append(load(fp))
+
+    return sorted(jobs, key=lambda job: job["submitted"])
+
+
+def cancel(job_id: str) -> Job:
+    """Request that the job with the given id be cancelled
+
+    A queued job is cancelled when the worker gets to it and a running one the next
+    time its progress is reported. A cancelled dump's archive is removed. However a
+    cancelled restore, unless staged, leaves behind what it had restored. Finished jobs
+    are left alone.
+
+    Return the job. Raise JobNotFoundError if there is no such job.
+    """
+    if get(job_id)["state"] in ACTIVE_STATES:
+        cancel_path(job_id).touch()
+
+    return get(job_id)
+
+
+def cancel_requested(job_id: str) -> bool:
+    """Return True if the job with the given id has been asked to cancel"""
+    return cancel_path(job_id).exists()
+
+
+def load(fp: IO[bytes]) -> Job:
+    """Return the job from the given file"""
+    job = cast(Job, json.load(fp))
+
+    if job["state"] in ACTIVE_STATES and cancel_requested(job["id"]):
+        job["state"] = "cancelling"
+
+    return job
+
+
+def save(job: Job) -> None:
+    """Write the job's state
+
+    The state is replaced atomically so readers never see a partially written job.
+    """
+    directory = jobs_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".")
+
+    with os.fdopen(fd, "w", encoding="utf8") as fp:
+        json.dump(job, fp)
+
+    os.replace(tmp, state_path(job["id"]))
+
+
+def jobs_dir() -> Path:
+    """Return the directory holding the jobs' state"""
+    return publisher.storage.root / JOBS_DIR
+
+
+def state_path(job_id: str) -> Path:
+    """Return the path of the job's state"""
+    return jobs_dir() / f"{job_id}.json"
+
+
+def log_path(job_id: str) -> Path:
+    """Return the path of the job's progress log"""
+    return jobs_dir() / f"{job_id}.log"
+
+
+def cancel_path(job_id: str) -> Path:
+    """Return the path of the job's cancel marker"""
+    return jobs_dir() / f"{job_id}.cancel"
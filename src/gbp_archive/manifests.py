@@ -0,0 +1,221 @@
+"""Manifests of builds' storage, precomputed when they are pulled
+
+Size estimates, archive summaries and verification all need what is in the storage of
+the builds, which otherwise means walking storage.root, and hashing its files, during
+the backup window. Builds don't change once they have been pulled, so this can be done
+once, when the build is pulled, by the worker.
+
+A build's manifest is, for each of its Content directories, the name, inode and size of
+everything beneath it. Entries with the same device and inode are hard links of one
+another. Manifests are kept in a SQLite database under the storage root along with the
+directory's inode and timestamps, so that one is only used if the directory is
+unchanged. The digests of the build's regular files go in the storage's DigestCache.
+
+The app's ready() imports this module while Django is still loading the apps. GBP's
+publisher can't be built until it has, so it is only imported where it is used.
+"""
+
+import json
+import os
+import stat
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+from gentoo_build_publisher.types import Build, Content
+
+from gbp_archive.digests import DigestCache
+from gbp_archive.utils import SQLiteStore, stat_key
+
+MANIFESTS_PATH = Path(".gbp-archive", "manifests.sqlite")
+ENABLE_VARIABLE = "GBP_ARCHIVE_MANIFESTS"
+"""Environment variable that, when true, enables precomputing manifests on pull"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    path TEXT PRIMARY KEY,
+    build TEXT NOT NULL,
+    key TEXT NOT NULL,
+    entries TEXT NOT NULL
+)
+"""
+
+
+class Record(NamedTuple):
+    """An entry of a Content directory's manifest"""
+
+    name: str
+    """Path of the entry relative to the storage root"""
+
+    device: int
+    """st_dev of the entry"""
+
+    inode: int
+    """st_ino of the entry"""
+
+    mode: int
+    """st_mode of the entry"""
+
+    size: int
+    """Size of the entry in bytes"""
+
+
+class Manifests(SQLiteStore):
+    """Store of the manifests of the builds' Content directories under the given root
+
+    Paths given to the store are relative to the root.
+    """
+
+    database = MANIFESTS_PATH
+    schema = SCHEMA
+    table = "manifests"
+
+    def get(self, path: str | Path) -> list[Record] | None:
+        """Return the manifest of the given directory
+
+        Return None if it has no manifest or the directory has changed since.
+        """
+        row = self.connection.execute(
+            "SELECT key, entries FROM manifests WHERE path = ?", (str(path),)
+        ).fetchone()
+
+        if row is None or row[0] != directory_key(self.root / path):
+            return None
+
+        return [Record(*entry) for entry in json.loads(row[1])]
+
+    def put(self, build: Build, path: str | Path, records: Iterable[Record]) -> None:
+        """Store the given records as the manifest of the build's directory"""
+        self.connection.execute(
+            "INSERT OR REPLACE INTO manifests VALUES (?, ?, ?, ?)",
+            (
+                str(path),
+                str(build),
+                directory_key(self.root / path),
+                json.dumps([list(record) for record in records]),
+            ),
+        )
+
+    def prune(self, exists: Callable[[Build], bool]) -> list[Build]:
+        """Remove the manifests of the builds that no longer exist
+
+        Return the builds whose manifests were removed.
+        """
+        rows = self.connection.execute("SELECT DISTINCT build FROM manifests")
+        builds = [Build.from_id(build_id) for (build_id,) in rows.fetchall()]
+        pruned = [build for build in builds if not exists(build)]
+
+        self.connection.executemany(
+            "DELETE FROM manifests WHERE build = ?", [(str(b),) for b in pruned]
+        )
+        self.connection.commit()
+
+        return pruned
+
+
+def precompute(build: Build, contents: Iterable[Content] = tuple(Content)) -> None:
+    """Compute and store the manifest, and digests, of the given build's storage
+
+    The manifests of builds that have since been purged are dropped.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gentoo_build_publisher import publisher
+
+    storage = publisher.storage
+    root_length = len(str(storage.root)) + 1
+
+    with Manifests(storage.root) as manifests, DigestCache(storage.root) as digests:
+        for content in contents:
+            path = storage.get_path(build, content)
+            records: list[Record] = []
+
+            for name, stat_result in walk(path):
+                record = Record(
+                    name[root_length:],
+                    stat_result.st_dev,
+                    stat_result.st_ino,
+                    stat_result.st_mode,
+                    stat_result.st_size,
+                )
+                records.append(record)
+                if stat.S_ISREG(record.mode):
+                    digests.digest(record.name, stat_result)
+
+            if records:
+                manifests.put(build, path.relative_to(storage.root), records)
+
+        manifests.prune(storage.pulled)
+
+
+def precompute_task(build_id: str) -> None:
+    """Precompute the manifest of the build with the given id. The worker runs this"""
+    # The Celery worker runs tasks without globals so everything must be imported here
+    # pylint: disable=import-outside-toplevel,import-self,redefined-outer-name
+    from gbp_archive import manifests
+
+    manifests.precompute(Build.from_id(build_id))
+
+
+def lookup(paths: Iterable[Path]) -> dict[Path, list[Record]]:
+    """Return the precomputed manifests of those of the given paths that have one
+
+    The paths are absolute paths in Storage. If no manifests have been precomputed,
+    return an empty dict.
+    """
+    # pylint: disable=import-outside-toplevel
+    from gentoo_build_publisher import publisher
+
+    root = publisher.storage.root
+
+    if not (root / MANIFESTS_PATH).exists():
+        return {}
+
+    with Manifests(root) as manifests:
+        found = {path: manifests.get(path.relative_to(root)) for path in paths}
+
+    return {path: records for path, records in found.items() if records is not None}
+
+
+def enabled() -> bool:
+    """Return True if manifests are to be precomputed when builds are pulled"""
+    value = os.environ.get(ENABLE_VARIABLE, "")
+
+    return value.lower() in {"1", "true", "yes", "on"}
+
+
+def directory_key(path: Path) -> str:
+    """Return the key of the given directory that its manifest is stored with"""
+    return json.dumps(stat_key(path))
+
+
+def walk(path: Path) -> Iterator[tuple[str, os.stat_result]]:
+    """Yield the (path, lstat) of the given path and everything beneath it
+
+    Symlinks are not followed. If the path does not exist, nothing is yielded.
+    """
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return
+
+    yield str(path), st
+
+    if stat.S_ISDIR(st.st_mode):
+        yield from _walk_dir(str(path))
+
+
+def _walk_dir(dirpath: str) -> Iterator[tuple[str, os.stat_result]]:
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            yield entry.path, entry.stat(follow_symlinks=False)
+
+            if entry.is_dir(follow_symlinks=False):
+                yield from _walk_dir(entry.path)
+
+
+def handle_postpull(*, build: Build, **_kwargs: Any) -> None:
+    """Have the worker precompute the pulled build's manifest, if enabled"""
+    # pylint: disable=import-outside-toplevel
+    from gentoo_build_publisher import worker
+
+    if enabled():
+        worker.run(precompute_task, str(build))
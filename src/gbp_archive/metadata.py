@@ -2,14 +2,23 @@
 
 import datetime as dt
 import json
+import tarfile as tar
 from typing import IO, Any, Iterable, cast
 
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher.types import Build, Content
 from gentoo_build_publisher.utils import get_hostname, time
 
-from gbp_archive.types import Metadata
+from gbp_archive.summary import summarize
+from gbp_archive.types import DumpOptions, Member, Metadata, Summary
 
 ARCHIVE_NAME = "gbp-archive"
+VERSION = 2
+
+# Version 1 archives have no member table. Their members are always these, in order
+V1_MEMBERS: list[Member] = [
+    {"name": "records.json", "type": "records", "codec": "json", "compression": "none"},
+    {"name": "storage.tar", "type": "storage", "codec": "tar", "compression": "none"},
+]
 
 
 def dump(
@@ -17,9 +26,26 @@ def dump(
     fp: IO[bytes],
     *,
     callback: Any,  # pylint: disable=unused-argument
+    options: DumpOptions = DumpOptions(),
+    members: Iterable[Member] = (),
 ) -> None:
-    """Write the given metadata to the given file"""
-    metadata = create(builds, timestamp=time.localtime())
+    """Write the given metadata to the given file
+
+    members is the table of the archive's other members.
+    """
+    builds = list(builds)
+    metadata = create(
+        builds,
+        timestamp=time.localtime(),
+        summary=summarize(builds, contents=options.contents),
+        contents=options.contents,
+        members=members,
+    )
+    write(metadata, fp)
+
+
+def write(metadata: Metadata, fp: IO[bytes]) -> None:
+    """Write the given Metadata to the given file"""
     fp.write(json.dumps(metadata).encode("utf8"))
 
 
@@ -30,11 +56,39 @@ def restore(
     return cast(Metadata, json.load(infile))
 
 
-def create(builds: Iterable[Build], timestamp: dt.datetime) -> Metadata:
+def create(
+    builds: Iterable[Build],
+    timestamp: dt.datetime,
+    summary: Summary | None = None,
+    contents: Iterable[Content] = tuple(Content),
+    members: Iterable[Member] = (),
+) -> Metadata:
     """Return metadata dict"""
-    return {
-        "version": 1,
+    metadata: Metadata = {
+        "version": VERSION,
         "created": timestamp.isoformat(),
         "hostname": get_hostname(),
         "manifest": [str(build) for build in builds],
+        "contents": [content.value for content in contents],
+        "members": list(members),
     }
+    if summary is not None:
+        metadata["summary"] = summary
+
+    return metadata
+
+
+def member_table(metadata: Metadata) -> list[Member]:
+    """Return the member table of the archive given its metadata
+
+    Raise ReadError if the archive's version is not supported.
+    """
+    version = metadata["version"]
+
+    if version == 1:
+        return V1_MEMBERS
+
+    if version == VERSION:
+        return metadata.get("members", [])
+
+    raise tar.ReadError(f"Unsupported archive version: {version}")
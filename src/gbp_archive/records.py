@@ -1,51 +1,84 @@
 """Utilities for restoring gbp dumps"""
 
 import datetime as dt
-from dataclasses import asdict
-from typing import IO, Iterable
+from typing import IO, Any, Iterable
 
 import orjson
 from gentoo_build_publisher import publisher
 from gentoo_build_publisher.records import BuildRecord
 from gentoo_build_publisher.types import Build
 
-from gbp_archive.types import DumpCallback
-from gbp_archive.utils import convert_to, decode_to
+from gbp_archive import codec
+from gbp_archive.staging import Stage
+from gbp_archive.types import DumpCallback, DumpOptions, RestoreOptions
+from gbp_archive.utils import convert_to
 
 ARCHIVE_NAME = "records.json"
+MEMBER_TYPE = "records"
+CODEC = "json"
 
 
 def dump(
-    builds: Iterable[Build], outfile: IO[bytes], *, callback: DumpCallback
+    builds: Iterable[Build],
+    outfile: IO[bytes],
+    *,
+    callback: DumpCallback,
+    options: DumpOptions = DumpOptions(),  # pylint: disable=unused-argument
 ) -> None:
     """Dump the given builds as JSON to the given file"""
     for build in (builds := list(builds)):
         callback("dump", "records", build)
 
     records = [publisher.repo.build_records.get(build) for build in builds]
-    build_list = [asdict(record) for record in records]
+    encode = codec.encoder(BuildRecord)
+    build_list = [encode(record) for record in records]
 
     serialized = orjson.dumps(build_list)  # pylint: disable=no-member
     outfile.write(serialized)
 
 
-def restore(infile: IO[bytes], *, callback: DumpCallback) -> list[BuildRecord]:
+def restore(
+    infile: IO[bytes],
+    *,
+    callback: DumpCallback,
+    options: RestoreOptions = RestoreOptions(),  # pylint: disable=unused-argument
+    stage: Stage | None = None,
+) -> list[BuildRecord]:
     """Restore the JSON given in the infile to BuildRecords in the given RecordDB
 
+    If a Stage is given, the records are instead handed to it to be saved when their
+    builds are committed.
+
     Return the restored records
     """
     restore_list: list[BuildRecord] = []
+    decode = codec.decoder(BuildRecord)
 
     items = orjson.loads(infile.read())  # pylint: disable=no-member
     for item in items:
-        record = decode_to(BuildRecord, item)
+        record = decode(item)
         callback("restore", "records", record)
-        record = publisher.repo.build_records.save(record)
+        if stage is None:
+            record = publisher.repo.build_records.save(record)
+        else:
+            stage.add_record(record)
         restore_list.append(record)
 
     return restore_list
 
 
+def load_builds(data: bytes) -> list[Build]:
+    """Return the Builds of the given (serialized) records"""
+    items = orjson.loads(data)  # pylint: disable=no-member
+
+    return [record_build(item) for item in items]
+
+
+def record_build(item: dict[str, Any]) -> Build:
+    """Return the Build of the given (deserialized) record"""
+    return Build(machine=item["machine"], build_id=item["build_id"])
+
+
 @convert_to(BuildRecord, "built")
 @convert_to(BuildRecord, "completed")
 @convert_to(BuildRecord, "submitted")
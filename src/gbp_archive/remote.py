@@ -0,0 +1,510 @@
+"""Dumps to, and restores from, URLs
+
+Archives are read from HTTP(S) servers that support range requests, as do S3-compatible
+object stores, and written to S3-compatible object stores with multipart upload.
+Requests are signed (with AWS Signature Version 4) when the AWS_ACCESS_KEY_ID and
+AWS_SECRET_ACCESS_KEY environment variables are set and are otherwise sent unsigned, as
+for public buckets and plain web servers.
+
+The reader is seekable, so the archive's metadata is found by reading only the headers
+of the members before it, and members that aren't needed, as when an archive is listed
+or inspected, are skipped over. The members that are restored are fetched as ranges,
+several at a time. They are read whole, as their digests are verified, so a restore of
+only some of the Content types still downloads the whole storage member.
+"""
+
+import concurrent.futures as cf
+import datetime as dt
+import functools
+import hashlib
+import hmac
+import io
+import os
+import urllib.error
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree as ET
+from collections import deque
+from dataclasses import dataclass
+from email.message import Message
+from types import TracebackType
+from typing import IO, TYPE_CHECKING, Literal, NamedTuple, Self, cast
+
+if TYPE_CHECKING:  # pragma: no cover
+    from collections.abc import Buffer
+
+CHUNK_SIZE = 8 * 1024 * 1024
+"""Size of the ranges fetched when an archive is read from start to end"""
+
+WINDOW_SIZE = 64 * 1024
+"""Size of the range fetched after a seek, for example to read a member's header"""
+
+PART_SIZE = 8 * 1024 * 1024
+"""Size of the parts of a multipart upload. S3 requires at least 5MiB"""
+
+CONCURRENCY = 4
+"""Number of ranges fetched, or parts uploaded, at a time"""
+
+SCHEMES = ("http", "https")
+
+
+class RemoteError(OSError):
+    """A request to an archive's URL failed"""
+
+
+class Response(NamedTuple):
+    """The response to a request"""
+
+    status: int
+    headers: Message
+    body: bytes
+
+
+class Segment(NamedTuple):
+    """A range of a remote file, being fetched"""
+
+    start: int
+    end: int
+    data: "cf.Future[bytes]"
+
+
+@dataclass(frozen=True)
+class Credentials:
+    """Credentials for signing requests to an S3-compatible object store"""
+
+    access_key: str
+    secret_key: str
+    region: str = "us-east-1"
+    session_token: str | None = None
+
+    @classmethod
+    def from_environ(cls) -> Self | None:
+        """Return the credentials given by the AWS_* environment variables
+
+        Return None if there aren't any.
+        """
+        access_key = os.environ.get("AWS_ACCESS_KEY_ID")
+        secret_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+
+        if not (access_key and secret_key):
+            return None
+
+        region = os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION")
+
+        return cls(
+            access_key,
+            secret_key,
+            region=region or "us-east-1",
+            session_token=os.environ.get("AWS_SESSION_TOKEN"),
+        )
+
+    def sign(
+        self,
+        req: urllib.request.Request,
+        payload: bytes = b"",
+        *,
+        now: dt.datetime | None = None,
+    ) -> None:
+        """Sign the given request (for S3) by adding AWS Signature Version 4 headers"""
+        now = now or dt.datetime.now(tz=dt.UTC)
+        timestamp = now.strftime("%Y%m%dT%H%M%SZ")
+        scope = f"{timestamp[:8]}/{self.region}/s3/aws4_request"
+        payload_hash = hashlib.sha256(payload).hexdigest()
+        req.add_header("X-Amz-Date", timestamp)
+        req.add_header("X-Amz-Content-Sha256", payload_hash)
+
+        if self.session_token:
+            req.add_header("X-Amz-Security-Token", self.session_token)
+
+        url = urllib.parse.urlsplit(req.full_url)
+        headers = {"host": url.netloc}
+        headers.update(
+            (name.lower(), value.strip()) for name, value in req.header_items()
+        )
+        signed_headers = ";".join(sorted(headers))
+        canonical_request = "\n".join(
+            [
+                req.get_method(),
+                url.path or "/",
+                canonical_query(url.query),
+                *(f"{name}:{headers[name]}" for name in sorted(headers)),
+                "",
+                signed_headers,
+                payload_hash,
+            ]
+        )
+        string_to_sign = "\n".join(
+            [
+                "AWS4-HMAC-SHA256",
+                timestamp,
+                scope,
+                hashlib.sha256(canonical_request.encode()).hexdigest(),
+            ]
+        )
+        key = f"AWS4{self.secret_key}".encode()
+
+        for part in scope.split("/"):
+            key = hmac.digest(key, part.encode(), "sha256")
+
+        signature = hmac.digest(key, string_to_sign.encode(), "sha256").hex()
+        req.add_header(
+            "Authorization",
+            f"AWS4-HMAC-SHA256 Credential={self.access_key}/{scope},"
+            f" SignedHeaders={signed_headers}, Signature={signature}",
+        )
+
+
+def canonical_query(query: str) -> str:
+    """Return the given query string in its canonical (for signing) form"""
+    params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    quote = functools.partial(urllib.parse.quote, safe="-_.~")
+
+    return "&".join(f"{quote(name)}={quote(value)}" for name, value in sorted(params))
+
+
+def is_url(name: str) -> bool:
+    """Return True if the given archive name is a URL rather than a path"""
+    return urllib.parse.urlsplit(name).scheme in SCHEMES
+
+
+def open_archive(name: str, mode: Literal["rb", "wb"]) -> IO[bytes]:
+    """Open the archive with the given path or URL for reading or writing"""
+    if not is_url(name):
+        # pylint: disable=consider-using-with
+        return open(name, "rb") if mode == "rb" else open(name, "wb")
+
+    credentials = Credentials.from_environ()
+
+    if mode == "rb":
+        reader = RangeReader(name, credentials=credentials)
+        return cast(IO[bytes], io.BufferedReader(reader))
+
+    return cast(IO[bytes], MultipartWriter(name, credentials=credentials))
+
+
+def request(
+    url: str,
+    method: str = "GET",
+    *,
+    data: bytes = b"",
+    headers: dict[str, str] | None = None,
+    credentials: Credentials | None = None,
+) -> Response:
+    """Send a request to the given URL and return the response
+
+    Raise RemoteError if the request fails.
+    """
+    req = urllib.request.Request(
+        url, data=data or None, headers=headers or {}, method=method
+    )
+
+    if credentials is not None:
+        credentials.sign(req, data)
+
+    try:
+        with urllib.request.urlopen(req) as response:
+            return Response(response.status, response.headers, response.read())
+    except urllib.error.HTTPError as error:
+        raise RemoteError(
+            f"{method} {url} failed: {error.code} {error.reason}"
+        ) from None
+    except urllib.error.URLError as error:
+        raise RemoteError(f"{method} {url} failed: {error.reason}") from None
+
+
+class RangeReader(io.RawIOBase):  # pylint: disable=too-many-instance-attributes
+    """Seekable reader of a file at a URL, using range requests
+
+    Reading from start to end, the chunks ahead are fetched a few at a time. After a
+    seek, only a window is fetched, in case it is followed by another seek.
+    """
+
+    # Besides its settings, the reader keeps its position and the fetches in flight
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        credentials: Credentials | None = None,
+        chunk_size: int = CHUNK_SIZE,
+        window_size: int = WINDOW_SIZE,
+    ) -> None:
+        super().__init__()
+        self.url = url
+        self.credentials = credentials
+        self.chunk_size = chunk_size
+        self.window_size = window_size
+        response = request(url, "HEAD", credentials=credentials)
+        self.size = int(response.headers["Content-Length"])
+        self.position = 0
+
+        # The segments being fetched, in order, and the end of the last one
+        self.segments: deque[Segment] = deque()
+        self.fetched_to = -1
+        self.streaming = False
+        self.executor = cf.ThreadPoolExecutor(CONCURRENCY)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        match whence:
+            case io.SEEK_SET:
+                position = offset
+            case io.SEEK_CUR:
+                position = self.position + offset
+            case io.SEEK_END:
+                position = self.size + offset
+            case _:
+                raise ValueError(f"Invalid whence: {whence}")
+
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+
+        self.position = position
+
+        return position
+
+    def readinto(self, buffer: "Buffer") -> int:
+        if self.position >= self.size:
+            return 0
+
+        segment = self.segment()
+        data = memoryview(segment.data.result())
+        view = memoryview(buffer).cast("B")
+        offset = self.position - segment.start
+        size = min(len(view), len(data) - offset)
+        view[:size] = data[offset : offset + size]
+        self.position += size
+
+        return size
+
+    def close(self) -> None:
+        if not self.closed:
+            self.executor.shutdown(cancel_futures=True)
+            self.segments.clear()
+        super().close()
+
+    def segment(self) -> Segment:
+        """Return the segment holding the current position, fetching it if need be"""
+        segments = self.segments
+        position = self.position
+
+        while segments and segments[0].end <= position:
+            segments.popleft()
+
+        if segments and segments[0].start <= position:
+            if self.streaming:
+                self.read_ahead()
+            return segments[0]
+
+        # We read on from the last segment fetched. Otherwise we have seeked
+        self.streaming = position == self.fetched_to
+
+        for segment in segments:
+            segment.data.cancel()
+        segments.clear()
+
+        if self.streaming:
+            self.read_ahead()
+        else:
+            self.fetch(position, min(position + self.window_size, self.size))
+
+        return segments[0]
+
+    def read_ahead(self) -> None:
+        """Fetch the chunks ahead so that there are concurrency segments in flight"""
+        start = self.segments[-1].end if self.segments else self.position
+
+        while len(self.segments) < CONCURRENCY and start < self.size:
+            end = min(start + self.chunk_size, self.size)
+            self.fetch(start, end)
+            start = end
+
+    def fetch(self, start: int, end: int) -> None:
+        """Start fetching the given range"""
+        future = self.executor.submit(self.get_range, start, end)
+        self.segments.append(Segment(start, end, future))
+        self.fetched_to = end
+
+    def get_range(self, start: int, end: int) -> bytes:
+        """Return the given range of the file
+
+        Raise RemoteError if the server doesn't return the range.
+        """
+        response = request(
+            self.url,
+            headers={"Range": f"bytes={start}-{end - 1}"},
+            credentials=self.credentials,
+        )
+
+        if response.status != 206 or len(response.body) != end - start:
+            raise RemoteError(f"{self.url} does not support range requests")
+
+        return response.body
+
+
+class MultipartWriter(io.RawIOBase):  # pylint: disable=too-many-instance-attributes
+    """Writer of a file to an S3-compatible object store, using multipart upload
+
+    What is written is uploaded in parts, a few at a time. The upload is completed when
+    the writer is closed, or exits a with statement, cleanly. When it exits a with
+    statement that raised, or is garbage collected without having been closed, the
+    upload is aborted instead, so that no partial file is left behind.
+    """
+
+    # Besides its settings, the writer keeps the upload's state and its parts
+
+    state: Literal["uploading", "completed", "aborted"] | None = None
+    """The state of the upload. None if it failed to start"""
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        credentials: Credentials | None = None,
+        part_size: int = PART_SIZE,
+    ) -> None:
+        super().__init__()
+        self.url = url
+        self.credentials = credentials
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts: list[cf.Future[str]] = []
+        response = request(f"{url}?uploads", "POST", credentials=credentials)
+        upload_id = ET.fromstring(response.body).findtext("{*}UploadId")
+
+        if not upload_id:
+            raise RemoteError(f"{url} did not start a multipart upload")
+
+        self.upload_id = upload_id
+        self.executor = cf.ThreadPoolExecutor(CONCURRENCY)
+        self.state = "uploading"
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: "Buffer") -> int:
+        view = memoryview(data).cast("B")
+        self.buffer += view
+
+        while len(self.buffer) >= self.part_size:
+            self.upload(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+
+        return len(view)
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self) -> None:
+        # io.IOBase's would close(), and so complete, an upload that was left unfinished
+        self.abort()
+
+    def close(self) -> None:
+        """Complete the upload, unless it has been aborted, and close the writer
+
+        If completing the upload fails, it is aborted.
+        """
+        if self.state != "uploading":
+            super().close()
+            return
+
+        try:
+            self.complete()
+            self.state = "completed"
+        except BaseException:
+            # Otherwise the parts that were uploaded are kept, and billed for
+            self.abort()
+            raise
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            super().close()
+
+    def abort(self) -> None:
+        """Abort the upload, discarding the parts uploaded, and close the writer"""
+        if self.state != "uploading":
+            super().close()
+            return
+
+        self.state = "aborted"
+        self.executor.shutdown(cancel_futures=True)
+
+        try:
+            request(self.part_url(), "DELETE", credentials=self.credentials)
+        finally:
+            super().close()
+
+    def upload(self, data: bytes) -> None:
+        """Upload the given data as the next part
+
+        The number of parts held in memory is bounded by waiting for an upload to
+        finish when concurrency parts are already being uploaded. Raise RemoteError if
+        an upload failed.
+        """
+        pending = [part for part in self.parts if not part.done()]
+
+        if len(pending) >= CONCURRENCY:
+            cf.wait(pending, return_when=cf.FIRST_COMPLETED)
+
+        for part in self.parts:
+            if part.done():
+                part.result()
+
+        number = len(self.parts) + 1
+        self.parts.append(self.executor.submit(self.upload_part, number, data))
+
+    def upload_part(self, number: int, data: bytes) -> str:
+        """Upload the given part. Return its ETag"""
+        response = request(
+            self.part_url(number), "PUT", data=data, credentials=self.credentials
+        )
+
+        return response.headers["ETag"]
+
+    def complete(self) -> None:
+        """Upload what's left and complete the upload
+
+        Raise RemoteError if the upload failed.
+        """
+        if self.buffer or not self.parts:
+            self.upload(bytes(self.buffer))
+            self.buffer.clear()
+
+        root = ET.Element("CompleteMultipartUpload")
+
+        for number, part in enumerate(self.parts, start=1):
+            element = ET.SubElement(root, "Part")
+            ET.SubElement(element, "PartNumber").text = str(number)
+            ET.SubElement(element, "ETag").text = part.result()
+
+        response = request(
+            self.part_url(),
+            "POST",
+            data=ET.tostring(root),
+            credentials=self.credentials,
+        )
+
+        # S3 may report that completing failed in the body of a 200 response
+        if response.body and ET.fromstring(response.body).tag.endswith("Error"):
+            raise RemoteError(f"{self.url} failed to complete the upload")
+
+    def part_url(self, number: int | None = None) -> str:
+        """Return the URL of the given part of the upload, or of the upload itself"""
+        upload_id = urllib.parse.quote(self.upload_id, safe="")
+
+        if number is None:
+            return f"{self.url}?uploadId={upload_id}"
+
+        return f"{self.url}?partNumber={number}&uploadId={upload_id}"
@@ -0,0 +1,718 @@
+"""Merge, filter, split and consolidate archives
+
+These work directly on the archives' members, as streams. Builds are never restored so
+neither the instance's storage nor its database is touched. The only files written,
+besides the output archives, are temporary ones.
+"""
+
+import datetime as dt
+import functools
+import io
+import shutil
+import tarfile as tar
+import tempfile
+from contextlib import ExitStack
+from pathlib import Path
+from typing import IO, Any, Callable, Iterable, Iterator, Sequence, cast
+
+import orjson
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+from gentoo_build_publisher.utils import time
+
+from gbp_archive import compression, delta, metadata, records, storage
+from gbp_archive.core import (
+    ITEMS_BY_TYPE,
+    add_member,
+    check_member,
+    make_member,
+    member_reader,
+    read_metadata,
+    verify_member,
+)
+from gbp_archive.summary import is_binpkg
+from gbp_archive.types import BuildSummary, Member, Metadata, Summary
+from gbp_archive.utils import (
+    DigestWriter,
+    build_sort_key,
+    tarfile_add,
+    tarfile_extract,
+    tarfile_members,
+    tarfile_next,
+)
+
+BuildSelector = Callable[[Build], bool]
+Router = Callable[[Build], "Output | None"]
+"""Return the Output that the given build is copied to, or None to not copy it"""
+Rescanner = Callable[[Member], Iterator[tar.TarInfo]]
+"""Yield the headers of the given storage member of an archive being copied"""
+DATA_HEADERS = (
+    storage.DIGEST_HEADER,
+    compression.HEADER,
+    compression.SIZE_HEADER,
+    delta.HEADER,
+)
+"""pax headers that describe a regular file's data"""
+
+
+def select_all(_build: Build) -> bool:
+    """Default BuildSelector. Selects every build"""
+    return True
+
+
+def select_builds(specs: Iterable[str]) -> BuildSelector:
+    """Return a BuildSelector for the given specs
+
+    Each spec is either a machine name, selecting all of the machine's builds, or a
+    build id ("machine.build_id").
+    """
+    specs = set(specs)
+
+    def select(build: Build) -> bool:
+        return build.machine in specs or str(build) in specs
+
+    return select
+
+
+def select_existing(build: Build) -> bool:
+    """BuildSelector selecting the builds that (still) exist in the instance's records"""
+    return publisher.repo.build_records.exists(build)
+
+
+def copy(
+    infiles: Iterable[IO[bytes]],
+    outfile: IO[bytes],
+    *,
+    select: BuildSelector = select_all,
+) -> list[Build]:
+    """Copy the selected builds from the given archives to a new archive in outfile
+
+    This is both merge and filter. If a build is in more than one of the archives then
+    it is taken from the first. Hard links between the copied builds are kept. Where a
+    hard link's target was not copied the first such link becomes a regular file.
+
+    Return the (sorted) list of builds copied.
+    """
+    with ExitStack() as stack:
+        output = Output(stack)
+        copied: set[str] = set()
+
+        def route(build: Build) -> Output | None:
+            return output if str(build) not in copied and select(build) else None
+
+        for infile in infiles:
+            copy_archive(infile, route)
+            copied.update(str(build) for build in output.builds)
+
+        return output.write(outfile)
+
+
+def merge(infiles: Iterable[IO[bytes]], outfile: IO[bytes]) -> list[Build]:
+    """Merge the given archives into a new archive in outfile
+
+    Return the (sorted) list of builds in the new archive.
+    """
+    return copy(infiles, outfile)
+
+
+def consolidate(
+    chain: Sequence[IO[bytes]],
+    outfile: IO[bytes],
+    *,
+    select: BuildSelector = select_all,
+) -> list[Build]:
+    """Consolidate the given chain of archives into a new (full) archive in outfile
+
+    The chain is a base archive followed by its incrementals, oldest first. Builds that
+    are in more than one of the archives, and tags, are taken from the newest. Pass
+    select_existing as select in order to drop builds that have since been purged from
+    the instance.
+
+    Return the (sorted) list of builds in the new archive.
+    """
+    return copy(reversed(chain), outfile, select=select)
+
+
+def chain_order(paths: Iterable[Path]) -> list[Path]:
+    """Return the given archives sorted by when they were created, oldest first"""
+    return sorted(paths, key=created)
+
+
+def expire(chain: Iterable[Path], keep: int) -> list[Path]:
+    """Remove all but the newest keep archives of the given chain
+
+    This is the retention policy for the links of a chain that has been consolidated.
+    Return the paths removed.
+    """
+    chain = chain_order(chain)
+    expired = chain[: max(len(chain) - keep, 0)]
+
+    for path in expired:
+        path.unlink()
+
+    return expired
+
+
+def created(path: Path) -> dt.datetime:
+    """Return the creation time of the archive at the given path"""
+    with path.open("rb") as fp:
+        return dt.datetime.fromisoformat(read_metadata(fp)["created"])
+
+
+def split(infile: IO[bytes], directory: Path) -> list[Path]:
+    """Split the given archive into an archive per machine in the given directory
+
+    The archives are named "<machine>.tar". The infile is read once, so need not be
+    seekable unless it is a reproducible archive. Return the paths of the archives
+    written.
+    """
+    with ExitStack() as stack:
+        outputs: dict[str, Output] = {}
+
+        def route(build: Build) -> Output:
+            if (output := outputs.get(build.machine)) is None:
+                output = outputs[build.machine] = Output(stack)
+            return output
+
+        copy_archive(infile, route)
+        paths: list[Path] = []
+
+        for machine, output in sorted(outputs.items()):
+            path = directory / f"{machine}.tar"
+            with open(path, "wb") as outfile:
+                output.write(outfile)
+            paths.append(path)
+
+    return paths
+
+
+def copy_archive(infile: IO[bytes], route: Router) -> Metadata:
+    """Copy the builds of the given archive to the Outputs that they are routed to
+
+    Builds routed to None are not copied. Return the archive's Metadata.
+
+    The metadata of reproducible archives is at the end so these are read twice and
+    must be seekable. Raise ReadError if they are not.
+    """
+    start = infile.tell() if infile.seekable() else None
+    rescan = (
+        None if start is None else functools.partial(storage_headers, infile, start)
+    )
+
+    with tar.open(fileobj=infile, mode="r|") as tarfile:
+        tarinfo = tarfile_next(tarfile)
+
+        if tarinfo.name == metadata.ARCHIVE_NAME:
+            m = metadata.restore(tarfile_extract(tarfile, tarinfo), callback=None)
+            copy_members(tarfile, m, route, rescan)
+            return m
+
+    if start is None:
+        raise tar.ReadError("Reproducible archives must be seekable to be copied")
+
+    infile.seek(start)
+    m = read_metadata(infile)
+    infile.seek(start)
+
+    with tar.open(fileobj=infile, mode="r|") as tarfile:
+        copy_members(tarfile, m, route, rescan)
+
+    return m
+
+
+def copy_members(
+    tarfile: tar.TarFile, m: Metadata, route: Router, rescan: Rescanner | None
+) -> None:
+    """Copy the routed builds from the (remaining) members of the tarfile
+
+    m is the archive's Metadata. If the archive can be read again, rescan returns the
+    headers of the given member's storage archive. See copy_archive(). Raise ReadError
+    if a member listed in the archive's member table is missing, is corrupt or can't be
+    decoded. Members of unknown types are dropped.
+    """
+    table = {member["name"]: member for member in metadata.member_table(m)}
+    manifest = [Build.from_id(build_id) for build_id in m["manifest"]]
+    routes = {str(b): output for b in manifest if (output := route(b)) is not None}
+    contents = m.get("contents", [content.value for content in Content])
+
+    for build in manifest:
+        if (output := routes.get(str(build))) is not None:
+            output.add(build, contents)
+
+    for tarinfo in tarfile_members(tarfile):
+        if (member := table.pop(tarinfo.name, None)) is None:
+            continue
+
+        if (item := ITEMS_BY_TYPE.get(member["type"])) is None:
+            continue
+
+        check_member(member, item.CODEC)
+        reader = member_reader(tarfile_extract(tarfile, tarinfo), member)
+
+        if item is records:
+            copy_records(reader.read(), routes)
+        else:
+            headers = None if rescan is None else functools.partial(rescan, member)
+            copy_storage(cast(IO[bytes], reader), manifest, routes, headers)
+
+        verify_member(reader, member)
+
+    if table:
+        raise tar.ReadError(f"Archive members missing: {', '.join(table)}")
+
+
+def copy_records(data: bytes, routes: dict[str, "Output"]) -> None:
+    """Copy the routed builds' records from the given (serialized) records"""
+    for record in orjson.loads(data):  # pylint: disable=no-member
+        if (output := routes.get(str(records.record_build(record)))) is not None:
+            output.record_list.append(record)
+
+
+def copy_storage(
+    fp: IO[bytes],
+    manifest: list[Build],
+    routes: dict[str, "Output"],
+    headers: Callable[[], Iterator[tar.TarInfo]] | None = None,
+) -> None:
+    """Copy the routed builds from the storage archive in the given file
+
+    manifest is the list of all the builds in the storage archive and routes the
+    Outputs of those to copy, by build id. Members of builds that aren't copied are
+    handed to the StorageCopier of the machine's copied builds, if any, for the hard
+    links and deltas of those. If given, headers returns the headers of the storage
+    archive, read ahead of the copy, so that the copiers need only hold on to the files
+    that they will need.
+    """
+    all_ids = {str(build) for build in manifest}
+    machines: dict[str, StorageCopier] = {}
+
+    for build in manifest:
+        if (output := routes.get(str(build))) is not None:
+            machines[build.machine] = output.copier
+
+    for machine_copier in set(machines.values()):
+        build_ids = {i for i, o in routes.items() if o.copier is machine_copier}
+        machine_copier.start(manifest, build_ids)
+        if machine_copier.partial and headers is not None:
+            machine_copier.plan(headers())
+
+    with tar.open(fileobj=fp, mode="r|") as tarfile:
+        for tarinfo in tarfile_members(tarfile):
+            if (build_id := member_build_id(tarinfo, all_ids)) is None:
+                continue
+
+            if (copier := machines.get(Build.from_id(build_id).machine)) is not None:
+                copier.visit(tarfile, tarinfo, build_id)
+
+
+def storage_headers(
+    infile: IO[bytes], start: int, member: Member
+) -> Iterator[tar.TarInfo]:
+    """Yield the headers of the given storage member of the archive in infile
+
+    The archive starts at start in the (seekable) infile. The infile is left where it
+    was once the headers have all been read.
+    """
+    position = infile.tell()
+    infile.seek(start)
+
+    try:
+        with tar.open(fileobj=infile, mode="r:") as tarfile:
+            fp = tarfile_extract(tarfile, member["name"])
+            with tar.open(fileobj=fp, mode="r:") as storage_tarfile:
+                yield from tarfile_members(storage_tarfile)
+    finally:
+        infile.seek(position)
+
+
+class Output:
+    """A new archive that builds are copied to
+
+    The archive's storage is copied to a temporary file as its builds are copied. The
+    archive is written once all of its builds have been.
+    """
+
+    def __init__(self, stack: ExitStack) -> None:
+        self.builds: list[Build] = []
+        self.record_list: list[dict[str, Any]] = []
+        self.contents: set[str] = set()
+
+        self.storage_fp = stack.enter_context(tempfile.TemporaryFile(mode="w+b"))
+        self.storage_writer = DigestWriter(self.storage_fp)
+        self.tarfile = stack.enter_context(
+            tar.open(  # pylint: disable=consider-using-with
+                fileobj=cast(IO[bytes], self.storage_writer), mode="w|"
+            )
+        )
+        spool = stack.enter_context(tempfile.TemporaryFile(mode="w+b"))
+        self.copier = StorageCopier(self.tarfile, spool)
+
+    def add(self, build: Build, contents: Iterable[str]) -> None:
+        """Add the given build, of an archive of the given contents, to the archive
+
+        Its records and storage are copied separately.
+        """
+        self.builds.append(build)
+        self.contents.update(contents)
+
+    def write(self, outfile: IO[bytes]) -> list[Build]:
+        """Write the archive of the builds copied to the given file
+
+        Return the (sorted) list of its builds.
+        """
+        self.tarfile.close()
+        builds = sorted(self.builds, key=build_sort_key)
+        record_list = sorted(
+            self.record_list,
+            key=lambda item: build_sort_key(records.record_build(item)),
+        )
+
+        with ExitStack() as stack:
+            records_fp = stack.enter_context(tempfile.TemporaryFile(mode="w+b"))
+            records_writer = DigestWriter(records_fp)
+            records_writer.write(orjson.dumps(record_list))  # pylint: disable=no-member
+
+            table = [
+                make_member(records, records_writer),
+                make_member(storage, self.storage_writer),
+            ]
+            new_metadata = metadata.create(
+                builds,
+                timestamp=time.localtime(),
+                summary=self.copier.summary(builds),
+                contents=[c for c in Content if c.value in self.contents],
+                members=table,
+            )
+
+            with tar.open(fileobj=outfile, mode="w|") as tarfile:
+                fp = stack.enter_context(tempfile.TemporaryFile(mode="w+b"))
+                metadata.write(new_metadata, fp)
+                add_member(tarfile, metadata.ARCHIVE_NAME, fp)
+                add_member(tarfile, records.ARCHIVE_NAME, records_fp)
+                add_member(tarfile, storage.ARCHIVE_NAME, self.storage_fp)
+
+        return builds
+
+
+class StorageCopier:  # pylint: disable=too-many-instance-attributes
+    """Copy the storage of selected builds from storage archives to a tarfile
+
+    Also keeps a tally of what has been copied, in order to summarize it.
+    """
+
+    # The state is that of the copy so far, kept between members of the stream
+
+    def __init__(self, tarfile: tar.TarFile, spool: IO[bytes]) -> None:
+        self.tarfile = tarfile
+        self.spool = spool
+
+        # Ids of the builds to copy from the current storage archive
+        self.build_ids: set[str] = set()
+
+        # Machines of the current storage archive whose builds are only partly copied
+        self.partial: set[str] = set()
+
+        # Regular files of the partly copied machines that hard links or delta files
+        # will need. None if not known, in which case they are all held in the spool
+        self.needed: set[str] | None = None
+
+        # Sizes of the regular files copied, by name
+        self.files: dict[str, int] = {}
+
+        # Regular files not copied but which copied hard links may point to. Their data
+        # is held in the spool
+        self.dropped: set[str] = set()
+
+        # Regular files held in the spool. Values are the TarInfo and offset in the spool
+        self.spooled: dict[str, tuple[tar.TarInfo, int]] = {}
+
+        # Hard links of the machines whose builds are only partly copied, and their
+        # targets. Delta bases are looked up through them
+        self.links: dict[str, str] = {}
+
+        # Names of the hard links copied
+        self.linked: set[str] = set()
+
+        # Dropped files which have been copied as regular files. Values are the names
+        # that they were copied as
+        self.copied_as: dict[str, str] = {}
+
+        # Names of the tags copied. A tag may be in more than one archive but only the
+        # first one is copied
+        self.tags: set[str] = set()
+
+        # The inodes (names of regular files) of each copied build
+        self.inodes: dict[str, set[str]] = {}
+        self.build_summaries: dict[str, BuildSummary] = {}
+        self.totals: Summary = {"builds": {}, "size": 0, "files": 0, "inodes": 0}
+
+    def start(self, manifest: list[Build], build_ids: set[str]) -> None:
+        """Start copying the given builds from a storage archive
+
+        manifest is the list of all the builds in the storage archive. build_ids are
+        the ids of those to copy.
+
+        Where only some of a machine's builds are copied, the machine's regular files
+        are held in the spool, unless plan() says they are not needed. Copied delta
+        files whose bases aren't copied are then rebuilt from the spool and copied in
+        full.
+        """
+        # Hard links, and deltas, don't span storage archives
+        self.spool.seek(0)
+        self.spool.truncate()
+        self.dropped.clear()
+        self.spooled.clear()
+        self.links.clear()
+        self.copied_as.clear()
+        self.needed = None
+
+        self.build_ids = build_ids
+        self.partial = {b.machine for b in manifest if str(b) in build_ids} & {
+            b.machine for b in manifest if str(b) not in build_ids
+        }
+
+    def plan(self, headers: Iterable[tar.TarInfo]) -> None:
+        """Work out which regular files to hold given the storage archive's headers
+
+        These are the targets of the copied hard links and the bases of the copied
+        delta files, and in turn the targets and bases of those.
+        """
+        links: dict[str, str] = {}
+        wanted: list[str] = []
+
+        for tarinfo in headers:
+            if tarinfo.islnk():
+                links[tarinfo.name] = tarinfo.linkname
+            elif delta.is_delta(tarinfo):
+                links[tarinfo.name] = tarinfo.pax_headers[delta.HEADER]
+            else:
+                continue
+
+            if member_build_id(tarinfo, self.build_ids) is not None:
+                wanted.append(links[tarinfo.name])
+
+        needed: set[str] = set()
+
+        while wanted:
+            if (name := wanted.pop()) in needed:
+                continue
+            needed.add(name)
+            if (target := links.get(name)) is not None:
+                wanted.append(target)
+
+        self.needed = needed
+
+    def visit(self, tarfile: tar.TarFile, tarinfo: tar.TarInfo, build_id: str) -> None:
+        """Copy, or drop, the given member of the storage archive being copied
+
+        build_id is the id of the build that the member belongs to.
+        """
+        spool = Build.from_id(build_id).machine in self.partial
+
+        if spool and tarinfo.islnk():
+            self.links[tarinfo.name] = tarinfo.linkname
+
+        if spool and self.needed is not None:
+            spool = tarinfo.name in self.needed
+
+        if build_id in self.build_ids:
+            self.add(tarfile, tarinfo, build_id, spool=spool)
+        elif spool and tarinfo.isreg():
+            self.drop(tarfile, tarinfo)
+
+    def add(
+        self,
+        tarfile: tar.TarFile,
+        tarinfo: tar.TarInfo,
+        build_id: str,
+        *,
+        spool: bool = False,
+    ) -> None:
+        """Copy the given member of the given tarfile
+
+        If spool is True, a regular file is also held in the spool.
+        """
+        if tarinfo.issym() and tarinfo.name.count("/") == 1:
+            if tarinfo.name in self.tags:
+                return
+            self.tags.add(tarinfo.name)
+
+        if tarinfo.isreg():
+            fp = tarfile_extract(tarfile, tarinfo)
+            if spool:
+                self.hold(tarinfo, fp)
+                fp = self.spool
+            tarinfo = self.add_file(tarinfo, fp)
+        elif tarinfo.islnk():
+            tarinfo = self.add_link(tarinfo)
+        else:
+            tarfile_add(self.tarfile, tarinfo)
+
+        self.tally(tarinfo, build_id)
+
+    def add_link(self, tarinfo: tar.TarInfo) -> tar.TarInfo:
+        """Copy the given hard link, returning the TarInfo that was written
+
+        If the link's target was dropped then the first link to it is copied as a
+        regular file. Raise ReadError if the target is not in the archive.
+        """
+        target = tarinfo.linkname
+
+        if target in self.copied_as:
+            tarinfo = tarinfo.replace(linkname=self.copied_as[target])
+        elif target in self.dropped:
+            self.dropped.remove(target)
+            dropped, offset = self.spooled[target]
+            tarinfo = tarinfo.replace(linkname="")
+            tarinfo.type = tar.REGTYPE
+            tarinfo.size = dropped.size
+            headers = {
+                key: value
+                for key, value in tarinfo.pax_headers.items()
+                if key not in ("linkpath", "size")
+            }
+            # The file's data, and so its digest, compression and delta, are the
+            # target's
+            headers.update(
+                (key, value)
+                for key, value in dropped.pax_headers.items()
+                if key in DATA_HEADERS
+            )
+            tarinfo.pax_headers = headers
+            self.spool.seek(offset)
+            tarinfo = self.add_file(tarinfo, self.spool)
+            self.copied_as[target] = tarinfo.name
+            return tarinfo
+        elif target not in self.files:
+            raise tar.ReadError(f"Link target not found: {target}")
+
+        tarfile_add(self.tarfile, tarinfo)
+        self.linked.add(tarinfo.name)
+
+        return tarinfo
+
+    def add_file(self, tarinfo: tar.TarInfo, fp: IO[bytes]) -> tar.TarInfo:
+        """Copy the given regular file, returning the TarInfo that was written
+
+        A delta file whose base wasn't copied is rebuilt, from the spool, and copied in
+        full.
+        """
+        base = tarinfo.pax_headers.get(delta.HEADER)
+
+        if base is not None and base not in self.files and base not in self.linked:
+            data = delta.decode(tarinfo, fp.read(tarinfo.size), self.file_data(base))
+            tarinfo = tarinfo.replace()
+            tarinfo.pax_headers = {
+                key: value
+                for key, value in tarinfo.pax_headers.items()
+                if key not in (delta.HEADER, compression.SIZE_HEADER)
+            }
+            tarinfo.size = len(data)
+            fp = io.BytesIO(data)
+
+        tarfile_add(self.tarfile, tarinfo, fp)
+        self.files[tarinfo.name] = compression.file_size(tarinfo)
+
+        return tarinfo
+
+    def drop(self, tarfile: tar.TarFile, tarinfo: tar.TarInfo) -> None:
+        """Don't copy the given regular file, but hold on to it for any hard links"""
+        self.hold(tarinfo, tarfile_extract(tarfile, tarinfo))
+        self.dropped.add(tarinfo.name)
+
+    def hold(self, tarinfo: tar.TarInfo, fp: IO[bytes]) -> None:
+        """Copy the given regular file's data to the spool
+
+        The spool is left at the start of the file's data.
+        """
+        offset = self.spool.seek(0, 2)
+        shutil.copyfileobj(fp, self.spool)
+        self.spooled[tarinfo.name] = (tarinfo, offset)
+        self.spool.seek(offset)
+
+    def file_data(self, name: str) -> bytes:
+        """Return the contents of the given file from the spool
+
+        Hard links are followed, the file is decompressed and, if it's a delta, rebuilt
+        from its bases. Raise ReadError if the file isn't in the spool.
+        """
+        deltas: list[tuple[tar.TarInfo, bytes]] = []
+
+        while True:
+            name = self.links.get(name, name)
+            if (entry := self.spooled.get(name)) is None:
+                raise tar.ReadError(f"Delta base not found: {name}")
+            tarinfo, offset = entry
+            self.spool.seek(offset)
+            data = self.spool.read(tarinfo.size)
+            if not delta.is_delta(tarinfo):
+                break
+            deltas.append((tarinfo, data))
+            name = tarinfo.pax_headers[delta.HEADER]
+
+        if compression.is_compressed(tarinfo):
+            data = compression.decompress(tarinfo, data)
+
+        for tarinfo, delta_data in reversed(deltas):
+            data = delta.decode(tarinfo, delta_data, data)
+
+        return data
+
+    def tally(self, tarinfo: tar.TarInfo, build_id: str) -> None:
+        """Add the given (copied) member to the summary"""
+        if not tarinfo.islnk():
+            self.totals["inodes"] += 1
+            if tarinfo.isreg():
+                self.totals["size"] += compression.file_size(tarinfo)
+                self.totals["files"] += 1
+
+        if not (tarinfo.isreg() or tarinfo.islnk()):
+            return
+
+        inode = tarinfo.linkname if tarinfo.islnk() else tarinfo.name
+        inodes = self.inodes.setdefault(build_id, set())
+
+        if inode in inodes:
+            return
+
+        inodes.add(inode)
+        build_summary = self.build_summaries.setdefault(
+            build_id, {"size": 0, "files": 0, "binpkgs": 0}
+        )
+        build_summary["size"] += self.files[inode]
+        build_summary["files"] += 1
+        build_summary["binpkgs"] += tarinfo.name.startswith(
+            f"{Content.BINPKGS.value}/"
+        ) and is_binpkg(tarinfo.name)
+
+    def summary(self, builds: Iterable[Build]) -> Summary:
+        """Return the Summary of what was copied for the given builds"""
+        summary: Summary = {**self.totals, "builds": {}}
+
+        for build in builds:
+            summary["builds"][str(build)] = self.build_summaries.get(
+                str(build), {"size": 0, "files": 0, "binpkgs": 0}
+            )
+
+        return summary
+
+
+def member_build_id(tarinfo: tar.TarInfo, build_ids: set[str]) -> str | None:
+    """Return the id of the build that the given storage archive member belongs to
+
+    build_ids are the ids of the builds in the archive. Tags are symlinks to their
+    build's directory and so belong to that build. Return None if the member doesn't
+    belong to any of the builds.
+    """
+    parts = tarinfo.name.split("/")
+
+    if len(parts) < 2:
+        return None
+
+    if parts[1] in build_ids:
+        return parts[1]
+
+    if len(parts) == 2 and tarinfo.issym() and tarinfo.linkname in build_ids:
+        return tarinfo.linkname
+
+    return None
@@ -0,0 +1,169 @@
+"""Resumable dumps
+
+A full dump can take hours and, should it fail near the end, has nothing to resume
+from. A resumable dump is instead written to a directory, as a segment per machine.
+Each segment is a dump in its own right, as `gbp archive split` would write, so the
+segments can be restored one by one or merged into one dump. Machines, rather than
+builds, are the unit because hard links only span the builds of a machine.
+
+A segment is written under a temporary name and renamed once complete. It's then
+recorded, with its builds, size and digest, in the directory's checkpoint. Resuming
+re-verifies the last segment that was checkpointed and dumps only the machines whose
+segments are missing or out of date.
+"""
+
+import itertools
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import IO, Iterable, cast
+
+from gentoo_build_publisher.types import Build
+
+from gbp_archive import core
+from gbp_archive.types import (
+    Checkpoint,
+    DumpCallback,
+    DumpOptions,
+    DumpSegment,
+    default_dump_callback,
+)
+from gbp_archive.utils import DigestReader, DigestWriter, build_sort_key
+
+CHECKPOINT_NAME = "checkpoint.json"
+
+
+def dump(
+    builds: Iterable[Build],
+    directory: Path,
+    *,
+    callback: DumpCallback = default_dump_callback,
+    options: DumpOptions = DumpOptions(),
+    resume: bool = False,
+) -> list[Path]:
+    """Dump the given builds to a segment per machine in the given directory
+
+    If resume is True, the segments of the directory's checkpoint that are intact and
+    hold the same builds (and Content types) are kept. Otherwise the dump starts over.
+    Return the paths of the dump's segments.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    checkpoint = start(directory, options, resume=resume)
+    finished = {segment["name"]: segment for segment in checkpoint["segments"]}
+    segments: list[DumpSegment] = []
+
+    for machine, group in itertools.groupby(
+        sorted(builds, key=build_sort_key), key=lambda build: build.machine
+    ):
+        machine_builds = list(group)
+        name = f"{machine}.tar"
+        segment = finished.get(name)
+
+        if segment is None or segment["builds"] != [str(b) for b in machine_builds]:
+            segment = write_segment(
+                machine_builds, directory / name, callback=callback, options=options
+            )
+            finished[name] = segment
+            checkpoint["segments"] = list(finished.values())
+            save_checkpoint(directory, checkpoint)
+
+        segments.append(segment)
+
+    checkpoint["segments"] = segments
+    save_checkpoint(directory, checkpoint)
+
+    return [directory / segment["name"] for segment in segments]
+
+
+def start(directory: Path, options: DumpOptions, *, resume: bool) -> Checkpoint:
+    """Return the checkpoint to start the dump from
+
+    When resuming, the last segment checkpointed is dropped if it's not intact. If not
+    resuming, or the checkpoint was for other Content types, start afresh.
+    """
+    contents = [content.value for content in options.contents]
+    checkpoint = load_checkpoint(directory) if resume else None
+
+    if checkpoint is None or checkpoint["contents"] != contents:
+        return {"contents": contents, "segments": []}
+
+    if checkpoint["segments"] and not verify_segment(
+        directory, checkpoint["segments"][-1]
+    ):
+        checkpoint["segments"].pop()
+
+    return checkpoint
+
+
+def write_segment(
+    builds: list[Build],
+    path: Path,
+    *,
+    callback: DumpCallback = default_dump_callback,
+    options: DumpOptions = DumpOptions(),
+) -> DumpSegment:
+    """Dump the given builds to the given path and return its segment
+
+    The dump is written next to the path and only renamed to it once complete, and
+    synced, so a segment is never left half-written.
+    """
+    partial = path.with_name(f".{path.name}.partial")
+
+    try:
+        with open(partial, "wb") as fp:
+            writer = DigestWriter(fp)
+            core.dump(
+                builds, cast(IO[bytes], writer), callback=callback, options=options
+            )
+            fp.flush()
+            os.fsync(fp.fileno())
+    except BaseException:
+        partial.unlink(missing_ok=True)
+        raise
+
+    os.replace(partial, path)
+
+    return {
+        "name": path.name,
+        "builds": [str(build) for build in builds],
+        "size": writer.size,
+        "digest": writer.digest,
+    }
+
+
+def verify_segment(directory: Path, segment: DumpSegment) -> bool:
+    """Return True if the given segment's file is intact"""
+    try:
+        with open(directory / segment["name"], "rb") as fp:
+            reader = DigestReader(fp)
+            reader.drain()
+    except FileNotFoundError:
+        return False
+
+    return reader.size == segment["size"] and reader.digest == segment["digest"]
+
+
+def load_checkpoint(directory: Path) -> Checkpoint | None:
+    """Return the checkpoint of the given directory, or None if it has none"""
+    try:
+        with open(directory / CHECKPOINT_NAME, "rb") as fp:
+            return cast(Checkpoint, json.load(fp))
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(directory: Path, checkpoint: Checkpoint) -> None:
+    """Write the given checkpoint to the given directory
+
+    The checkpoint is replaced atomically so that a failed dump never leaves behind a
+    partially written one.
+    """
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=".")
+
+    with os.fdopen(fd, "w", encoding="utf8") as fp:
+        json.dump(checkpoint, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(tmp, directory / CHECKPOINT_NAME)
@@ -0,0 +1,140 @@
+"""Staged restores
+
+Rather than extracting directly into the storage root, a staged restore extracts into a
+staging directory on the same file system. As each build's storage is completed it is
+renamed into place and then its record is saved. So GBP never serves a half-restored
+build, and each build is available as soon as it has been restored.
+
+Restores that aren't staged extract straight into the storage root but still hold the
+records in a Stage, so that only the records of builds whose storage was restored are
+saved.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from types import TracebackType
+from typing import Callable, Self
+
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.records import BuildRecord
+from gentoo_build_publisher.types import Build
+
+PREFIX = ".gbp-archive-"
+
+
+class Stage:  # pylint: disable=too-many-instance-attributes
+    """Staging area for a restore
+
+    Records are held by the stage until their build's storage has been committed. If
+    given, on_commit is called with each build once it has been committed. If deferred
+    is True, builds are held by the stage until it is finished rather than committed as
+    they are restored. If staged is False, the stage's path is the storage root itself
+    and committing a build only saves its record.
+    """
+
+    def __init__(
+        self,
+        on_commit: Callable[[Build], None] | None = None,
+        *,
+        staged: bool = True,
+        deferred: bool = False,
+    ) -> None:
+        self.root = publisher.storage.root
+        self.path = self.root
+        self.records: dict[str, BuildRecord] = {}
+        self.on_commit = on_commit
+        self.staged = staged
+        self.deferred = deferred
+        self.pending: list[Build] = []
+        self.committed: list[Build] = []
+
+    def __enter__(self) -> Self:
+        if self.staged:
+            self.path = Path(tempfile.mkdtemp(dir=self.root, prefix=PREFIX))
+
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        if self.staged:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def add_record(self, record: BuildRecord) -> None:
+        """Hold the given record until its build is committed"""
+        self.records[str(record)] = record
+
+    def link_target(self, linkname: str) -> Path:
+        """Return the path of the given hard link target
+
+        The target is in the stage unless its build has already been committed.
+        """
+        if (path := self.path / linkname).exists():
+            return path
+
+        return self.root / linkname
+
+    def commit(self, build: Build) -> None:
+        """Move the build's storage, and then its tags, into place and save its record
+
+        If the stage is deferred, the build is instead committed when it is finished.
+        """
+        if self.deferred:
+            self.pending.append(build)
+            return
+
+        if self.staged:
+            self.place(build)
+
+        if (record := self.records.pop(str(build), None)) is not None:
+            publisher.repo.build_records.save(record)
+
+        self.committed.append(build)
+
+        if self.on_commit is not None:
+            self.on_commit(build)
+
+    def finish(self) -> None:
+        """Commit the deferred builds and drop the records that are left
+
+        These are the records of builds which had no storage restored, for example
+        because the archive doesn't have the Content types selected.
+        """
+        self.deferred = False
+
+        for build in self.pending:
+            self.commit(build)
+
+        self.pending.clear()
+        self.records.clear()
+
+    def place(self, build: Build) -> None:
+        """Move the build's staged storage, and then its tags, into place"""
+        staged_dirs = [path for path in self.path.iterdir() if path.is_dir()]
+
+        for content_dir in staged_dirs:
+            if (staged := content_dir / str(build)).is_dir():
+                self.swap(staged, self.root / content_dir.name / str(build))
+
+        for content_dir in staged_dirs:
+            for path in content_dir.iterdir():
+                if path.is_symlink() and os.readlink(path) == str(build):
+                    os.replace(path, self.root / content_dir.name / path.name)
+
+    def swap(self, staged: Path, target: Path) -> None:
+        """Rename the staged directory to the target, replacing any existing one"""
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        if not target.exists():
+            staged.rename(target)
+            return
+
+        old = Path(tempfile.mkdtemp(dir=self.path)) / target.name
+        target.rename(old)
+        staged.rename(target)
+        shutil.rmtree(old)
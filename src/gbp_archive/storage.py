@@ -1,51 +1,758 @@
 """utilities for archiving Storage"""
 
+import functools
+import grp
+import itertools
+import os
+import pwd
+import shutil
+import stat
 import tarfile as tar
-from typing import IO, Iterable
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import IO, Iterable, Iterator, NamedTuple, cast
 
 from gentoo_build_publisher import publisher
 from gentoo_build_publisher.types import Build, Content
 from gentoo_build_publisher.utils import fs
 
-from gbp_archive.types import DumpCallback
+from gbp_archive import compression, delta
+from gbp_archive.cache import SegmentCache, segment_key
+from gbp_archive.digests import DigestCache
+from gbp_archive.staging import Stage
+from gbp_archive.throttle import ThrottledReader, TokenBucket
+from gbp_archive.types import DumpCallback, DumpOptions, RestoreOptions, Summary
+from gbp_archive.utils import format_size, seekable, tarfile_add, tarfile_members
 
 ARCHIVE_NAME = "storage.tar"
+MEMBER_TYPE = "storage"
+CODEC = "tar"
+DIGEST_HEADER = "GBP.digest"
+"""pax header of the digests of regular files in dumps made with checksums"""
+FILE_TYPES = {
+    stat.S_IFREG: tar.REGTYPE,
+    stat.S_IFDIR: tar.DIRTYPE,
+    stat.S_IFLNK: tar.SYMTYPE,
+    stat.S_IFIFO: tar.FIFOTYPE,
+    stat.S_IFCHR: tar.CHRTYPE,
+    stat.S_IFBLK: tar.BLKTYPE,
+}
 
 
-def dump(builds: Iterable[Build], fp: IO[bytes], *, callback: DumpCallback) -> None:
-    """Dump the given builds' storage into the given tarfile"""
+class HardLinks:
+    """The regular files, with more than one link, added to an archive
+
+    TarFile remembers the name of every regular file it adds in case another link to
+    it comes along. Instead, only files with more than one link are remembered and
+    then only until all of their links have been added.
+    """
+
+    def __init__(self) -> None:
+        # The name each file was added as and the number of its links yet to be added,
+        # by device and inode
+        self.pending: dict[tuple[int, int], tuple[str, int]] = {}
+
+        # If recording, the names of the files looked up with more than one link and
+        # the names their links were found to
+        self.recorded: list[str] | None = None
+        self.targets: set[str] | None = None
+
+    def link(self, name: str, stat_result: os.stat_result) -> str | None:
+        """Return the name the given file was added as, if it has already been added
+
+        Otherwise return None and remember the file as the given name.
+        """
+        if stat_result.st_nlink < 2:
+            return None
+
+        if self.recorded is not None:
+            self.recorded.append(name)
+
+        key = (stat_result.st_dev, stat_result.st_ino)
+
+        if (entry := self.pending.get(key)) is None:
+            self.pending[key] = (name, stat_result.st_nlink - 1)
+            return None
+
+        target, remaining = entry
+
+        if self.targets is not None:
+            self.targets.add(target)
+
+        if remaining > 1:
+            self.pending[key] = (target, remaining - 1)
+        else:
+            del self.pending[key]
+
+        return target
+
+    @contextmanager
+    def recording(
+        self, names: list[str], targets: set[str] | None = None
+    ) -> Iterator[None]:
+        """Context in which the names of the files with more than one link are recorded
+
+        The names are appended to the given list. If a set of targets is given, the
+        names that links are found to are added to it.
+        """
+        self.recorded = names
+        self.targets = targets
+        try:
+            yield
+        finally:
+            self.recorded = None
+            self.targets = None
+
+    def replay(self, names: Iterable[str]) -> None:
+        """Look up the given recorded names as though their files were being added
+
+        This brings the links up to date with files added other than by add_path(),
+        e.g. from a cached segment. Files that no longer exist are skipped.
+        """
+        for name in names:
+            try:
+                self.link(name, os.lstat(name))
+            except FileNotFoundError:
+                continue
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+
+class ArchiveWriter:
+    """File-like writer of the storage archive
+
+    TarFiles writing to a file object need to know their position in it, which this
+    keeps track of. What is written may also be copied to another file.
+    """
+
+    def __init__(self, fileobj: IO[bytes]) -> None:
+        self.fileobj = fileobj
+        self.position = 0
+        self.copy: IO[bytes] | None = None
+
+    def write(self, data: bytes) -> int:
+        """Write to the file object, and to the copy if there is one"""
+        self.position += len(data)
+
+        if self.copy is not None:
+            self.copy.write(data)
+
+        return self.fileobj.write(data)
+
+    def tell(self) -> int:
+        """Return the position in the archive"""
+        return self.position
+
+    @contextmanager
+    def copying(self, fileobj: IO[bytes]) -> Iterator[None]:
+        """Context in which what is written is also written to the given file"""
+        self.copy = fileobj
+        try:
+            yield
+        finally:
+            self.copy = None
+
+
+def dump(  # pylint: disable=too-many-locals
+    builds: Iterable[Build],
+    fp: IO[bytes],
+    *,
+    callback: DumpCallback,
+    options: DumpOptions = DumpOptions(),
+) -> None:
+    """Dump the given builds' storage into the given tarfile
+
+    Only the Content types given in the options are dumped. Paths are added in sorted
+    order so that the archive doesn't depend on the order of directory entries. If the
+    options say so, the digests of regular files, from the storage's DigestCache, are
+    recorded in their headers, files worth compressing are compressed and changed files
+    are delta-encoded against the previous build of the machine. The builds are
+    expected in the order that core.dump() sorts them, by machine and build id.
+
+    Each build's storage is written as a segment of the archive. If the options give a
+    cache size, segments are taken from, or added to, the storage's SegmentCache.
+    """
     storage = publisher.storage
+    links = HardLinks()
+    writer = ArchiveWriter(fp)
+    # The machine's builds dumped so far
+    machine_builds: list[Build] = []
+    # The ids of the builds dumped so far and, for each, that of the machine's build
+    # dumped before it
+    dumped: dict[str, str | None] = {}
+    # Names of the files with more than one link in the machine's builds taken from
+    # the cache, which the links have yet to see
+    unseen: list[str] = []
+
+    with ExitStack() as stack:
+        stack.enter_context(fs.cd(storage.root))
+        digests = (
+            stack.enter_context(DigestCache(storage.root))
+            if options.checksums
+            else None
+        )
+        cache = (
+            stack.enter_context(SegmentCache(storage.root, options.cache_size))
+            if options.cache_size
+            else None
+        )
+
+        if cache is not None:
+            cache.prune(storage.pulled)
+            cache.evict()
 
-    with tar.open(fileobj=fp, mode="w|") as tarfile, fs.cd(storage.root):
         for build in builds:
             callback("dump", "storage", build)
-            for content in Content:
-                for tag in [None, *storage.get_tags(build)]:
-                    path = storage.get_path(build, content, tag=tag)
-                    path = path.relative_to(storage.root)
-                    tarfile.add(path)
+            if machine_builds and machine_builds[-1].machine != build.machine:
+                machine_builds.clear()
+                unseen.clear()
 
+            before = machine_builds[-1] if machine_builds else None
+            previous = before if options.delta else None
+            args = (writer, build, links, previous, options, digests)
 
-def restore(fp: IO[bytes], *, callback: DumpCallback) -> list[Build]:
+            if cache is None:
+                add_build(*args)
+            elif (
+                segment := cache.get(
+                    build, key := segment_key(build, previous, options)
+                )
+            ) and segment.usable(dumped):
+                with segment.path.open("rb") as segment_fp:
+                    shutil.copyfileobj(throttled(segment_fp, options.limiter), writer)
+                unseen.extend(segment.links)
+            else:
+                links.replay(unseen)
+                unseen.clear()
+                targets: set[str] = set()
+                with cache.add(build, key) as (segment_fp, segment_links, needs):
+                    with (
+                        writer.copying(segment_fp),
+                        links.recording(segment_links, targets),
+                    ):
+                        add_build(*args)
+                    # Links within the build itself don't depend on other builds
+                    for name in targets:
+                        if (other := name.split("/")[1]) != str(build):
+                            needs[other] = dumped[other]
+
+            machine_builds.append(build)
+            dumped[str(build)] = None if before is None else str(before)
+
+        # The builds' TarFiles aren't closed as that ends the archive. This does
+        with tar.TarFile(fileobj=cast(IO[bytes], writer), mode="w"):
+            pass
+
+
+def add_build(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    writer: ArchiveWriter,
+    build: Build,
+    links: HardLinks,
+    previous: Build | None,
+    options: DumpOptions,
+    digests: DigestCache | None,
+) -> None:
+    """Add the given build's storage to the archive written by writer
+
+    If a previous build is given, changed files are delta-encoded against it.
+    """
+    storage = publisher.storage
+    # Not closed, as that would end the archive
+    tarfile = tar.TarFile(  # pylint: disable=consider-using-with
+        fileobj=cast(IO[bytes], writer), mode="w"
+    )
+
+    for content in options.contents:
+        base = (
+            storage.get_path(previous, content).relative_to(storage.root)
+            if previous
+            else None
+        )
+        for tag in [None, *sorted(storage.get_tags(build))]:
+            path = storage.get_path(build, content, tag=tag)
+            path = path.relative_to(storage.root)
+            add_path(
+                tarfile,
+                path,
+                links=links,
+                limiter=options.limiter,
+                reproducible=options.reproducible,
+                digests=digests,
+                compress=options.compress,
+                base=base if tag is None else None,
+            )
+
+
+def throttled(fileobj: IO[bytes], limiter: TokenBucket | None) -> IO[bytes]:
+    """Return the given file object, read through the limiter if there is one"""
+    if limiter is None:
+        return fileobj
+
+    return cast(IO[bytes], ThrottledReader(fileobj, limiter))
+
+
+def add_path(  # pylint: disable=too-many-arguments
+    tarfile: tar.TarFile,
+    path: Path,
+    *,
+    links: HardLinks,
+    limiter: TokenBucket | None = None,
+    reproducible: bool = False,
+    digests: DigestCache | None = None,
+    compress: bool = False,
+    base: Path | None = None,
+) -> None:
+    """Recursively add the given path to the tarfile
+
+    This is like TarFile.add() except that, if a limiter is given, files are read
+    through it. If reproducible is True, owner names are left out of the headers. These
+    depend on the host's user database and only the ids are needed to restore. If a
+    DigestCache is given, the digests of regular files are recorded in their headers.
+    If compress is True, regular files worth compressing are compressed (see the
+    compression module). If a base is given, regular files which have changed since the
+    base's are delta-encoded against it, where worth it (see the delta module).
+
+    Unlike TarFile.add(), neither the headers added nor the names of the regular files
+    are kept by the TarFile. Hard links are instead tracked by the given links.
+    """
+    if (tarinfo := make_tarinfo(path, links, digests)) is None:
+        return
+
+    if reproducible:
+        tarinfo.uname = tarinfo.gname = ""
+
+    if tarinfo.isreg():
+        with ExitStack() as stack:
+            fileobj: IO[bytes] = stack.enter_context(open(path, "rb"))
+            reader = throttled(fileobj, limiter)
+            if base is not None and delta.worthwhile(path, tarinfo.size, base):
+                fileobj = reader = delta.encode(tarinfo, reader, base)
+            if (
+                compress
+                and not delta.is_delta(tarinfo)
+                and compression.worthwhile(path, tarinfo.size, fileobj)
+            ):
+                reader = stack.enter_context(compression.compress(tarinfo, reader))
+            tarfile_add(tarfile, tarinfo, reader)
+    else:
+        tarfile_add(tarfile, tarinfo)
+
+    if tarinfo.isdir():
+        for name in sorted(os.listdir(path)):
+            add_path(
+                tarfile,
+                path / name,
+                links=links,
+                limiter=limiter,
+                reproducible=reproducible,
+                digests=digests,
+                compress=compress,
+                base=None if base is None else base / name,
+            )
+
+
+def make_tarinfo(
+    path: Path, links: HardLinks, digests: DigestCache | None = None
+) -> tar.TarInfo | None:
+    """Return the TarInfo for the given path
+
+    This is like TarFile.gettarinfo() except that hard links are looked up in the given
+    links and owner names are cached. If a DigestCache is given, the digest of a
+    regular file is added to its pax headers. Return None if the path's file type can't
+    be archived.
+    """
+    stat_result = os.lstat(path)
+
+    if (type_ := FILE_TYPES.get(stat.S_IFMT(stat_result.st_mode))) is None:
+        return None
+
+    tarinfo = tar.TarInfo(path.as_posix())
+    tarinfo.type = type_
+    tarinfo.mode = stat_result.st_mode
+    tarinfo.uid = stat_result.st_uid
+    tarinfo.gid = stat_result.st_gid
+    tarinfo.uname = user_name(stat_result.st_uid)
+    tarinfo.gname = group_name(stat_result.st_gid)
+    tarinfo.mtime = stat_result.st_mtime
+
+    if type_ == tar.REGTYPE:
+        if (target := links.link(tarinfo.name, stat_result)) is None:
+            tarinfo.size = stat_result.st_size
+            if digests is not None:
+                digest = digests.digest(path, stat_result)
+                tarinfo.pax_headers = {DIGEST_HEADER: digest}
+        else:
+            tarinfo.type = tar.LNKTYPE
+            tarinfo.linkname = target
+    elif type_ == tar.SYMTYPE:
+        tarinfo.linkname = os.readlink(path)
+    elif type_ in (tar.CHRTYPE, tar.BLKTYPE):
+        tarinfo.devmajor = os.major(stat_result.st_rdev)
+        tarinfo.devminor = os.minor(stat_result.st_rdev)
+
+    return tarinfo
+
+
+@functools.cache
+def user_name(uid: int) -> str:
+    """Return the name of the user with the given id, or "" if there is none"""
+    try:
+        return pwd.getpwuid(uid).pw_name
+    except KeyError:
+        return ""
+
+
+@functools.cache
+def group_name(gid: int) -> str:
+    """Return the name of the group with the given id, or "" if there is none"""
+    try:
+        return grp.getgrgid(gid).gr_name
+    except KeyError:
+        return ""
+
+
+def restore(
+    fp: IO[bytes],
+    *,
+    callback: DumpCallback,
+    options: RestoreOptions = RestoreOptions(),
+    stage: Stage | None = None,
+) -> list[Build]:
     """Restore builds from the given file object
 
     This is the complement of dump()
+    Only the Content types given in the options are restored.
     Return the list of builds restored.
+
+    If a Stage is given, the storage is extracted into it and each build is committed
+    once all of its storage has been extracted. Compressed files are decompressed and
+    delta files are rebuilt from their bases.
+
+    If the options give a priority restore and the file object is seekable, the builds
+    are restored in priority order (see restore_by_priority()).
     """
     storage = publisher.storage
     restore_list: list[Build] = []
+    contents = {content.value for content in options.contents}
+    seen: set[str] = set()
+    path = storage.root if stage is None else stage.path
 
-    with tar.open(fileobj=fp, mode="r|") as tarfile, fs.cd(storage.root):
-        for member in tarfile:
-            if is_content_dir(member, Content.REPOS):
-                build = Build.from_id(member.name.split("/", 1)[1])
+    if not options.contents:
+        return restore_list
+
+    if options.priority and seekable(fp):
+        with tar.open(fileobj=fp, mode="r:") as tarfile, fs.cd(path):
+            return restore_by_priority(
+                tarfile, contents, callback=callback, stage=stage
+            )
+
+    with tar.open(fileobj=fp, mode="r|") as tarfile, fs.cd(path):
+        for member in tarfile_members(tarfile):
+            content, _, build_id = member.name.partition("/")
+            if content not in contents:
+                continue
+            # Builds are detected by the first of their Content directories in the
+            # archive, whichever Content types the archive has. The storage of the
+            # previous build is then complete
+            if is_content_dir(member, Content(content)) and build_id not in seen:
+                if stage is not None and restore_list:
+                    stage.commit(restore_list[-1])
+                seen.add(build_id)
+                build = Build.from_id(build_id)
                 restore_list.append(build)
                 callback("restore", "storage", build)
-            tarfile.extract(member)
+            extract_member(tarfile, member, stage)
+
+    if stage is not None and restore_list:
+        stage.commit(restore_list[-1])
+
+    return restore_list
+
+
+def restore_by_priority(
+    tarfile: tar.TarFile,
+    contents: set[str],
+    *,
+    callback: DumpCallback,
+    stage: Stage | None = None,
+) -> list[Build]:
+    """Restore the builds of the (seekable) tarfile in priority order
+
+    Published builds are restored first, then tagged builds and then the rest, each
+    machine's newest first. Return the list of builds restored, in that order.
+
+    Hard links, and deltas, refer to files earlier in the archive: of the build itself
+    or of the machine's earlier builds. When restoring a build that needs files of
+    builds that haven't been restored yet, those files are restored first, in their own
+    builds. Only where each build's headers are is kept from reading the archive. They
+    are read again when they are needed (see PriorityRestorer).
+    """
+    spans, published, tagged = build_spans(tarfile, contents)
+    restore_list = priority_order(list(spans), published, tagged)
+    restorer = PriorityRestorer(tarfile, contents, spans, stage)
+
+    for build in restore_list:
+        callback("restore", "storage", build)
+        restorer.restore(build)
+        if stage is not None:
+            stage.commit(build)
 
     return restore_list
 
 
+class Span(NamedTuple):
+    """A run of consecutive members of a build in a storage archive"""
+
+    start: int
+    """Offset of the header of the first member"""
+
+    last: int
+    """Offset of the header of the last member"""
+
+
+def build_spans(
+    tarfile: tar.TarFile, contents: set[str]
+) -> tuple[dict[Build, list[Span]], set[Build], set[Build]]:
+    """Return the Spans of each build's members in the tarfile, in archive order
+
+    Only members of the given Content types are considered. Also return the builds
+    that are published and those that are tagged, according to the tags in the
+    tarfile.
+    """
+    spans: dict[Build, list[Span]] = {}
+    published: set[Build] = set()
+    tagged: set[Build] = set()
+    owner: Build | None = None
+
+    for member in tarfile_members(tarfile):
+        content, _, name = member.name.partition("/")
+        if content not in contents:
+            continue
+        if is_content_dir(member, Content(content)):
+            if (build := Build.from_id(name)) != owner:
+                owner = build
+                spans.setdefault(owner, []).append(Span(member.offset, member.offset))
+        elif member.issym() and "/" not in name:
+            tags = published if "@" not in name else tagged
+            tags.add(Build.from_id(member.linkname))
+        if owner is not None:
+            spans[owner][-1] = spans[owner][-1]._replace(last=member.offset)
+
+    return spans, published, tagged
+
+
+class PriorityRestorer:
+    """Restorer of the builds of a (seekable) storage archive in any order
+
+    The members that a build needs of builds not yet restored, as hard link targets or
+    delta bases, are extracted before it. They are found by following the needs, with
+    a stack, back through the archive a build at a time. A build's headers are read
+    from the archive only while it is restored or its members are needed.
+    """
+
+    def __init__(
+        self,
+        tarfile: tar.TarFile,
+        contents: set[str],
+        spans: dict[Build, list[Span]],
+        stage: Stage | None,
+    ) -> None:
+        self.tarfile = tarfile
+        self.contents = contents
+        self.spans = spans
+        self.stage = stage
+        self.restored: set[Build] = set()
+
+        # The names of the members of builds not yet restored that have been extracted
+        self.extracted: dict[Build, set[str]] = {}
+
+    def restore(self, build: Build) -> None:
+        """Restore the given build and, first, the members it needs of other builds"""
+        # The builds, and the names of their members, wanted. None is all of them
+        wanted: dict[Build, set[str] | None] = {build: None}
+        selected: dict[Build, list[tar.TarInfo]] = {}
+
+        # Members only need those before them, so the builds are gone through from the
+        # last in the archive to the first
+        while wanted:
+            other = max(wanted, key=self.start)
+            selected[other] = self.select(other, wanted.pop(other), wanted)
+
+        for other in sorted(selected, key=self.start):
+            extracted = self.extracted.setdefault(other, set())
+            for member in selected[other]:
+                if other != build:
+                    # Its build's directories may not have been extracted yet
+                    os.makedirs(os.path.dirname(member.name), exist_ok=True)
+                    extracted.add(member.name)
+                extract_member(self.tarfile, member, self.stage)
+
+        self.extracted.pop(build, None)
+        self.restored.add(build)
+
+    def select(
+        self, build: Build, names: set[str] | None, wanted: dict[Build, set[str] | None]
+    ) -> list[tar.TarInfo]:
+        """Return the given members of the build, and those they need, to extract
+
+        If names is None, all of the build's members are selected. Members that have
+        already been extracted are not. The members needed of earlier builds are added
+        to wanted. The members are returned in archive order.
+        """
+        headers = self.headers(build)
+        extracted = self.extracted.get(build, set())
+        stack = list(headers if names is None else names & headers.keys())
+        selected: dict[str, tar.TarInfo] = {}
+
+        while stack:
+            if (name := stack.pop()) in selected or name in extracted:
+                continue
+
+            member = selected[name] = headers[name]
+            needed = member.linkname if member.islnk() else member_base(member)
+
+            if needed is None:
+                continue
+            if needed in headers:
+                stack.append(needed)
+            elif (other := self.owner(needed)) is not None:
+                if (other_names := wanted.setdefault(other, set())) is not None:
+                    other_names.add(needed)
+
+        return sorted(selected.values(), key=lambda member: member.offset)
+
+    def owner(self, name: str) -> Build | None:
+        """Return the build of the given member if the member is yet to be extracted
+
+        Return None if it has been, or if it isn't in the archive.
+        """
+        build = Build.from_id(name.split("/")[1])
+
+        if build in self.restored or build not in self.spans:
+            return None
+
+        return None if name in self.extracted.get(build, ()) else build
+
+    def start(self, build: Build) -> int:
+        """Return the offset of the build's first header"""
+        return self.spans[build][0].start
+
+    def headers(self, build: Build) -> dict[str, tar.TarInfo]:
+        """Read the headers of the build's members, by name, from the archive again"""
+        fileobj = cast(IO[bytes], self.tarfile.fileobj)
+        headers: dict[str, tar.TarInfo] = {}
+
+        for span in self.spans[build]:
+            fileobj.seek(span.start)
+            with tar.open(fileobj=fileobj, mode="r:") as tarfile:
+                for member in tarfile_members(tarfile):
+                    if member.offset > span.last:
+                        break
+                    if member.name.partition("/")[0] in self.contents:
+                        headers[member.name] = member
+
+        return headers
+
+
+def priority_order(
+    builds: list[Build], published: set[Build], tagged: set[Build]
+) -> list[Build]:
+    """Return the given builds in the order that a priority restore restores them
+
+    The builds are given in archive order. Published builds come first, then tagged
+    builds and then the rest: the newest build of each machine, then the next newest
+    and so on.
+    """
+    age: dict[Build, int] = {}
+
+    for _, group in itertools.groupby(reversed(builds), key=lambda b: b.machine):
+        age.update((build, number) for number, build in enumerate(group))
+
+    return sorted(
+        builds,
+        key=lambda build: (
+            build not in published,
+            build not in tagged,
+            age[build],
+            build.machine,
+        ),
+    )
+
+
+def member_base(member: tar.TarInfo) -> str | None:
+    """Return the name of the given member's delta base, if it is a delta"""
+    return member.pax_headers[delta.HEADER] if delta.is_delta(member) else None
+
+
+def extract_member(
+    tarfile: tar.TarFile, member: tar.TarInfo, stage: Stage | None = None
+) -> None:
+    """Extract the given member of the storage archive
+
+    Hard links and delta bases are looked for in the Stage, if given.
+    """
+    if stage is not None and stage.staged and member.islnk():
+        # The link's target may have already been committed
+        os.link(stage.link_target(member.linkname), member.name)
+    elif delta.is_delta(member):
+        base = member.pax_headers[delta.HEADER]
+        delta.extract(
+            tarfile, member, Path(base) if stage is None else stage.link_target(base)
+        )
+    elif compression.is_compressed(member):
+        compression.extract(tarfile, member)
+    else:
+        tarfile.extract(member)
+
+
+class InsufficientSpaceError(OSError):
+    """The storage root's file system doesn't have room for the restore"""
+
+
+def check_space(summary: Summary) -> None:
+    """Check that the storage root's file system has room for the summarized builds
+
+    The summary's totals already account for hard links. Allow, on average, half a
+    block of slack for each regular file and a block for each other inode (mostly
+    directories). Raise InsufficientSpaceError if more space, or more inodes, are
+    needed than are available.
+    """
+    statvfs = os.statvfs(publisher.storage.root)
+    block = statvfs.f_frsize
+    others = summary["inodes"] - summary["files"]
+    needed = summary["size"] + summary["files"] * block // 2 + others * block
+    available = statvfs.f_bavail * block
+
+    if needed > available:
+        raise InsufficientSpaceError(
+            f"Not enough space in the storage root: {format_size(needed)} needed,"
+            f" {format_size(available)} available"
+        )
+
+    # Some file systems (e.g. btrfs) allocate inodes dynamically and report none
+    if statvfs.f_files and summary["inodes"] > statvfs.f_favail:
+        raise InsufficientSpaceError(
+            f"Not enough inodes in the storage root: {summary['inodes']} needed,"
+            f" {statvfs.f_favail} available"
+        )
+
+
+def select_contents(
+    include: Iterable[str] | None = None, exclude: Iterable[str] = ()
+) -> tuple[Content, ...]:
+    """Return the Content types given the names to include and exclude
+
+    If include is None, all Content types are included (less those excluded). The
+    Content types are returned in their canonical order. Raise ValueError if any of the
+    given names is not a Content type.
+    """
+    included = set(Content) if include is None else {Content(i) for i in include}
+    excluded = {Content(e) for e in exclude}
+
+    return tuple(content for content in Content if content in included - excluded)
+
+
 def is_content_dir(member: tar.TarInfo, content_type: Content) -> bool:
     """Return true if the given TarFile member is the given Content directory"""
     if not member.isdir():
@@ -0,0 +1,225 @@
+"""Summaries of builds' storage
+
+The summary is computed at dump time and stored in the archive's metadata so that the
+sizes of an archive's builds can be inspected without having to scan its storage.
+"""
+
+import stat
+import tarfile as tar
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+
+from gbp_archive.manifests import Record, lookup, walk
+from gbp_archive.types import BuildSummary, Estimate, Summary
+from gbp_archive.utils import build_sort_key
+
+BINPKG_SUFFIXES = (".gpkg.tar", ".xpak", ".tbz2")
+
+# Approximate sizes of pax extended header records. E.g. "30 mtime=1740000000.123456\n"
+PAX_MTIME_SIZE = 30
+PAX_RECORD_SIZE = 10
+
+
+class Entry(NamedTuple):
+    """A file system entry of a build's storage"""
+
+    inode: tuple[int, int]
+    """(st_dev, st_ino) of the entry"""
+
+    is_file: bool
+    """True if the entry is a regular file"""
+
+    size: int
+    """Size of the entry in bytes"""
+
+    binpkg: bool
+    """True if the entry is a binary package"""
+
+    name_length: int
+    """Length of the entry's path relative to the storage root"""
+
+
+def summarize(
+    builds: Iterable[Build], *, contents: Iterable[Content] = tuple(Content)
+) -> Summary:
+    """Return the storage Summary of the given builds' Content
+
+    Each build's size and file count is that of the build by itself. The totals count
+    each inode only once, as hard links are preserved by the dump. So the total size is
+    what is needed to restore all the builds.
+    """
+    summary: Summary = {"builds": {}, "size": 0, "files": 0, "inodes": 0}
+    seen: set[tuple[int, int]] = set()
+
+    for build, entries in walk_builds(builds, contents=contents):
+        build_summary: BuildSummary = {"size": 0, "files": 0, "binpkgs": 0}
+        build_seen: set[tuple[int, int]] = set()
+
+        for entry in entries:
+            if entry.inode not in seen:
+                seen.add(entry.inode)
+                summary["inodes"] += 1
+                if entry.is_file:
+                    summary["size"] += entry.size
+                    summary["files"] += 1
+
+            if not entry.is_file or entry.inode in build_seen:
+                continue
+
+            build_seen.add(entry.inode)
+            build_summary["size"] += entry.size
+            build_summary["files"] += 1
+            build_summary["binpkgs"] += entry.binpkg
+
+        summary["builds"][str(build)] = build_summary
+
+    return summary
+
+
+def estimate(
+    builds: Iterable[Build], *, contents: Iterable[Content] = tuple(Content)
+) -> Estimate:
+    """Estimate the size, in bytes, that the builds' Content would take in an archive
+
+    Builds are estimated in the order that they would be dumped and, like tarfile, a
+    file's data is only counted the first time its inode is seen. Subsequent links to
+    it only cost a header.
+    """
+    result: Estimate = {"builds": {}, "size": 0}
+    seen: set[tuple[int, int]] = set()
+
+    builds = sorted(builds, key=build_sort_key)
+
+    for build, entries in walk_builds(builds, contents=contents):
+        size = 0
+        for entry in entries:
+            size += _header_size(entry)
+            if entry.is_file and entry.inode not in seen:
+                seen.add(entry.inode)
+                size += _round_up(entry.size, tar.BLOCKSIZE)
+
+        result["builds"][str(build)] = size
+        result["size"] += size
+
+    # The storage archive's end-of-archive blocks, and the metadata and records members
+    # of the outer archive are small enough to lump together.
+    overhead = 2 * tar.RECORDSIZE
+    result["size"] = _round_up(result["size"] + overhead, tar.RECORDSIZE)
+
+    return result
+
+
+def walk_builds(
+    builds: Iterable[Build],
+    *,
+    contents: Iterable[Content] = tuple(Content),
+    max_workers: int | None = None,
+) -> Iterator[tuple[Build, list[Entry]]]:
+    """Yield each build along with the Entries of everything a dump of it would contain
+
+    This mirrors what storage.dump() adds to the archive: each Content's directory and
+    the build's tags. The directory trees are stat-ed concurrently but are yielded in
+    the order of the given builds. Directories with precomputed manifests aren't
+    walked. Only the trees of the build being yielded and the next are walked at a
+    time, so the entries of the other builds aren't held in memory.
+    """
+    storage = publisher.storage
+    contents = list(contents)
+
+    def tree(path: Path, records: list[Record] | None) -> tuple[Entry, ...]:
+        return stat_tree(path) if records is None else manifest_tree(path, records)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+        def submit(build: Build) -> list[Future[tuple[Entry, ...]]]:
+            paths = [
+                storage.get_path(build, content, tag=tag)
+                for content in contents
+                for tag in [None, *storage.get_tags(build)]
+            ]
+            precomputed = lookup(paths)
+
+            return [
+                executor.submit(tree, path, precomputed.get(path)) for path in paths
+            ]
+
+        def collect() -> tuple[Build, list[Entry]]:
+            build, trees = window.popleft()
+
+            return build, [entry for tree in trees for entry in tree.result()]
+
+        # The builds being walked: the one to yield next and the one after it
+        window: deque[tuple[Build, list[Future[tuple[Entry, ...]]]]] = deque()
+
+        for build in builds:
+            window.append((build, submit(build)))
+
+            if len(window) > 1:
+                yield collect()
+
+        if window:
+            yield collect()
+
+
+def stat_tree(path: Path) -> tuple[Entry, ...]:
+    """Return the Entries of the given path and everything beneath it
+
+    The path is expected to be a Content path (or tag) of a build in Storage. Symlinks
+    are not followed. If the path does not exist, there are no entries.
+    """
+    root_length = len(str(path.parent.parent)) + 1
+    binpkgs = path.parent.name == Content.BINPKGS.value
+
+    return tuple(
+        Entry(
+            inode=(st.st_dev, st.st_ino),
+            is_file=(is_file := stat.S_ISREG(st.st_mode)),
+            size=st.st_size,
+            binpkg=binpkgs and is_file and is_binpkg(name),
+            name_length=len(name) - root_length,
+        )
+        for name, st in walk(path)
+    )
+
+
+def manifest_tree(path: Path, records: Iterable[Record]) -> tuple[Entry, ...]:
+    """Return the Entries of the given Content path given its manifest's records"""
+    binpkgs = path.parent.name == Content.BINPKGS.value
+
+    return tuple(
+        Entry(
+            inode=(record.device, record.inode),
+            is_file=(is_file := stat.S_ISREG(record.mode)),
+            size=record.size,
+            binpkg=binpkgs and is_file and is_binpkg(record.name),
+            name_length=len(record.name),
+        )
+        for record in records
+    )
+
+
+def is_binpkg(path: str) -> bool:
+    """Return True if the given path is a binary package"""
+    return path.endswith(BINPKG_SUFFIXES)
+
+
+def _header_size(entry: Entry) -> int:
+    """Return the size of the tar header(s) for the given Entry
+
+    The mtimes of files are (almost always) fractional, so tarfile writes a pax extended
+    header for every member. Long names also go in the extended header.
+    """
+    pax_size = PAX_MTIME_SIZE
+    if entry.name_length > tar.LENGTH_NAME:
+        pax_size += entry.name_length + PAX_RECORD_SIZE
+
+    return 2 * tar.BLOCKSIZE + _round_up(pax_size, tar.BLOCKSIZE)
+
+
+def _round_up(size: int, block: int) -> int:
+    return -(-size // block) * block
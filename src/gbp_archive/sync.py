@@ -0,0 +1,108 @@
+"""Mirror builds between GBP instances
+
+The sync runs over a pair of pipes, for example the stdin/stdout of `ssh standby gbp
+restore --sync`. The receiving instance first sends a handshake: a single line of JSON
+listing the builds that it already has. The sending instance then dumps to the receiver
+only the builds that it lacks.
+"""
+
+import json
+from typing import IO, Iterable
+
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build
+
+from gbp_archive import core
+from gbp_archive.types import (
+    DumpCallback,
+    DumpOptions,
+    RestoreOptions,
+    default_dump_callback,
+)
+
+PROTOCOL = "gbp-archive-sync"
+VERSION = 1
+
+
+class ProtocolError(Exception):
+    """The other side of the sync did not send what was expected"""
+
+
+def send(
+    builds: Iterable[Build],
+    infile: IO[bytes],
+    outfile: IO[bytes],
+    *,
+    callback: DumpCallback = default_dump_callback,
+    options: DumpOptions = DumpOptions(),
+) -> list[Build]:
+    """Send the given builds that the receiver doesn't have
+
+    The receiver's handshake is read from infile and the builds are dumped to outfile.
+    Return the list of builds sent.
+    """
+    existing = read_handshake(infile)
+    missing = [build for build in builds if str(build) not in existing]
+
+    core.dump(missing, outfile, callback=callback, options=options)
+    outfile.flush()
+
+    return missing
+
+
+def receive(
+    infile: IO[bytes],
+    outfile: IO[bytes],
+    *,
+    callback: DumpCallback = default_dump_callback,
+    options: RestoreOptions = RestoreOptions(),
+) -> None:
+    """Receive the builds that we don't have from the sender
+
+    The handshake is written to outfile and the builds are restored from infile.
+    """
+    write_handshake(outfile, existing_builds())
+    core.restore(infile, callback=callback, options=options)
+
+
+def existing_builds() -> list[Build]:
+    """Return the builds in the instance's build records"""
+    records = publisher.repo.build_records
+
+    return [
+        build
+        for machine in records.list_machines()
+        for build in records.for_machine(machine)
+    ]
+
+
+def write_handshake(outfile: IO[bytes], builds: Iterable[Build]) -> None:
+    """Write the handshake, listing the given builds, to outfile"""
+    handshake = {
+        "protocol": PROTOCOL,
+        "version": VERSION,
+        "builds": [str(build) for build in builds],
+    }
+    outfile.write(json.dumps(handshake).encode("utf8") + b"\n")
+    outfile.flush()
+
+
+def read_handshake(infile: IO[bytes]) -> set[str]:
+    """Read the handshake from infile and return the (stringified) builds it lists
+
+    Raise ProtocolError if the handshake is not valid.
+    """
+    line = infile.readline()
+
+    try:
+        handshake = json.loads(line)
+    except ValueError:
+        raise ProtocolError(f"Invalid handshake: {line[:80]!r}") from None
+
+    if not isinstance(handshake, dict) or handshake.get("protocol") != PROTOCOL:
+        raise ProtocolError(f"Invalid handshake: {line[:80]!r}")
+
+    if handshake.get("version") != VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {handshake.get('version')}")
+
+    return set(handshake["builds"])
@@ -0,0 +1,105 @@
+"""I/O throttling for dumps
+
+So that dumps can run on live servers without starving them of disk bandwidth.
+
+The rate limit applies to the storage's files read by the dump and to the archive
+written to its output, file or URL, together: both take their bytes from the one
+TokenBucket. Assembling the archive's members in temporary files is not limited. Idle
+I/O priority instead applies to all of the dump's disk I/O.
+"""
+
+import os
+import subprocess
+import threading
+import time
+from typing import IO, Callable
+
+IOPRIO_CLASS_IDLE = 3
+
+
+# consume() is all that a rate limiter needs
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Token-bucket rate limiter
+
+    Tokens (bytes) accumulate at the given rate up to the given capacity. Consuming
+    more tokens than are available blocks until the debt has been paid off.
+    """
+
+    def __init__(
+        self,
+        rate: int,
+        capacity: int | None = None,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+
+        self.rate = rate
+        self.capacity = rate if capacity is None else capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(self.capacity)
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def consume(self, amount: int) -> None:
+        """Take the given amount of tokens from the bucket, blocking if need be"""
+        with self._lock:
+            now = self._clock()
+            elapsed = now - self._last
+            self._last = now
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._tokens -= amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if delay:
+            self._sleep(delay)
+
+
+class ThrottledReader:
+    """File-like wrapper whose reads are limited by the given TokenBucket"""
+
+    def __init__(self, fileobj: IO[bytes], bucket: TokenBucket) -> None:
+        self.fileobj = fileobj
+        self.bucket = bucket
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the file object"""
+        data = self.fileobj.read(size)
+        self.bucket.consume(len(data))
+
+        return data
+
+
+class ThrottledWriter:
+    """File-like wrapper whose writes are limited by the given TokenBucket"""
+
+    def __init__(self, fileobj: IO[bytes], bucket: TokenBucket) -> None:
+        self.fileobj = fileobj
+        self.bucket = bucket
+
+    def write(self, data: bytes) -> int:
+        """Write to the file object"""
+        self.bucket.consume(len(data))
+
+        return self.fileobj.write(data)
+
+    def flush(self) -> None:
+        """Flush the file object"""
+        self.fileobj.flush()
+
+
+def set_idle_io_priority() -> None:
+    """Set the I/O scheduling class of the current process to idle
+
+    The process will then only get disk time when no other process needs it. This uses
+    ionice(1). Raise OSError if it cannot be set.
+    """
+    cmd = ["ionice", "-c", str(IOPRIO_CLASS_IDLE), "-p", str(os.getpid())]
+
+    try:
+        subprocess.run(cmd, check=True, capture_output=True)
+    except subprocess.CalledProcessError as error:
+        raise OSError(error.stderr.decode(errors="replace").strip()) from error
@@ -1,12 +1,92 @@
 """gbp-archive type declarations"""
 
-from typing import Any, Callable, Literal, TypeAlias, TypedDict
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Literal,
+    NotRequired,
+    TypeAlias,
+    TypedDict,
+)
 
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher.types import Content
+
+from gbp_archive.throttle import TokenBucket
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gentoo_build_publisher.types import Build
 
 DumpType: TypeAlias = Literal["dump"] | Literal["restore"]
 DumpPhase: TypeAlias = Literal["storage"] | Literal["records"]
-DumpCallback: TypeAlias = Callable[[DumpType, DumpPhase, Build], Any]
+DumpCallback: TypeAlias = Callable[[DumpType, DumpPhase, "Build"], Any]
+JobState: TypeAlias = Literal[
+    "queued", "running", "cancelling", "done", "failed", "cancelled"
+]
+FileStatus: TypeAlias = Literal["ok", "modified", "missing"]
+
+
+class BuildSummary(TypedDict):
+    """Storage summary of a build in a dump archive"""
+
+    size: int
+    """Total size, in bytes, of the build's files"""
+
+    files: int
+    """Number of (regular) files in the build"""
+
+    binpkgs: int
+    """Number of binary packages in the build"""
+
+
+class Summary(TypedDict):
+    """Storage summary of the builds in a dump archive"""
+
+    builds: dict[str, BuildSummary]
+    """Summary of each build, keyed by the stringified Build"""
+
+    size: int
+    """Total size, in bytes, of all the builds' files after hard-link dedupe"""
+
+    files: int
+    """Total number of (regular) files after hard-link dedupe"""
+
+    inodes: int
+    """Total number of inodes (files, directories, symlinks) needed by the builds"""
+
+
+class Estimate(TypedDict):
+    """Estimated size of the builds in a (would-be) dump archive"""
+
+    builds: dict[str, int]
+    """Size, in bytes, that each build adds to the archive, keyed by stringified Build"""
+
+    size: int
+    """Total estimated size, in bytes, of the archive"""
+
+
+class Member(TypedDict):
+    """An entry in the archive's member table"""
+
+    name: str
+    """Name of the member in the archive"""
+
+    type: str
+    """What the member holds, for example "records" or "storage"."""
+
+    codec: str
+    """How the member is encoded, for example "json" or "tar"."""
+
+    compression: str
+    """How the member is compressed. Currently only "none" is supported."""
+
+    size: NotRequired[int]
+    """Size of the member in bytes. Not present for version 1 archives"""
+
+    digest: NotRequired[str]
+    """Digest of the member, as "algorithm:hexdigest". Not present for version 1
+    archives"""
 
 
 class Metadata(TypedDict):
@@ -23,6 +103,178 @@ class Metadata(TypedDict):
     manifest: list[str]
     """List of stringified Builds"""
 
+    summary: NotRequired[Summary]
+    """Storage summary of the builds. Not present in older archives"""
+
+    contents: NotRequired[list[str]]
+    """The Content types in the archive's storage. If not present, all of them"""
+
+    members: NotRequired[list[Member]]
+    """The archive's members (other than the metadata). Since version 2"""
+
+
+class Job(TypedDict):
+    """A dump or restore running as a background job"""
+
+    id: str
+
+    type: DumpType
+
+    state: JobState
+    """Where the job is at. A job is "cancelling" when it has been asked to cancel but
+    has not yet stopped"""
+
+    path: str
+    """Path of the archive that is dumped to or restored from"""
+
+    submitted: str
+    """Timestamp of the job's submission in ISO-8601 format"""
+
+    started: NotRequired[str]
+    """Timestamp of the start of the job in ISO-8601 format"""
+
+    finished: NotRequired[str]
+    """Timestamp of the end of the job in ISO-8601 format"""
+
+    progress: int
+    """Number of steps (a build's records or storage) completed"""
+
+    total: int
+    """Total number of steps, if known, else 0"""
+
+    current: str
+    """Description of the step that was last started"""
+
+    error: NotRequired[str]
+    """Why the job failed"""
+
+    contents: list[str]
+    """The Content types to dump or restore"""
+
+    builds: NotRequired[list[str]]
+    """The (stringified) builds to dump"""
+
+    reproducible: NotRequired[bool]
+    """Whether the dump is reproducible"""
+
+    max_rate: NotRequired[int | None]
+    """Limit, in bytes per second, of the dump's storage reads and output together"""
+
+    checksums: NotRequired[bool]
+    """Whether the digests of the dump's files are recorded"""
+
+    compress: NotRequired[bool]
+    """Whether the dump's files are compressed, where worth it"""
+
+    delta: NotRequired[bool]
+    """Whether the dump's changed files are delta-encoded, where worth it"""
+
+    cache_size: NotRequired[int | None]
+    """Size of the segment cache used by the dump, if any"""
+
+    staged: NotRequired[bool]
+    """Whether the restore is staged"""
+
+    preflight: NotRequired[bool]
+    """Whether the restore's preflight check is done"""
+
+    priority: NotRequired[bool]
+    """Whether the restore is priority-ordered"""
+
+
+class DumpSegment(TypedDict):
+    """A finished segment of a resumable dump"""
+
+    name: str
+    """File name of the segment in the dump's directory"""
+
+    builds: list[str]
+    """Ids of the builds in the segment"""
+
+    size: int
+    """Size of the segment in bytes"""
+
+    digest: str
+    """Digest of the segment, in "algorithm:hexdigest" form"""
+
+
+class Checkpoint(TypedDict):
+    """The progress of a resumable dump"""
+
+    contents: list[str]
+    """The Content types dumped"""
+
+    segments: list[DumpSegment]
+    """The segments finished, in the order they were finished"""
+
+
+@dataclass(frozen=True, kw_only=True)
+class DumpOptions:
+    """Options for dumping builds"""
+
+    contents: tuple[Content, ...] = tuple(Content)
+    """The Content types of the builds' storage to dump"""
+
+    limiter: TokenBucket | None = None
+    """If given, storage reads and writes to the output share the limiter's rate"""
+
+    reproducible: bool = False
+    """If True, the archive of unchanged builds is byte-for-byte the same every time
+
+    Owner names are left out of the storage archive, the headers of the archive's
+    members are normalized and the metadata is written last.
+    """
+
+    checksums: bool = False
+    """If True, record the digest of each regular file in its storage archive header
+
+    Digests are taken from the storage's persistent DigestCache, so only new or changed
+    files are read to compute them.
+    """
+
+    compress: bool = False
+    """If True, compress the regular files in the storage archive that are worth it
+
+    Each file is compressed, or not, on its own. Already compressed files, like
+    binpkgs, are stored as is.
+    """
+
+    delta: bool = False
+    """If True, delta-encode changed files against the previous build of the machine
+
+    Files which have changed since the machine's previous build in the dump are stored
+    as deltas against that build's version, where it's worth it. Files which haven't
+    changed are hard links to it anyway.
+    """
+
+    cache_size: int | None = None
+    """If given, reuse and keep the builds' storage in a SegmentCache of this size
+
+    The cache, under the storage root, holds each build's segment of the storage
+    archive. Builds whose segments are cached aren't read again.
+    """
+
+
+@dataclass(frozen=True, kw_only=True)
+class RestoreOptions:
+    """Options for restoring builds"""
+
+    contents: tuple[Content, ...] = tuple(Content)
+    """The Content types of the builds' storage to restore"""
+
+    staged: bool = False
+    """If True, restore into a staging area and move each build into place, and then
+    save its record, once it is complete"""
+
+    preflight: bool = True
+    """If True, check that the storage root has the space and inodes for the archive's
+    builds before restoring them"""
+
+    priority: bool = False
+    """If True, restore the published and tagged builds first, then the rest from
+    newest to oldest. The restore is staged and each build's postpull signal is emitted
+    once it has been committed. Archives that can't be seeked are restored in order"""
+
 
-def default_dump_callback(_type: DumpType, _phase: DumpPhase, _build: Build) -> None:
+def default_dump_callback(_type: DumpType, _phase: DumpPhase, _build: "Build") -> None:
     """Default DumpCallback. A noop"""
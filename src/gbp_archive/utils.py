@@ -1,11 +1,31 @@
 """Misc. utilities for gbp-archive"""
 
+import hashlib
+import os
+import sqlite3
 import tarfile as tar
 from collections import defaultdict
-from typing import IO, Any, Callable, TypeVar
+from pathlib import Path
+from types import TracebackType
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Iterator,
+    Literal,
+    Self,
+    TypeVar,
+)
+
+if TYPE_CHECKING:  # pragma: no cover
+    from gentoo_build_publisher.types import Build
 
 _T = TypeVar("_T")
 
+BUFSIZE = 64 * 1024
+
 
 _RESOLVERS: defaultdict[type, dict[str, Callable[[Any], Any]]] = defaultdict(dict)
 
@@ -40,6 +60,11 @@ def convert_to(type_: type, field: str) -> Callable[[Any], Any]:
     return decorate
 
 
+def resolvers(type_: type) -> dict[str, Callable[[Any], Any]]:
+    """Return the converters registered, by convert_to(), for the fields of the type"""
+    return dict(_RESOLVERS.get(type_, {}))
+
+
 def tarfile_next(tarfile: tar.TarFile) -> tar.TarInfo:
     """Return the next member of the tarfile
 
@@ -50,6 +75,41 @@ def tarfile_next(tarfile: tar.TarFile) -> tar.TarInfo:
     raise tar.ReadError("Unexpected end of archive")
 
 
+def tarfile_members(tarfile: tar.TarFile) -> Iterator[tar.TarInfo]:
+    """Yield the (remaining) members of the tarfile
+
+    Unlike iterating over the TarFile itself, this does not revisit members already
+    read with tarfile_next(). Nor are the members kept once they have been handled.
+    TarFile holds on to the header of every member that it reads, even when streaming,
+    which for archives of millions of files adds up to gigabytes. So members cannot be
+    looked up by name afterwards.
+    """
+    while (member := tarfile.next()) is not None:
+        yield member
+        forget_members(tarfile)
+
+
+def tarfile_add(
+    tarfile: tar.TarFile, tarinfo: tar.TarInfo, fileobj: IO[bytes] | None = None
+) -> None:
+    """Add the given member to the tarfile
+
+    This is TarFile.addfile() except that, like tarfile_members(), the member's header
+    is not kept.
+    """
+    tarfile.addfile(tarinfo, fileobj)
+    forget_members(tarfile)
+
+
+def forget_members(tarfile: tar.TarFile) -> None:
+    """Drop the headers of the members that the tarfile has read or written so far
+
+    TarFile has no public way to do this. Its members list is undocumented but has
+    been there, and is only appended to by next() and addfile(), since Python 2.
+    """
+    tarfile.members.clear()  # type: ignore[attr-defined]
+
+
 def tarfile_extract(tarfile: tar.TarFile, member: tar.TarInfo | str) -> IO[bytes]:
     """Extract the given member from the given tarfile
 
@@ -58,3 +118,162 @@ def tarfile_extract(tarfile: tar.TarFile, member: tar.TarInfo | str) -> IO[bytes
     if fp := tarfile.extractfile(member):
         return fp
     raise tar.ReadError(f"Member {member} does not exist in the archive")
+
+
+def seekable(fileobj: IO[bytes]) -> bool:
+    """Return True if the given file object can be seeked
+
+    Some file-like objects, like DigestReaders and the members of tarfiles read as a
+    stream, can't and don't say.
+    """
+    try:
+        return fileobj.seekable()
+    except AttributeError:
+        return False
+
+
+def tarfile_read_mode(fileobj: IO[bytes]) -> Literal["r:", "r|"]:
+    """Return the mode in which to open a tarfile for reading from the file object
+
+    When the file object can be seeked, members that aren't read are skipped rather
+    than read. Otherwise the tarfile is read as a stream.
+    """
+    return "r:" if fileobj.seekable() else "r|"
+
+
+def tarfile_set_attrs(tarfile: tar.TarFile, tarinfo: tar.TarInfo) -> None:
+    """Set the owner, mode and mtime of the given member's extracted file
+
+    This is for files written other than by TarFile.extract().
+    """
+    tarfile.chown(tarinfo, tarinfo.name, numeric_owner=False)
+    tarfile.chmod(tarinfo, tarinfo.name)
+    tarfile.utime(tarinfo, tarinfo.name)
+
+
+class DigestWriter:
+    """File-like wrapper that keeps track of the size and digest of what is written"""
+
+    def __init__(self, fileobj: IO[bytes], algorithm: str = "sha256") -> None:
+        self.fileobj = fileobj
+        self.hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        """Write to the file object"""
+        self.hash.update(data)
+        self.size += len(data)
+
+        return self.fileobj.write(data)
+
+    @property
+    def digest(self) -> str:
+        """The digest of what has been written, in "algorithm:hexdigest" form"""
+        return f"{self.hash.name}:{self.hash.hexdigest()}"
+
+
+class DigestReader:
+    """File-like wrapper that keeps track of the size and digest of what is read"""
+
+    def __init__(self, fileobj: IO[bytes], algorithm: str = "sha256") -> None:
+        self.fileobj = fileobj
+        self.hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Read from the file object"""
+        data = self.fileobj.read(size)
+        self.hash.update(data)
+        self.size += len(data)
+
+        return data
+
+    def drain(self) -> None:
+        """Read the rest of the file object"""
+        while self.read(BUFSIZE):
+            pass
+
+    @property
+    def digest(self) -> str:
+        """The digest of what has been read, in "algorithm:hexdigest" form"""
+        return f"{self.hash.name}:{self.hash.hexdigest()}"
+
+    def verify(self, size: int, digest: str) -> None:
+        """Read the rest of the file object and verify its size and digest
+
+        Raise ReadError if they don't match.
+        """
+        self.drain()
+
+        if self.size != size or self.digest != digest:
+            raise tar.ReadError("Archive member is corrupt (digest mismatch)")
+
+
+def build_sort_key(build: "Build") -> tuple[str, int]:
+    """Sort key for the order in which builds are dumped: by machine, then build id"""
+    return (build.machine, int(build.build_id))
+
+
+def format_size(size: int) -> str:
+    """Return the given size, in bytes, in human-readable form"""
+    if size < 1024:
+        return f"{size} B"
+
+    value = float(size)
+    unit = "B"
+    for unit in ("KiB", "MiB", "GiB", "TiB"):
+        value /= 1024
+        if value < 1024:
+            break
+
+    return f"{value:.1f} {unit}"
+
+
+def stat_key(path: Path) -> tuple[int, int, int] | None:
+    """Return the inode number, mtime and ctime of the given path, if it exists"""
+    try:
+        stat_result = os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+    return (stat_result.st_ino, stat_result.st_mtime_ns, stat_result.st_ctime_ns)
+
+
+class SQLiteStore:
+    """SQLite database kept under the given (storage) root
+
+    Subclasses give the database's path, relative to the root, its schema and the table
+    whose rows it has. Changes are saved when the store is closed.
+    """
+
+    database: ClassVar[Path]
+    schema: ClassVar[str]
+    table: ClassVar[str]
+
+    def __init__(self, root: Path) -> None:
+        self.root = root
+        path = root / self.database
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(self.schema)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        row = self.connection.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()
+
+        return int(row[0])
+
+    def close(self) -> None:
+        """Save the changes and close the store"""
+        self.connection.commit()
+        self.connection.close()
@@ -2,24 +2,38 @@
 
 # pylint: disable=redefined-outer-name,unused-argument
 
+import hashlib
+import http.server
 import io
+import itertools
 import os
 import tarfile as tar
+import threading
+import urllib.parse
+import xml.etree.ElementTree as ET
 from pathlib import Path
-from typing import Iterable, cast
+from typing import Any, Callable, Iterable
+from unittest import mock
 
 import gbp_testkit.fixtures as testkit
 from gbp_testkit.factories import BuildFactory
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
 from unittest_fixtures import FixtureContext, Fixtures, fixture
 
 
-@fixture(testkit.build, testkit.publisher, testkit.tmpdir)
+@fixture(testkit.publisher, testkit.tmpdir)
 def pulled_build(fixtures: Fixtures) -> Build:
-    """A build that has been pulled"""
-    fixtures.publisher.pull(fixtures.build)
+    """A build that has been pulled
 
-    return cast(Build, fixtures.build)
+    The build is made here rather than taken from testkit.build. Tests give this
+    fixture the name "build", and unittest_fixtures would then see testkit.build as
+    this fixture and never pull it.
+    """
+    build: Build = BuildFactory()
+    fixtures.publisher.pull(build)
+
+    return build
 
 
 @fixture(testkit.publisher)
@@ -38,6 +52,31 @@ def builds(
     return builds_
 
 
+Task = tuple[Callable[..., Any], tuple[Any, ...], dict[str, Any]]
+
+
+@fixture()
+def worker(fixtures: Fixtures) -> FixtureContext[list[Task]]:
+    """Queue the tasks given to GBP's worker instead of running them
+
+    Run the queued tasks with run_tasks()
+    """
+    tasks: list[Task] = []
+
+    def run(func: Callable[..., Any], *args: Any, **kwargs: Any) -> None:
+        tasks.append((func, args, kwargs))
+
+    with mock.patch("gentoo_build_publisher.worker.run", new=run):
+        yield tasks
+
+
+def run_tasks(tasks: list[Task]) -> None:
+    """Run (and dequeue) the given worker tasks"""
+    while tasks:
+        func, args, kwargs = tasks.pop(0)
+        func(*args, **kwargs)
+
+
 def cd(fixtures: Fixtures, *, cd: Path = Path(".")) -> FixtureContext[Path]:
     """Changes to the given directory"""
     cwd = cwd = os.getcwd()
@@ -69,3 +108,169 @@ def tarfile(
 
     bytes_io.seek(0)
     return tar.open(tarfile, "r", fileobj=bytes_io)
+
+
+def write_packages(builds: Iterable[Build]) -> list[bytes]:
+    """Write a Packages index to the repos of each build, changing a line each time
+
+    Return the indexes written.
+    """
+    texts = []
+
+    for number, build in enumerate(builds):
+        text = b"".join(
+            f"CPV: app-misc/package-{i}-r{number if i == 100 else 0}\n\n".encode()
+            for i in range(1000)
+        )
+        repos = publisher.storage.get_path(build, Content.REPOS)
+        (repos / "Packages").write_bytes(text)
+        texts.append(text)
+
+    return texts
+
+
+class Unseekable(io.BytesIO):
+    """In-memory file that says it is not seekable, as a pipe would"""
+
+    def seekable(self) -> bool:
+        return False
+
+
+class ObjectStore(http.server.ThreadingHTTPServer):
+    """A local stand-in for an S3-compatible object store
+
+    Objects are held in memory. Objects can be read, with or without ranges, and
+    written with multipart upload. The requests received are recorded as (method, path,
+    range) tuples. If ranges is False, range requests get the whole object. If
+    fail_parts is True, uploads of parts fail.
+    """
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), ObjectStoreHandler)
+        self.objects: dict[str, bytes] = {}
+        self.uploads: dict[str, dict[int, bytes]] = {}
+        self.requests: list[tuple[str, str, str | None]] = []
+        self.ranges = True
+        self.fail_parts = False
+        self.upload_ids = itertools.count(1)
+
+    def url(self, key: str) -> str:
+        """Return the URL of the object with the given key"""
+        return f"http://127.0.0.1:{self.server_address[1]}/{key}"
+
+
+class ObjectStoreHandler(http.server.BaseHTTPRequestHandler):
+    """Request handler of the ObjectStore"""
+
+    server: ObjectStore
+
+    def do_HEAD(self) -> None:  # pylint: disable=invalid-name
+        """Reply with the size of the requested object"""
+        if (data := self.get_object()) is not None:
+            self.reply(200, b"", length=len(data))
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        """Reply with the requested object, or the requested range of it"""
+        if (data := self.get_object()) is None:
+            return
+
+        if (range_ := self.headers["Range"]) is None or not self.server.ranges:
+            self.reply(200, data)
+            return
+
+        start, end = range_.removeprefix("bytes=").split("-")
+        self.reply(206, data[int(start) : int(end) + 1])
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        """Create a multipart upload, or complete one"""
+        key, query = self.parse()
+
+        if "uploads" in query:
+            upload_id = str(next(self.server.upload_ids))
+            self.server.uploads[upload_id] = {}
+            self.reply(
+                200,
+                b'<InitiateMultipartUploadResult xmlns="http://s3.amazonaws.com/doc/'
+                b'2006-03-01/"><UploadId>%s</UploadId></InitiateMultipartUploadResult>'
+                % upload_id.encode(),
+            )
+            return
+
+        if (parts := self.server.uploads.pop(query["uploadId"], None)) is None:
+            self.reply(404, b"")
+            return
+
+        root = ET.fromstring(self.rfile.read(int(self.headers["Content-Length"])))
+        numbers = [int(element.text or "") for element in root.iter("PartNumber")]
+        self.server.objects[key] = b"".join(parts[number] for number in numbers)
+        self.reply(200, b"<CompleteMultipartUploadResult/>")
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        """Upload a part of a multipart upload"""
+        _, query = self.parse()
+
+        if (parts := self.server.uploads.get(query.get("uploadId", ""))) is None:
+            self.reply(404, b"")
+            return
+
+        if self.server.fail_parts:
+            self.reply(500, b"")
+            return
+
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        parts[int(query["partNumber"])] = data
+        self.reply(200, b"", etag=f'"{hashlib.md5(data).hexdigest()}"')
+
+    def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+        """Abort a multipart upload"""
+        _, query = self.parse()
+        self.server.uploads.pop(query["uploadId"], None)
+        self.reply(204, b"")
+
+    def parse(self) -> tuple[str, dict[str, str]]:
+        """Record the request and return its object key and query"""
+        url = urllib.parse.urlsplit(self.path)
+        self.server.requests.append((self.command, url.path, self.headers["Range"]))
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+
+        return url.path.lstrip("/"), query
+
+    def get_object(self) -> bytes | None:
+        """Return the requested object. If there isn't one, reply 404"""
+        key, _ = self.parse()
+
+        if (data := self.server.objects.get(key)) is None:
+            self.reply(404, b"")
+
+        return data
+
+    def reply(
+        self, status: int, body: bytes, *, length: int | None = None, etag: str = ""
+    ) -> None:
+        """Send the given response"""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body) if length is None else length))
+
+        if etag:
+            self.send_header("ETag", etag)
+
+        self.end_headers()
+
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:  # pylint: disable=W0622
+        pass
+
+
+@fixture()
+def object_store(fixtures: Fixtures) -> FixtureContext[ObjectStore]:
+    """A local stand-in for an S3-compatible object store, serving in a thread"""
+    server = ObjectStore()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,56 @@
+"""Tests for the gbp-archive Django app"""
+
+# pylint: disable=missing-docstring
+import os
+import subprocess
+import sys
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher.signals import dispatcher
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import manifests
+
+from . import lib
+
+
+@given(testkit.tmpdir)
+class GBPArchiveConfigTests(TestCase):
+    def test_apps_load(self, fixtures: Fixtures) -> None:
+        # Load the apps, with the plugin's, in a fresh interpreter as GBP's server would
+        code = (
+            "import django\n"
+            "django.setup()\n"
+            "from django.apps import apps\n"
+            "print(apps.get_app_config('gbp_archive').name)\n"
+        )
+        environ = {
+            **os.environ,
+            "DJANGO_SETTINGS_MODULE": "gbp_testkit.settings",
+            "BUILD_PUBLISHER_JENKINS_BASE_URL": "http://jenkins.invalid/",
+            "BUILD_PUBLISHER_STORAGE_PATH": str(fixtures.tmpdir),
+        }
+
+        proc = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True,
+            check=False,
+            env=environ,
+            text=True,
+        )
+
+        self.assertEqual(0, proc.returncode, proc.stderr)
+        self.assertEqual("gbp_archive.django.gbp_archive", proc.stdout.strip())
+
+
+@given(testkit.publisher, lib.builds, lib.worker)
+@where(builds__machines=[("foo", 1)])
+class ReadyTests(TestCase):
+    def test_binds_postpull_handler(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+
+        with mock.patch.dict(os.environ, {manifests.ENABLE_VARIABLE: "1"}):
+            dispatcher.emit("postpull", build=build, packages=[], gbp_metadata=None)
+
+        self.assertIn((manifests.precompute_task, (str(build),), {}), fixtures.worker)
@@ -2,19 +2,29 @@
 
 # pylint: disable=missing-docstring
 
+import datetime as dt
+import hashlib
+import inspect
 import io
+import itertools
 import json
+import os
+import sys
 import tarfile as tar
 from typing import Any
 from unittest import TestCase, mock
 
 import gbp_testkit.fixtures as testkit
 from gentoo_build_publisher import publisher, signals
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher.types import Build, Content
 from unittest_fixtures import Fixtures, Param, given, where
 
-from gbp_archive import storage
-from gbp_archive.core import dump, restore
+from gbp_archive import compression, delta, storage
+from gbp_archive.core import dump, restore, tabulate, verify_storage
+from gbp_archive.digests import DigestCache
+from gbp_archive.staging import Stage
+from gbp_archive.types import DumpOptions, RestoreOptions
+from gbp_archive.utils import build_sort_key
 
 from . import lib
 
@@ -42,6 +52,8 @@ class CoreDumpTests(TestCase):
                 metadata = json.load(metadata_fp)
             metadata_builds = {Build.from_id(i) for i in metadata["manifest"]}
             self.assertEqual(set(builds), metadata_builds)
+            summary_builds = {Build.from_id(i) for i in metadata["summary"]["builds"]}
+            self.assertEqual(set(builds), summary_builds)
 
             fp = tarfile.extractfile("storage.tar")
             assert fp is not None
@@ -56,6 +68,58 @@ class CoreDumpTests(TestCase):
                 data = json.load(records)
                 self.assertEqual(6, len(data))
 
+    def test_member_table(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        outfile = io.BytesIO()
+        dump(builds, outfile)
+        outfile.seek(0)
+
+        with tar.open(mode="r", fileobj=outfile) as tarfile:
+            metadata_fp = tarfile.extractfile("gbp-archive")
+            assert metadata_fp is not None
+            with metadata_fp:
+                metadata = json.load(metadata_fp)
+            self.assertEqual(2, metadata["version"])
+            self.assertEqual(
+                ["records.json", "storage.tar"],
+                [member["name"] for member in metadata["members"]],
+            )
+            for member in metadata["members"]:
+                member_fp = tarfile.extractfile(member["name"])
+                assert member_fp is not None
+                data = member_fp.read()
+                self.assertEqual(len(data), member["size"])
+                digest = f"sha256:{hashlib.sha256(data).hexdigest()}"
+                self.assertEqual(digest, member["digest"])
+
+    def test_reproducible(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        publisher.tag(builds[0], "b")
+        publisher.tag(builds[0], "a")
+        options = DumpOptions(reproducible=True)
+        first = io.BytesIO()
+        second = io.BytesIO()
+
+        dump(builds, first, options=options)
+        with mock.patch("gbp_archive.metadata.time.localtime") as localtime:
+            localtime.return_value = dt.datetime(2025, 2, 22, tzinfo=dt.UTC)
+            dump(builds, second, options=options)
+
+        first.seek(0)
+        with tar.open(fileobj=first) as tarfile:
+            members = tarfile.getmembers()
+
+        self.assertEqual(
+            ["records.json", "storage.tar", "gbp-archive"], [m.name for m in members]
+        )
+        for member in members:
+            self.assertEqual((0, "", ""), (member.mtime, member.uname, member.gname))
+
+        # Everything before the metadata is the same
+        offset = members[-1].offset
+        self.assertEqual(first.getvalue()[:offset], second.getvalue()[:offset])
+        self.assertNotEqual(first.getvalue()[offset:], second.getvalue()[offset:])
+
 
 @given(testkit.publisher, lib.builds)
 @where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
@@ -81,6 +145,197 @@ class CoreRestoreTests(TestCase):
             self.assertTrue(publisher.storage.pulled(build))
             self.assertTrue(publisher.repo.build_records.exists(build))
 
+    def test_contents(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        fp = io.BytesIO()
+        dump(builds, fp, options=DumpOptions(contents=(Content.ETC_PORTAGE,)))
+        fp.seek(0)
+
+        for build in builds:
+            publisher.storage.delete(build)
+
+        # Restoring the contents the archive doesn't have is a noop
+        restore(fp, options=RestoreOptions(contents=(Content.REPOS,)))
+
+        for build in builds:
+            path = publisher.storage.get_path(build, Content.REPOS)
+            self.assertFalse(path.exists())
+
+        fp.seek(0)
+        restore(fp)
+
+        for build in builds:
+            for content in Content:
+                path = publisher.storage.get_path(build, content)
+                self.assertEqual(content is Content.ETC_PORTAGE, path.exists())
+
+    def test_records_of_unrestored_storage(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        fp = io.BytesIO()
+        dump(builds, fp, options=DumpOptions(contents=(Content.ETC_PORTAGE,)))
+        fp.seek(0)
+        delete_builds(builds)
+
+        for staged in [False, True]:
+            with self.subTest(staged=staged):
+                fp.seek(0)
+                options = RestoreOptions(contents=(Content.REPOS,), staged=staged)
+                restore(fp, options=options)
+
+                for build in builds:
+                    self.assertFalse(records_exist(build))
+
+    def test_version_1_archive(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        fp = io.BytesIO()
+        dump(builds, fp)
+        members = read_members(fp)
+        metadata = json.loads(members["gbp-archive"])
+        metadata["version"] = 1
+        del metadata["members"]
+        members["gbp-archive"] = json.dumps(metadata).encode()
+        fp = make_archive(members)
+
+        for build in builds:
+            publisher.delete(build)
+
+        restore(fp)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_unknown_members_are_skipped(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        fp = io.BytesIO()
+        dump(builds, fp)
+        members = read_members(fp)
+        metadata = json.loads(members["gbp-archive"])
+        metadata["members"].insert(
+            0,
+            {
+                "name": "index.bin",
+                "type": "index",
+                "codec": "bin",
+                "compression": "zstd",
+                "size": 4,
+                "digest": "sha256:bogus",
+            },
+        )
+        members = {
+            "gbp-archive": json.dumps(metadata).encode(),
+            "index.bin": b"test",
+            "junk": b"junk",
+            **members,
+        }
+
+        for build in builds:
+            publisher.delete(build)
+
+        restore(make_archive(members))
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+
+    def test_unsupported_version(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp)
+        members = read_members(fp)
+        metadata = json.loads(members["gbp-archive"])
+        metadata["version"] = 99
+        members["gbp-archive"] = json.dumps(metadata).encode()
+
+        with self.assertRaises(tar.ReadError):
+            restore(make_archive(members))
+
+    def test_corrupt_member(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp)
+        members = read_members(fp)
+        members["records.json"] = members["records.json"].replace(b"[", b"[ ", 1)
+
+        with self.assertRaises(tar.ReadError):
+            restore(make_archive(members))
+
+    def test_missing_member(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp)
+        members = read_members(fp)
+        del members["storage.tar"]
+
+        with self.assertRaises(tar.ReadError):
+            restore(make_archive(members))
+
+    def test_reproducible(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        fp = io.BytesIO()
+        dump(builds, fp, options=DumpOptions(reproducible=True))
+        fp.seek(0)
+        callback = mock.Mock()
+
+        self.assertEqual(set(builds), set(tabulate(fp)))
+
+        fp.seek(0)
+        for build in builds:
+            publisher.delete(build)
+
+        restore(fp, callback=callback)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+            callback.assert_any_call("restore", "storage", build)
+
+    def test_reproducible_corrupt_member(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp, options=DumpOptions(reproducible=True))
+        members = read_members(fp)
+        members["records.json"] = members["records.json"].replace(b"[", b"[ ", 1)
+        delete_builds(fixtures.builds)
+
+        with self.assertRaises(tar.ReadError):
+            restore(make_archive(members))
+
+    def test_reproducible_missing_metadata(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp, options=DumpOptions(reproducible=True))
+        members = read_members(fp)
+        del members["gbp-archive"]
+
+        with self.assertRaises(tar.ReadError):
+            restore(make_archive(members))
+
+    def test_staged(self, fixtures: Fixtures) -> None:
+        builds = sorted(fixtures.builds, key=build_sort_key)
+        publisher.tag(builds[1], "stable")
+        fp = io.BytesIO()
+        dump(builds, fp)
+        fp.seek(0)
+        for build in builds:
+            publisher.delete(build)
+        committed: list[list[bool]] = []
+
+        def callback(_type: str, phase: str, _build: Build) -> None:
+            if phase == "storage":
+                records = publisher.repo.build_records
+                committed.append([records.exists(build) for build in builds])
+
+        restore(fp, callback=callback, options=RestoreOptions(staged=True))
+
+        # Each build is committed once the next one is started
+        count = len(builds)
+        self.assertEqual(
+            [[j < i for j in range(count)] for i in range(count)], committed
+        )
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+        self.assertEqual(["stable"], publisher.storage.get_tags(builds[1]))
+
+        # The staging area is cleaned up
+        root = publisher.storage.root
+        self.assertEqual([], [p for p in root.iterdir() if p.name.startswith(".")])
+
     def test_emits_pulled_signals(self, fixtures: Fixtures) -> None:
         # given the dumped builds
         builds = fixtures.builds
@@ -170,6 +425,125 @@ class StorageDumpTestCase(TestCase):
         # And the callback is called with the expected arguments
         callback.assert_called_once_with("dump", "storage", build)
 
+    def test_contents(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        options = DumpOptions(contents=(Content.ETC_PORTAGE, Content.VAR_LIB_PORTAGE))
+        fp = io.BytesIO()
+
+        storage.dump([build], fp, callback=mock.Mock(), options=options)
+
+        fp.seek(0)
+        with tar.open(fileobj=fp) as tarfile:
+            contents = {name.split("/")[0] for name in tarfile.getnames()}
+
+        self.assertEqual({"etc-portage", "var-lib-portage"}, contents)
+
+    def test_reproducible(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        fp = io.BytesIO()
+
+        storage.dump(
+            [build], fp, callback=mock.Mock(), options=DumpOptions(reproducible=True)
+        )
+
+        fp.seek(0)
+        with tar.open(fileobj=fp) as tarfile:
+            members = tarfile.getmembers()
+
+        self.assertEqual({("", "")}, {(m.uname, m.gname) for m in members})
+
+    def test_hard_links(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        path = publisher.storage.get_path(build, Content.REPOS)
+        (path / "a").write_bytes(b"test")
+        os.link(path / "a", path / "b")
+        fp = io.BytesIO()
+
+        storage.dump([build], fp, callback=mock.Mock())
+
+        fp.seek(0)
+        with tar.open(fileobj=fp) as tarfile:
+            member = tarfile.getmember(f"repos/{build}/b")
+
+        self.assertTrue(member.islnk())
+        self.assertEqual(f"repos/{build}/a", member.linkname)
+
+    def test_checksums(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        path = publisher.storage.get_path(build, Content.REPOS)
+        (path / "test.txt").write_bytes(b"test")
+        fp = io.BytesIO()
+
+        storage.dump(
+            [build], fp, callback=mock.Mock(), options=DumpOptions(checksums=True)
+        )
+
+        fp.seek(0)
+        with tar.open(fileobj=fp) as tarfile:
+            member = tarfile.getmember(f"repos/{build}/test.txt")
+            directory = tarfile.getmember(f"repos/{build}")
+
+        digest = f"sha256:{hashlib.sha256(b'test').hexdigest()}"
+        self.assertEqual(digest, member.pax_headers[storage.DIGEST_HEADER])
+        self.assertNotIn(storage.DIGEST_HEADER, directory.pax_headers)
+
+
+class HardLinksTests(TestCase):
+    def test(self) -> None:
+        links = storage.HardLinks()
+
+        self.assertIsNone(links.link("a", stat_result(ino=1, nlink=3)))
+        self.assertEqual("a", links.link("b", stat_result(ino=1, nlink=3)))
+        self.assertEqual(1, len(links))
+        self.assertEqual("a", links.link("c", stat_result(ino=1, nlink=3)))
+        self.assertEqual(0, len(links))
+
+    def test_single_link(self) -> None:
+        links = storage.HardLinks()
+
+        self.assertIsNone(links.link("a", stat_result(ino=1, nlink=1)))
+        self.assertEqual(0, len(links))
+
+    def test_forgets_files_once_linked(self) -> None:
+        links = storage.HardLinks()
+
+        for ino in range(100_000):
+            links.link(f"{ino}/a", stat_result(ino=ino, nlink=2))
+            links.link(f"{ino}/b", stat_result(ino=ino, nlink=2))
+
+        self.assertEqual(0, len(links))
+
+    def test_recording(self) -> None:
+        links = storage.HardLinks()
+        names: list[str] = []
+
+        with links.recording(names):
+            links.link("a", stat_result(ino=1, nlink=2))
+            links.link("b", stat_result(ino=2, nlink=1))
+        links.link("c", stat_result(ino=1, nlink=2))
+
+        self.assertEqual(["a"], names)
+
+    def test_recording_targets(self) -> None:
+        links = storage.HardLinks()
+        targets: set[str] = set()
+        links.link("a", stat_result(ino=1, nlink=2))
+
+        with links.recording([], targets):
+            links.link("b", stat_result(ino=1, nlink=2))
+            links.link("c", stat_result(ino=2, nlink=2))
+
+        self.assertEqual({"a"}, targets)
+
+    def test_replay(self) -> None:
+        links = storage.HardLinks()
+
+        with mock.patch.object(storage.os, "lstat") as lstat:
+            lstat.side_effect = [stat_result(ino=1, nlink=2), FileNotFoundError]
+            links.replay(["a", "gone"])
+
+        self.assertEqual("a", links.link("b", stat_result(ino=1, nlink=2)))
+
 
 @given(testkit.tmpdir, testkit.publisher, build=lib.pulled_build)
 class StorageRestoreTests(TestCase):
@@ -201,3 +575,426 @@ class StorageRestoreTests(TestCase):
 
         # And the callback is called with the expected arguments
         callback.assert_called_with("restore", "storage", build)
+
+    def test_contents(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        fp = io.BytesIO()
+        callback = mock.Mock()
+        storage.dump([build], fp, callback=callback)
+        publisher.delete(build)
+        fp.seek(0)
+
+        options = RestoreOptions(contents=(Content.ETC_PORTAGE,))
+        restored = storage.restore(fp, callback=callback, options=options)
+
+        self.assertEqual([build], restored)
+        for content in Content:
+            path = publisher.storage.get_path(build, content)
+            self.assertEqual(content is Content.ETC_PORTAGE, path.exists())
+
+    def test_compressed(self, fixtures: Fixtures) -> None:
+        build = fixtures.build
+        repos = publisher.storage.get_path(build, Content.REPOS)
+        text = b"".join(f"line {i}\n".encode() for i in range(10_000))
+        (repos / "Packages").write_bytes(text)
+        (repos / "test.gpkg.tar").write_bytes(text)
+        os.link(repos / "Packages", repos / "Packages.link")
+        fp = io.BytesIO()
+        callback = mock.Mock()
+        storage.dump([build], fp, callback=callback, options=DumpOptions(compress=True))
+        publisher.delete(build)
+        fp.seek(0)
+
+        with tar.open(fileobj=fp) as tarfile:
+            compressed = {
+                member.name.rpartition("/")[2]
+                for member in tarfile.getmembers()
+                if compression.is_compressed(member)
+            }
+        self.assertEqual({"Packages"}, compressed)
+
+        fp.seek(0)
+        restored = storage.restore(fp, callback=callback)
+
+        self.assertEqual([build], restored)
+        self.assertEqual(text, (repos / "Packages").read_bytes())
+        self.assertEqual(text, (repos / "test.gpkg.tar").read_bytes())
+        self.assertTrue((repos / "Packages").samefile(repos / "Packages.link"))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class PreflightTests(TestCase):
+    def test_not_enough_space(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        delete_builds(builds)
+
+        with patch_statvfs(bavail=1), self.assertRaises(storage.InsufficientSpaceError):
+            restore(archive)
+
+        self.assert_nothing_restored(builds)
+
+    def test_not_enough_inodes(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        delete_builds(builds)
+
+        with (
+            patch_statvfs(favail=10),
+            self.assertRaises(storage.InsufficientSpaceError) as context,
+        ):
+            restore(archive)
+
+        self.assertIn("inodes", str(context.exception))
+        self.assert_nothing_restored(builds)
+
+    def test_no_inode_limit(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        delete_builds(builds)
+
+        with patch_statvfs(files=0, favail=0):
+            restore(archive)
+
+        self.assertTrue(publisher.storage.pulled(builds[0]))
+
+    def test_skip(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        delete_builds(builds)
+
+        with patch_statvfs(bavail=1):
+            restore(archive, options=RestoreOptions(preflight=False))
+
+        self.assertTrue(publisher.storage.pulled(builds[0]))
+
+    def test_reproducible_archive(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds, options=DumpOptions(reproducible=True))
+        delete_builds(builds)
+
+        with patch_statvfs(bavail=1), self.assertRaises(storage.InsufficientSpaceError):
+            restore(archive)
+
+        self.assert_nothing_restored(builds)
+
+    def test_unseekable_archive(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = lib.Unseekable(dump_builds(builds).getvalue())
+        delete_builds(builds)
+
+        with patch_statvfs(bavail=1), self.assertRaises(storage.InsufficientSpaceError):
+            restore(archive)
+
+        self.assert_nothing_restored(builds)
+
+    def assert_nothing_restored(self, builds: list[Build]) -> None:
+        for build in builds:
+            self.assertFalse(publisher.storage.pulled(build))
+            self.assertFalse(publisher.repo.build_records.exists(build))
+
+
+class SelectContentsTests(TestCase):
+    def test_all(self) -> None:
+        self.assertEqual(tuple(Content), storage.select_contents())
+
+    def test_include_and_exclude(self) -> None:
+        contents = storage.select_contents(
+            ["var-lib-portage", "repos", "binpkgs"], ["binpkgs"]
+        )
+
+        self.assertEqual((Content.REPOS, Content.VAR_LIB_PORTAGE), contents)
+
+    def test_invalid(self) -> None:
+        with self.assertRaises(ValueError):
+            storage.select_contents(exclude=["bogus"])
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 2)])
+class VerifyStorageTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        root = publisher.storage.root
+        repos = publisher.storage.get_path(builds[0], Content.REPOS)
+        (repos / "modified").write_bytes(b"test")
+        (repos / "missing").write_bytes(b"test")
+        fp = io.BytesIO()
+        dump(builds, fp, options=DumpOptions(checksums=True))
+        (repos / "modified").write_bytes(b"modified")
+        os.utime(repos / "modified", ns=(0, 0))
+        (repos / "missing").unlink()
+        fp.seek(0)
+
+        with DigestCache(root) as digests:
+            statuses = dict(verify_storage(fp, digests))
+
+        name = str(repos.relative_to(root))
+        self.assertEqual("modified", statuses.pop(f"{name}/modified"))
+        self.assertEqual("missing", statuses.pop(f"{name}/missing"))
+        self.assertTrue(statuses)
+        self.assertEqual({"ok"}, set(statuses.values()))
+
+    def test_without_checksums(self, fixtures: Fixtures) -> None:
+        fp = io.BytesIO()
+        dump(fixtures.builds, fp)
+        fp.seek(0)
+
+        with DigestCache(publisher.storage.root) as digests:
+            self.assertEqual([], list(verify_storage(fp, digests)))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3)])
+class DeltaTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        texts = lib.write_packages(builds)
+        fp = dump_builds(builds, DumpOptions(delta=True))
+
+        with tar.open(fileobj=storage_archive(fp)) as tarfile:
+            deltas = [
+                member.name for member in tarfile.getmembers() if delta.is_delta(member)
+            ]
+        self.assertEqual(
+            [f"repos/{build}/Packages" for build in builds[1:]],
+            [name for name in deltas if name.endswith("/Packages")],
+        )
+
+        delete_builds(builds)
+        fp.seek(0)
+        restore(fp)
+
+        for build, text in zip(builds, texts):
+            repos = publisher.storage.get_path(build, Content.REPOS)
+            self.assertEqual(text, (repos / "Packages").read_bytes())
+
+    def test_staged_restore(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        texts = lib.write_packages(builds)
+        fp = dump_builds(builds, DumpOptions(delta=True))
+        delete_builds(builds)
+
+        restore(fp, options=RestoreOptions(staged=True))
+
+        for build, text in zip(builds, texts):
+            repos = publisher.storage.get_path(build, Content.REPOS)
+            self.assertEqual(text, (repos / "Packages").read_bytes())
+
+    def test_smaller(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        lib.write_packages(builds)
+
+        full = dump_builds(builds).getbuffer().nbytes
+        encoded = dump_builds(builds, DumpOptions(delta=True)).getbuffer().nbytes
+
+        self.assertLess(encoded, full)
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2)])
+class PriorityRestoreTests(TestCase):
+    options = RestoreOptions(priority=True)
+
+    def test_order(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        publisher.publish(builds[1])
+        publisher.tag(builds[3], "stable")
+        fp = dump_builds(builds)
+        delete_builds(builds)
+        restored: list[Build] = []
+        committed: list[list[bool]] = []
+
+        def callback(_type: str, phase: str, build: Build) -> None:
+            if phase == "storage":
+                restored.append(build)
+                committed.append([records_exist(b) for b in restored])
+
+        restore(fp, callback=callback, options=self.options)
+
+        # The published build, the tagged build and then the newest of each machine
+        expected = [builds[1], builds[3], builds[4], builds[2], builds[0]]
+        self.assertEqual(expected, restored)
+        # Each build is committed before the next is started
+        self.assertEqual([[j < i for j in range(i + 1)] for i in range(5)], committed)
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+        self.assertEqual(["stable"], publisher.storage.get_tags(builds[3]))
+
+    def test_links_and_deltas(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        texts = lib.write_packages(builds)
+        first = publisher.storage.get_path(builds[0], Content.REPOS)
+        last = publisher.storage.get_path(builds[2], Content.REPOS)
+        (first / "shared").write_bytes(b"test")
+        os.link(first / "shared", last / "shared")
+        fp = dump_builds(builds, DumpOptions(delta=True))
+        delete_builds(builds)
+
+        restore(fp, options=self.options)
+
+        for build, text in zip(builds, texts):
+            repos = publisher.storage.get_path(build, Content.REPOS)
+            self.assertEqual(text, (repos / "Packages").read_bytes())
+        self.assertTrue((first / "shared").samefile(last / "shared"))
+
+    def test_emits_postpull_signals_when_committed(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        publisher.publish(builds[1])
+        fp = dump_builds(builds)
+        delete_builds(builds)
+        signalled: list[Build] = []
+
+        def post_pull(*, build: Build, **_kwargs: Any) -> None:
+            self.assertTrue(records_exist(build))
+            signalled.append(Build(build.machine, build.build_id))
+
+        signals.dispatcher.bind(postpull=post_pull)
+        restored: list[Build] = []
+        restore(
+            fp,
+            callback=lambda _type, phase, build: restored.append(build),
+            options=self.options,
+        )
+
+        self.assertEqual([b for b in restored if b in signalled], signalled)
+        self.assertEqual(builds[1], signalled[0])
+        self.assertEqual(len(builds), len(signalled))
+
+    def test_unseekable(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        publisher.publish(builds[1])
+        fp = lib.Unseekable(dump_builds(builds).getvalue())
+        delete_builds(builds)
+        restored: list[Build] = []
+
+        restore(
+            fp,
+            callback=lambda _type, phase, build: (
+                restored.append(build) if phase == "storage" else None
+            ),
+            options=self.options,
+        )
+
+        self.assertEqual(sorted(builds, key=build_sort_key), restored)
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+
+    def test_corrupt_storage(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        lib.write_packages(builds)
+        dumps = {
+            reproducible: dump_builds(builds, DumpOptions(reproducible=reproducible))
+            for reproducible in [False, True]
+        }
+        delete_builds(builds)
+        signalled: list[Build] = []
+
+        def post_pull(*, build: Build, **_kwargs: Any) -> None:
+            signalled.append(build)
+
+        signals.dispatcher.bind(postpull=post_pull)
+
+        for (reproducible, fp), archive in itertools.product(
+            dumps.items(), [io.BytesIO, lib.Unseekable]
+        ):
+            with self.subTest(reproducible=reproducible, archive=archive.__name__):
+                data = bytearray(fp.getvalue())
+                data[data.index(b"CPV: app-misc/package-500")] ^= 1
+
+                with self.assertRaises(tar.ReadError):
+                    restore(archive(bytes(data)), options=self.options)
+
+                self.assertEqual([], signalled)
+                for build in builds:
+                    self.assertFalse(records_exist(build))
+                    self.assertFalse(publisher.storage.pulled(build))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 30)])
+class PriorityRestoreDeltaChainTests(TestCase):
+    def test_does_not_recurse(self, fixtures: Fixtures) -> None:
+        # Each build's Packages is a delta of the previous build's, and the newest is
+        # restored first. Were the chain followed by recursion, it would take more than
+        # the stack that restoring a build needs
+        builds = fixtures.builds
+        texts = lib.write_packages(builds)
+        fp = storage_archive(dump_builds(builds, DumpOptions(delta=True)))
+        delete_builds(builds)
+        options = RestoreOptions(priority=True)
+        limit = sys.getrecursionlimit()
+
+        with Stage() as stage:
+            sys.setrecursionlimit(len(inspect.stack()) + 30)
+            try:
+                storage.restore(fp, callback=mock.Mock(), options=options, stage=stage)
+            finally:
+                sys.setrecursionlimit(limit)
+
+        for build, text in zip(builds, texts):
+            repos = publisher.storage.get_path(build, Content.REPOS)
+            self.assertEqual(text, (repos / "Packages").read_bytes())
+
+
+def dump_builds(
+    builds: list[Build], options: DumpOptions = DumpOptions()
+) -> io.BytesIO:
+    fp = io.BytesIO()
+    dump(builds, fp, options=options)
+    fp.seek(0)
+
+    return fp
+
+
+def delete_builds(builds: list[Build]) -> None:
+    for build in builds:
+        publisher.delete(build)
+
+
+def records_exist(build: Build) -> bool:
+    return publisher.repo.build_records.exists(build)
+
+
+def storage_archive(fp: io.BytesIO) -> io.BytesIO:
+    """Return the storage archive of the given dump"""
+    return io.BytesIO(read_members(fp)[storage.ARCHIVE_NAME])
+
+
+def patch_statvfs(
+    *, bavail: int = 1_000_000, files: int = 1_000_000, favail: int = 1_000_000
+) -> Any:
+    """Patch os.statvfs to report a file system of 4K blocks with the given room"""
+    result = os.statvfs_result(
+        (4096, 4096, 1_000_000, bavail, bavail, files, favail, favail, 0, 255)
+    )
+    return mock.patch("gbp_archive.storage.os.statvfs", return_value=result)
+
+
+def read_members(fp: io.BytesIO) -> dict[str, bytes]:
+    """Return the members, in order, of the given archive"""
+    fp.seek(0)
+    with tar.open(fileobj=fp) as tarfile:
+        return {
+            member.name: tarfile.extractfile(member).read()  # type: ignore[union-attr]
+            for member in tarfile.getmembers()
+        }
+
+
+def make_archive(members: dict[str, bytes]) -> io.BytesIO:
+    """Return an archive of the given members, in order"""
+    fp = io.BytesIO()
+    with tar.open(fileobj=fp, mode="w") as tarfile:
+        for name, data in members.items():
+            tarinfo = tar.TarInfo(name)
+            tarinfo.size = len(data)
+            tarfile.addfile(tarinfo, io.BytesIO(data))
+    fp.seek(0)
+
+    return fp
+
+
+def stat_result(*, ino: int, nlink: int) -> os.stat_result:
+    """Return the stat_result of a regular file with the given inode and links"""
+    return os.stat_result((0o100644, ino, 1, nlink, 0, 0, 0, 0, 0, 0))
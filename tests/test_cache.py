@@ -0,0 +1,311 @@
+"""Tests for the cache module"""
+
+# pylint: disable=missing-docstring
+
+import io
+import os
+import tarfile as tar
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import cache, storage
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+@given(testkit.tmpdir)
+class SegmentCacheTests(TestCase):
+    def test_add(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            with segments.add(build, "key") as (fp, links, needs):
+                fp.write(b"segment")
+                links.append("repos/foo.1/a")
+                needs["foo.0"] = None
+
+            segment = segments.get(build, "key")
+
+            self.assertEqual(1, len(segments))
+            self.assertEqual(7, segments.size)
+
+        assert segment is not None
+        self.assertEqual(b"segment", segment.path.read_bytes())
+        self.assertEqual(["repos/foo.1/a"], segment.links)
+        self.assertEqual({"foo.0": None}, segment.needs)
+
+    def test_other_key(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            add_segment(segments, build, b"segment")
+
+            self.assertIsNone(segments.get(build, "other"))
+            self.assertIsNone(segments.get(Build("foo", "2"), "key"))
+
+    def test_add_replaces_segment(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            add_segment(segments, build, b"old", key="old")
+            add_segment(segments, build, b"new", key="new")
+            segment = segments.get(build, "new")
+
+            self.assertIsNone(segments.get(build, "old"))
+            self.assertEqual(1, len(segments))
+
+        assert segment is not None
+        self.assertEqual(b"new", segment.path.read_bytes())
+
+    def test_add_error(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            with self.assertRaises(OSError):
+                with segments.add(build, "key") as (fp, *_):
+                    fp.write(b"partial")
+                    raise OSError("No space left on device")
+
+            self.assertIsNone(segments.get(build, "key"))
+            self.assertEqual(["index.sqlite"], os.listdir(segments.directory))
+
+    def test_segment_larger_than_cache(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 4) as segments:
+            add_segment(segments, build, b"segment")
+
+            self.assertIsNone(segments.get(build, "key"))
+            self.assertEqual(0, len(segments))
+
+    def test_evicts_least_recently_used(self, fixtures: Fixtures) -> None:
+        builds = [Build("foo", str(number)) for number in range(3)]
+
+        with cache.SegmentCache(fixtures.tmpdir, 20) as segments:
+            add_segment(segments, builds[0], b"0123456789")
+            add_segment(segments, builds[1], b"0123456789")
+            segments.get(builds[0], "key")
+            add_segment(segments, builds[2], b"0123456789")
+
+            self.assertIsNotNone(segments.get(builds[0], "key"))
+            self.assertIsNone(segments.get(builds[1], "key"))
+            self.assertIsNotNone(segments.get(builds[2], "key"))
+            self.assertEqual(20, segments.size)
+            self.assertFalse(segments.segment_path(builds[1]).exists())
+
+    def test_evict_smaller_cache(self, fixtures: Fixtures) -> None:
+        builds = [Build("foo", str(number)) for number in range(3)]
+
+        with cache.SegmentCache(fixtures.tmpdir, 30) as segments:
+            for build in builds:
+                add_segment(segments, build, b"0123456789")
+
+        with cache.SegmentCache(fixtures.tmpdir, 10) as segments:
+            self.assertEqual(builds[:2], segments.evict())
+            self.assertEqual(1, len(segments))
+
+    def test_prune(self, fixtures: Fixtures) -> None:
+        builds = [Build("foo", "1"), Build("foo", "2")]
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            for build in builds:
+                add_segment(segments, build, b"segment")
+
+            pruned = segments.prune(lambda build: build != builds[0])
+
+            self.assertEqual([builds[0]], pruned)
+            self.assertIsNone(segments.get(builds[0], "key"))
+            self.assertIsNotNone(segments.get(builds[1], "key"))
+            self.assertFalse(segments.links_path(builds[0]).exists())
+
+    def test_usable(self, fixtures: Fixtures) -> None:
+        segment = cache.Segment(fixtures.tmpdir / "segment", [], {"foo.1": "foo.0"})
+
+        self.assertTrue(segment.usable({"foo.0": None, "foo.1": "foo.0"}))
+        # The build it needs wasn't dumped
+        self.assertFalse(segment.usable({"foo.0": None}))
+        # The build it needs was dumped after another build
+        self.assertFalse(segment.usable({"foo.1": None}))
+
+    def test_missing_links(self, fixtures: Fixtures) -> None:
+        build = Build("foo", "1")
+
+        with cache.SegmentCache(fixtures.tmpdir, 1024) as segments:
+            add_segment(segments, build, b"segment")
+            segments.links_path(build).unlink()
+
+            self.assertIsNone(segments.get(build, "key"))
+            self.assertEqual(0, len(segments))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 2)])
+class SegmentKeyTests(TestCase):
+    def test_same(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[1]
+
+        self.assertEqual(
+            cache.segment_key(build, fixtures.builds[0], DumpOptions()),
+            cache.segment_key(build, fixtures.builds[0], DumpOptions()),
+        )
+
+    def test_base(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[1]
+
+        self.assertNotEqual(
+            cache.segment_key(build, fixtures.builds[0], DumpOptions()),
+            cache.segment_key(build, None, DumpOptions()),
+        )
+
+    def test_options(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+
+        self.assertNotEqual(
+            cache.segment_key(build, None, DumpOptions()),
+            cache.segment_key(build, None, DumpOptions(compress=True)),
+        )
+
+    def test_tags(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        key = cache.segment_key(build, None, DumpOptions())
+
+        publisher.tag(build, "mytag")
+
+        self.assertNotEqual(key, cache.segment_key(build, None, DumpOptions()))
+
+    def test_storage_changed(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        key = cache.segment_key(build, None, DumpOptions())
+
+        path = publisher.storage.get_path(build, Content.REPOS)
+        (path / "new.txt").write_bytes(b"test")
+
+        self.assertNotEqual(key, cache.segment_key(build, None, DumpOptions()))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2)])
+class StorageDumpTests(TestCase):
+    options = DumpOptions(reproducible=True, cache_size=1024**3)
+
+    def test_same_as_uncached(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        link_files(builds)
+        expected = dump_storage(builds, DumpOptions(reproducible=True))
+
+        self.assertEqual(expected, dump_storage(builds, self.options))
+        self.assertEqual(expected, dump_storage(builds, self.options))
+
+    def test_reuses_segments(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_storage(builds, self.options)
+
+        with mock.patch.object(storage, "add_build") as add_build:
+            dump_storage(builds, self.options)
+
+        add_build.assert_not_called()
+
+    def test_partially_cached(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        link_files(builds)
+        expected = dump_storage(builds, DumpOptions(reproducible=True))
+        dump_storage(builds, self.options)
+
+        with cache.SegmentCache(publisher.storage.root, 1024**3) as segments:
+            segments.remove(builds[1])
+
+        self.assertEqual(expected, dump_storage(builds, self.options))
+
+    def test_links_to_cached_segment(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        link_files(builds)
+        dump_storage(builds, self.options)
+
+        with cache.SegmentCache(publisher.storage.root, 1024**3) as segments:
+            segments.remove(builds[2])
+
+        with tar.open(fileobj=io.BytesIO(dump_storage(builds, self.options))) as fp:
+            member = fp.getmember(f"repos/{builds[2]}/shared")
+
+        self.assertTrue(member.islnk())
+        self.assertEqual(f"repos/{builds[0]}/shared", member.linkname)
+
+    def test_reuses_segments_after_purge(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_storage(builds, self.options)
+        publisher.delete(builds[1])
+        del builds[1]
+
+        with mock.patch.object(storage, "add_build", wraps=storage.add_build) as add:
+            dump_storage(builds, self.options)
+
+        # The later build's hard links are to the first build, not the purged one
+        add.assert_not_called()
+
+    def test_rewrites_segments_linked_to_purged_build(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        link_files(builds)
+        dump_storage(builds, self.options)
+        publisher.delete(builds[0])
+        expected = dump_storage(builds[1:], DumpOptions(reproducible=True))
+
+        with mock.patch.object(storage, "add_build", wraps=storage.add_build) as add:
+            self.assertEqual(expected, dump_storage(builds[1:], self.options))
+
+        # The machine's other builds linked to the purged build. The bar builds didn't
+        self.assertEqual(builds[1:3], [call.args[1] for call in add.call_args_list])
+
+    def test_delta_base_purged(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        options = DumpOptions(reproducible=True, delta=True, cache_size=1024**3)
+        dump_storage(builds, options)
+        publisher.delete(builds[1])
+        del builds[1]
+
+        with mock.patch.object(storage, "add_build", wraps=storage.add_build) as add:
+            dump_storage(builds, options)
+
+        self.assertEqual([builds[1]], [call.args[1] for call in add.call_args_list])
+
+    def test_purged_builds_dropped(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_storage(builds, self.options)
+
+        publisher.delete(builds[0])
+        dump_storage(builds[1:], self.options)
+
+        with cache.SegmentCache(publisher.storage.root, 1024**3) as segments:
+            self.assertEqual(len(builds) - 1, len(segments))
+            self.assertFalse(segments.segment_path(builds[0]).exists())
+
+
+def add_segment(
+    segments: cache.SegmentCache, build: Build, data: bytes, key: str = "key"
+) -> None:
+    with segments.add(build, key) as (fp, *_):
+        fp.write(data)
+
+
+def link_files(builds: list[Build]) -> None:
+    """Hard link a file into the repos of each of the foo builds"""
+    paths = [
+        publisher.storage.get_path(build, Content.REPOS) / "shared"
+        for build in builds
+        if build.machine == "foo"
+    ]
+    paths[0].write_bytes(b"test")
+
+    for path in paths[1:]:
+        os.link(paths[0], path)
+
+
+def dump_storage(builds: list[Build], options: DumpOptions) -> bytes:
+    fp = io.BytesIO()
+    storage.dump(builds, fp, callback=mock.Mock(), options=options)
+
+    return fp.getvalue()
@@ -0,0 +1,123 @@
+"""Tests for the catalog module"""
+
+# pylint: disable=missing-docstring
+
+import datetime as dt
+import os
+from pathlib import Path
+from typing import Iterable
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher.types import Build
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import catalog, core
+
+from . import lib
+
+LOCALTIME = dt.datetime(2025, 3, 1, 3, tzinfo=dt.UTC)
+DAY = dt.timedelta(days=1)
+
+
+@given(testkit.publisher, testkit.tmpdir, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2)])
+class CatalogTests(TestCase):
+    def test_find(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dumps"
+        (directory / "nightly").mkdir(parents=True)
+        dump_at(builds, directory / "nightly/old.tar", LOCALTIME)
+        dump_at(builds[:3], directory / "nightly/new.tar", LOCALTIME + DAY)
+        dump_at(builds[3:], directory / "bar.tar", LOCALTIME + 2 * DAY)
+
+        with make_catalog(fixtures.tmpdir) as cat:
+            update = cat.update(directory)
+            found = cat.find(str(builds[0]))
+
+        self.assertEqual(3, len(update.read))
+        self.assertEqual(
+            [directory / "nightly/new.tar", directory / "nightly/old.tar"],
+            [archive.path for archive in found],
+        )
+        self.assertEqual((LOCALTIME + DAY).isoformat(), found[0].created)
+        self.assertEqual((directory / "nightly/new.tar").stat().st_size, found[0].size)
+
+    def test_find_machine(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir
+        dump_at(builds[:3], directory / "foo.tar", LOCALTIME)
+        dump_at(builds[3:], directory / "bar.tar", LOCALTIME)
+
+        with make_catalog(fixtures.tmpdir) as cat:
+            cat.update(directory)
+
+            self.assertEqual(
+                [directory / "bar.tar"], [archive.path for archive in cat.find("bar")]
+            )
+            self.assertEqual([], cat.find("bogus"))
+
+    def test_update_is_incremental(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dumps"
+        directory.mkdir()
+        dump_at(builds[:3], directory / "foo.tar", LOCALTIME)
+        dump_at(builds[3:], directory / "bar.tar", LOCALTIME)
+
+        with make_catalog(fixtures.tmpdir) as cat:
+            cat.update(directory)
+
+        os.utime(directory / "bar.tar", ns=(0, 0))
+        (directory / "new.tar").write_bytes((directory / "foo.tar").read_bytes())
+
+        with mock.patch.object(
+            catalog, "read_metadata", wraps=core.read_metadata
+        ) as read_metadata:
+            with make_catalog(fixtures.tmpdir) as cat:
+                update = cat.update(directory)
+
+        self.assertEqual([directory / "bar.tar", directory / "new.tar"], update.read)
+        self.assertEqual(2, read_metadata.call_count)
+
+    def test_update_removes_deleted_dumps(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dumps"
+        directory.mkdir()
+        dump_at(builds, directory / "all.tar", LOCALTIME)
+        other = fixtures.tmpdir / "other"
+        other.mkdir()
+        dump_at(builds, other / "all.tar", LOCALTIME)
+
+        with make_catalog(fixtures.tmpdir) as cat:
+            cat.update(directory)
+            cat.update(other)
+            (directory / "all.tar").unlink()
+
+            update = cat.update(directory)
+
+            self.assertEqual([directory / "all.tar"], update.removed)
+            self.assertEqual(
+                [other / "all.tar"],
+                [archive.path for archive in cat.find(str(builds[0]))],
+            )
+
+    def test_update_unreadable(self, fixtures: Fixtures) -> None:
+        directory = fixtures.tmpdir / "dumps"
+        directory.mkdir()
+        (directory / "bogus.tar").write_bytes(b"This is not a dump")
+
+        with make_catalog(fixtures.tmpdir) as cat:
+            update = cat.update(directory)
+
+            self.assertEqual([directory / "bogus.tar"], update.unreadable)
+            self.assertEqual(0, len(cat))
+
+
+def make_catalog(directory: Path) -> catalog.Catalog:
+    return catalog.Catalog(directory / catalog.CATALOG_PATH)
+
+
+def dump_at(builds: Iterable[Build], path: Path, timestamp: dt.datetime) -> None:
+    with mock.patch("gbp_archive.metadata.time.localtime", return_value=timestamp):
+        with path.open("wb") as fp:
+            core.dump(builds, fp)
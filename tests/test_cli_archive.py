@@ -0,0 +1,305 @@
+"""Tests for the cli archive subcommand"""
+
+# pylint: disable=missing-docstring
+
+import argparse
+from pathlib import Path
+from typing import Iterable
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gbp_testkit.helpers import parse_args, print_command
+from gbpcli.types import Console
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+from unittest_fixtures import Fixtures, Param, given, where
+
+import gbp_archive.core as archive
+from gbp_archive import jobs
+from gbp_archive.cli.archive import handler
+from gbp_archive.digests import DigestCache
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+@given(lib.builds, testkit.console, testkit.publisher, testkit.tmpdir, lib.cd)
+@where(cd=Param(lambda fixtures: fixtures.tmpdir))
+class ArchiveTests(TestCase):
+    def test_merge(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds[:3], Path("first.tar"))
+        dump_builds(builds[3:], Path("second.tar"))
+
+        cmdline = "gbp archive merge -o merged.tar first.tar second.tar"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(set(builds), set(tabulate(Path("merged.tar"))))
+
+    def test_filter(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, Path("test.tar"))
+
+        cmdline = f"gbp archive filter -f test.tar -o out.tar polaris {builds[0]}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        expected = {builds[0], *(b for b in builds if b.machine == "polaris")}
+        self.assertEqual(expected, set(tabulate(Path("out.tar"))))
+
+    def test_split(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, Path("test.tar"))
+        Path("split").mkdir()
+
+        cmdline = "gbp archive split -f test.tar -d split"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        machines = sorted({build.machine for build in builds})
+        self.assertEqual(
+            [f"split/{machine}.tar" for machine in machines],
+            console.out.file.getvalue().strip().split("\n")[1:],
+        )
+
+    def test_consolidate(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds[:3], Path("base.tar"))
+        dump_builds(builds[3:], Path("incremental.tar"))
+        publisher.delete(builds[0])
+
+        cmdline = (
+            "gbp archive consolidate -o full.tar --keep 1 incremental.tar base.tar"
+        )
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status, console.err.file.getvalue())
+        self.assertEqual(set(builds[1:]), set(tabulate(Path("full.tar"))))
+        self.assertFalse(Path("base.tar").exists())
+        self.assertTrue(Path("incremental.tar").exists())
+        output = console.out.file.getvalue()
+        self.assertIn("removed base.tar", output)
+        self.assertNotIn("removed incremental.tar", output)
+
+    def test_consolidate_keep_purged(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds[:3], Path("base.tar"))
+        dump_builds(builds[3:], Path("incremental.tar"))
+        publisher.delete(builds[0])
+
+        args = parse_args(
+            "gbp archive consolidate -o full.tar --keep-purged base.tar incremental.tar"
+        )
+        status = archive_(args, fixtures.console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(set(builds), set(tabulate(Path("full.tar"))))
+        self.assertTrue(Path("base.tar").exists())
+
+    def test_consolidate_into_chain(self, fixtures: Fixtures) -> None:
+        dump_builds(fixtures.builds, Path("base.tar"))
+
+        args = parse_args("gbp archive consolidate -o base.tar base.tar")
+        console = fixtures.console
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "The output can't be one of the dumps consolidated.\n",
+            console.err.file.getvalue(),
+        )
+
+    def test_verify(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        path = publisher.storage.get_path(builds[0], Content.REPOS) / "test.txt"
+        path.write_bytes(b"test")
+        with Path("test.tar").open("wb") as outfile:
+            archive.dump(builds, outfile, options=DumpOptions(checksums=True))
+        path.unlink()
+
+        cmdline = "gbp archive verify -f test.tar"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        name = path.relative_to(publisher.storage.root)
+        lines = console.out.file.getvalue().strip().split("\n")
+        self.assertEqual(f"missing {name}", lines[0])
+        self.assertRegex(lines[-1], r"^\d+ files checked, 1 failed$")
+
+    def test_verify_without_checksums(self, fixtures: Fixtures) -> None:
+        dump_builds(fixtures.builds, Path("test.tar"))
+
+        args = parse_args("gbp archive verify -f test.tar")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "The dump has no digests. See `gbp dump --checksums`.\n",
+            console.err.file.getvalue(),
+        )
+
+    def test_prune_digests(self, fixtures: Fixtures) -> None:
+        path = publisher.storage.root / "test.txt"
+        path.write_bytes(b"test")
+        with DigestCache(publisher.storage.root) as digests:
+            digests.digest("test.txt")
+        path.unlink()
+
+        args = parse_args("gbp archive prune-digests")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual("removed 1 stale digests\n", console.out.file.getvalue())
+
+    def test_catalog_and_find(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        Path("dumps").mkdir()
+        dump_builds(builds, Path("dumps/all.tar"))
+        Path("dumps/bogus.tar").write_bytes(b"This is not a dump")
+
+        args = parse_args("gbp archive catalog dumps")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(
+            "1 read, 0 removed, 1 in the catalog\n", console.out.file.getvalue()
+        )
+        self.assertEqual(
+            f"{Path('dumps/bogus.tar').absolute()} is not a dump.\n",
+            console.err.file.getvalue(),
+        )
+
+        console.out.file.truncate(0)
+        console.out.file.seek(0)
+        args = parse_args(f"gbp archive find {builds[0]}")
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(
+            f"{Path('dumps/all.tar').absolute()}\n", console.out.file.getvalue()
+        )
+
+    def test_find_not_found(self, fixtures: Fixtures) -> None:
+        args = parse_args("gbp archive find bogus")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "bogus not found in the catalog.\n", console.err.file.getvalue()
+        )
+
+    def test_corrupt_archive(self, fixtures: Fixtures) -> None:
+        Path("test.tar").write_bytes(b"This is not a dump")
+
+        cmdline = "gbp archive filter -f test.tar -o out.tar polaris"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        self.assertTrue(console.err.file.getvalue())
+
+
+@given(lib.builds, testkit.console, testkit.publisher, testkit.tmpdir, lib.worker)
+class JobsTests(TestCase):
+    def test_jobs(self, fixtures: Fixtures) -> None:
+        job = jobs.submit_dump(fixtures.builds, fixtures.tmpdir / "test.tar")
+        lib.run_tasks(fixtures.worker)
+
+        cmdline = "gbp archive jobs"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        output = console.out.file.getvalue()
+        self.assertIn(job["id"], output)
+        self.assertIn("done", output)
+        self.assertIn("12/12", output)
+
+    def test_given_job(self, fixtures: Fixtures) -> None:
+        first = jobs.submit_dump(fixtures.builds, fixtures.tmpdir / "first.tar")
+        second = jobs.submit_dump(fixtures.builds, fixtures.tmpdir / "second.tar")
+
+        args = parse_args(f"gbp archive jobs {second['id']}")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        output = console.out.file.getvalue()
+        self.assertIn(second["id"], output)
+        self.assertNotIn(first["id"], output)
+
+    def test_cancel(self, fixtures: Fixtures) -> None:
+        job = jobs.submit_dump(fixtures.builds, fixtures.tmpdir / "test.tar")
+
+        cmdline = f"gbp archive cancel {job['id']}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = archive_(args, console)
+
+        self.assertEqual(0, status)
+        self.assertIn("cancelling", console.out.file.getvalue())
+
+        lib.run_tasks(fixtures.worker)
+
+        self.assertEqual("cancelled", jobs.get(job["id"])["state"])
+
+    def test_job_not_found(self, fixtures: Fixtures) -> None:
+        args = parse_args("gbp archive cancel bogus")
+        console = fixtures.console
+
+        status = archive_(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual("Job bogus not found.\n", console.err.file.getvalue())
+
+
+def archive_(args: argparse.Namespace, console: Console) -> int:
+    """Call the archive handler with a mock gbp instance"""
+    return handler(args, mock.Mock(), console)
+
+
+def dump_builds(builds: Iterable[Build], path: Path) -> None:
+    with path.open("wb") as outfile:
+        archive.dump(builds, outfile)
+
+
+def tabulate(path: Path) -> list[Build]:
+    with path.open("rb") as fp:
+        return archive.tabulate(fp)
@@ -7,24 +7,35 @@ import json
 import tarfile as tar
 from pathlib import Path
 from typing import Any, cast
-from unittest import TestCase
+from unittest import TestCase, mock
 
 import gbp_testkit.fixtures as testkit
 from gbpcli.utils import EPOCH
 from gentoo_build_publisher import publisher
 from unittest_fixtures import Fixtures, Param, given, where
 
+from gbp_archive import jobs
+from gbp_archive.summary import estimate
+from gbp_archive.sync import write_handshake
+
 from . import lib
 
 PATH = Path("test.tar")
 
 
-@given(testkit.publisher, lib.builds, testkit.tmpdir, lib.cd, testkit.gbpcli)
+@given(
+    testkit.publisher, lib.builds, lib.worker, testkit.tmpdir, lib.cd, testkit.gbpcli
+)
 @given(stdout=testkit.patch)
 @where(stdout__target="gbp_archive.cli.dump.sys.stdout")
 @where(argparse_stdout__target="argparse._sys.stdout")
 @where(cd=Param(lambda fixtures: fixtures.tmpdir))
-class DumpTests(TestCase):
+class DumpTestCase(TestCase):
+    """The fixtures of the dump subcommand's tests"""
+
+
+@given()
+class DumpTests(DumpTestCase):
     def test_dump_all(self, fixtures: Fixtures) -> None:
         status = fixtures.gbpcli(f"gbp dump -f {PATH}")
 
@@ -143,14 +154,292 @@ class DumpTests(TestCase):
         self.assertEqual(0, status)
         output = fixtures.console.out.file.getvalue()
         lines = output.strip().split("\n")[1:]
-        self.assertEqual(3, len(lines))
-        self.assertTrue(all(i.startswith("lighthouse.") for i in lines))
+        self.assertEqual(4, len(lines))
+        self.assertTrue(all(i.startswith("lighthouse.") for i in lines[:3]))
+        self.assertTrue(lines[3].startswith("Estimated size: "))
+
+    def test_list_flag_estimate(self, fixtures: Fixtures) -> None:
+        builds = [build for build in fixtures.builds if build.machine == "lighthouse"]
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} lighthouse")
+        self.assertEqual(0, status)
+        dump_size = PATH.stat().st_size
+
+        result = estimate(builds)
+
+        self.assertEqual({str(build) for build in builds}, set(result["builds"]))
+        self.assertLessEqual(sum(result["builds"].values()), result["size"])
+        # Within 20% of the actual dump
+        self.assertLess(abs(result["size"] - dump_size), dump_size / 5)
+
+    def test_content_flags(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(
+            f"gbp dump -f {PATH} --content repos --content binpkgs"
+            " --exclude-content binpkgs"
+        )
+
+        self.assertEqual(0, status)
+        with tar.open(PATH) as tarfile:
+            metadata_fp = tarfile.extractfile("gbp-archive")
+            assert metadata_fp is not None
+            self.assertEqual(["repos"], json.load(metadata_fp)["contents"])
+
+            storage_fp = tarfile.extractfile("storage.tar")
+            assert storage_fp is not None
+            with tar.open(fileobj=storage_fp) as storage_tarfile:
+                names = storage_tarfile.getnames()
+
+        self.assertEqual({"repos"}, {name.split("/")[0] for name in names})
+
+    def test_loads_only_given_machines(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        build_records = publisher.repo.build_records
+
+        with mock.patch.object(
+            build_records, "for_machine", wraps=build_records.for_machine
+        ) as for_machine:
+            status = fixtures.gbpcli(f"gbp dump -f {PATH} lighthouse {builds[0]}")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertEqual(3, len(records(PATH)))
+        for_machine.assert_called_once_with("lighthouse")
+
+    def test_from_file(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        Path("buildspecs").write_text(
+            f"# builds to dump\nlighthouse\n\n{builds[-1]}  # the last one\n",
+            encoding="utf8",
+        )
+
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --from-file buildspecs")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertEqual(4, len(records(PATH)))
+
+    def test_from_file_and_args(self, fixtures: Fixtures) -> None:
+        Path("buildspecs").write_text("lighthouse\n", encoding="utf8")
+
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --from-file buildspecs polaris")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertEqual(5, len(records(PATH)))
+
+    def test_from_stdin(self, fixtures: Fixtures) -> None:
+        with mock.patch("gbp_archive.cli.dump.sys.stdin", io.StringIO("polaris\n")):
+            status = fixtures.gbpcli(f"gbp dump -f {PATH} --from-file -")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertEqual(2, len(records(PATH)))
+
+    def test_from_empty_file(self, fixtures: Fixtures) -> None:
+        Path("buildspecs").write_text("# nothing to see here\n", encoding="utf8")
+
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --from-file buildspecs")
+
+        self.assertEqual(1, status)
+        self.assertFalse(PATH.exists())
+        self.assertEqual(
+            "No buildspecs in buildspecs.\n", fixtures.console.err.file.getvalue()
+        )
+
+    def test_from_missing_file(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --from-file bogus")
+
+        self.assertEqual(1, status)
+        self.assertFalse(PATH.exists())
+        self.assertIn("No such file or directory", fixtures.console.err.file.getvalue())
+
+    def test_invalid_content(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --content bogus")
+
+        self.assertEqual(1, status)
+        self.assertFalse(PATH.exists())
+        self.assertEqual(
+            "'bogus' is not a valid Content.\n", fixtures.console.err.file.getvalue()
+        )
+
+
+@given()
+class DumpOptionsTests(DumpTestCase):
+    def test_max_rate_and_idle_flags(self, fixtures: Fixtures) -> None:
+        with mock.patch("gbp_archive.throttle.subprocess.run") as run:
+            status = fixtures.gbpcli(f"gbp dump -f {PATH} --max-rate 1G --idle")
+
+        self.assertEqual(0, status)
+        self.assertEqual(6, len(records(PATH)))
+        self.assertEqual("ionice", run.call_args[0][0][0])
+
+    def test_reproducible_flag(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --reproducible")
+
+        self.assertEqual(0, status)
+        with tar.open(PATH) as tarfile:
+            self.assertEqual(
+                ["records.json", "storage.tar", "gbp-archive"], tarfile.getnames()
+            )
+        self.assertEqual(6, len(records(PATH)))
+
+    def test_checksums_flag(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --checksums")
+
+        self.assertEqual(0, status)
+        with tar.open(PATH) as tarfile:
+            fp = tarfile.extractfile("storage.tar")
+            assert fp is not None
+            with tar.open(fileobj=fp) as storage_tarfile:
+                headers = [
+                    member.pax_headers.get("GBP.digest")
+                    for member in storage_tarfile.getmembers()
+                    if member.isfile()
+                ]
+        self.assertTrue(headers)
+        self.assertTrue(all(str(header).startswith("sha256:") for header in headers))
+
+    def test_compress_flag(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --compress")
+
+        self.assertEqual(0, status)
+        self.assertEqual(6, len(records(PATH)))
+
+    def test_delta_flag(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --delta")
+
+        self.assertEqual(0, status)
+        self.assertEqual(6, len(records(PATH)))
+
+    def test_cache(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --cache 1G")
+
+        self.assertEqual(0, status)
+        self.assertEqual(6, len(records(PATH)))
+        cache_dir = publisher.storage.root / ".gbp-archive/segments"
+        self.assertEqual(6, len(list(cache_dir.glob("*.tar"))))
+
+    def test_directory(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli("gbp dump -d dump")
+
+        self.assertEqual(0, status)
+        self.assertEqual(
+            ["babette.tar", "checkpoint.json", "lighthouse.tar", "polaris.tar"],
+            sorted(path.name for path in Path("dump").iterdir()),
+        )
+        self.assertEqual(3, len(records(Path("dump/lighthouse.tar"))))
+
+    def test_directory_resume(self, fixtures: Fixtures) -> None:
+        with mock.patch("gbp_archive.segments.core.dump") as dump:
+            dump.side_effect = OSError("No space left on device")
+            status = fixtures.gbpcli("gbp dump -d dump")
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "No space left on device. Continue the dump with --resume.\n",
+            fixtures.console.err.file.getvalue(),
+        )
+
+        status = fixtures.gbpcli("gbp dump -d dump --resume")
+
+        self.assertEqual(0, status)
+        self.assertEqual(3, len(records(Path("dump/lighthouse.tar"))))
+
+    def test_resume_without_directory(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump -f {PATH} --resume")
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "--resume requires --directory.\n", fixtures.console.err.file.getvalue()
+        )
+
+    def test_sync_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        receiver = Path("receiver.sh")
+        handshake = io.BytesIO()
+        write_handshake(handshake, builds[:4])
+        receiver.write_text(
+            f"printf '%s' '{handshake.getvalue().decode()}'\ncat > {PATH}\n",
+            encoding="utf8",
+        )
+
+        status = fixtures.gbpcli(f"gbp dump --sync 'sh {receiver}'")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertEqual(
+            {str(build) for build in builds[4:]},
+            {f"{record['machine']}.{record['build_id']}" for record in records(PATH)},
+        )
+
+    def test_sync_flag_with_invalid_handshake(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli("gbp dump --sync 'echo bogus'")
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "Invalid handshake: b'bogus\\n'.\n", fixtures.console.err.file.getvalue()
+        )
+
+    def test_sync_flag_with_failing_receiver(self, fixtures: Fixtures) -> None:
+        receiver = Path("receiver.sh")
+        handshake = io.BytesIO()
+        write_handshake(handshake, [])
+        receiver.write_text(
+            f"printf '%s' '{handshake.getvalue().decode()}'\nexit 3\n", encoding="utf8"
+        )
+
+        status = fixtures.gbpcli(f"gbp dump --sync 'sh {receiver}'")
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "Sync command failed with exit status 3.\n",
+            fixtures.console.err.file.getvalue(),
+        )
+
+    def test_background_flag(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli(f"gbp dump --background -f {PATH} lighthouse")
+
+        self.assertEqual(0, status, fixtures.console.err.file.getvalue())
+        self.assertFalse(PATH.exists())
+
+        job_id = fixtures.console.out.file.getvalue().split()[-1]
+        self.assertEqual("queued", jobs.get(job_id)["state"])
+
+        lib.run_tasks(fixtures.worker)
+
+        self.assertEqual("done", jobs.get(job_id)["state"])
+        self.assertEqual(3, len(records(PATH)))
+
+    def test_background_flag_without_file(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli("gbp dump --background")
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            "--background requires --file.\n", fixtures.console.err.file.getvalue()
+        )
+        self.assertEqual([], fixtures.worker)
 
     def test_help_flag(self, fixtures: Fixtures) -> None:
         with self.assertRaises(SystemExit):
             fixtures.gbpcli("gbp dump --help")
 
 
+@given(testkit.publisher, lib.builds, lib.object_store, testkit.gbpcli)
+class DumpToURLTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        store = fixtures.object_store
+
+        status = fixtures.gbpcli(f"gbp dump -f {store.url('test.tar')}")
+
+        self.assertEqual(0, status)
+        with tar.open(fileobj=io.BytesIO(store.objects["test.tar"])) as tarfile:
+            self.assertIn("records.json", tarfile.getnames())
+
+    def test_error(self, fixtures: Fixtures) -> None:
+        status = fixtures.gbpcli("gbp dump -f http://127.0.0.1:1/test.tar")
+
+        self.assertEqual(1, status)
+        self.assertTrue(
+            fixtures.console.err.file.getvalue().startswith(
+                "POST http://127.0.0.1:1/test.tar?uploads failed"
+            )
+        )
+
+
 def records(path: Path) -> list[dict[str, Any]]:
     """Return the number of records in the dump file given by path"""
     with tar.open(path) as tarfile:
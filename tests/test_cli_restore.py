@@ -4,6 +4,8 @@
 
 import argparse
 import io
+import json
+import os
 from pathlib import Path
 from typing import Iterable
 from unittest import TestCase, mock
@@ -12,18 +14,24 @@ import gbp_testkit.fixtures as testkit
 from gbp_testkit.helpers import parse_args, print_command
 from gbpcli.types import Console
 from gentoo_build_publisher import publisher
-from gentoo_build_publisher.types import Build
+from gentoo_build_publisher.types import Build, Content
 from unittest_fixtures import Fixtures, Param, given, where
 
 import gbp_archive.core as archive
+from gbp_archive import jobs
 from gbp_archive.cli.restore import handler
+from gbp_archive.cli.restore import parse_args as parse_restore_args
+from gbp_archive.cli.utils import CONTENT_NAMES
 
 from . import lib
 
 PATH = Path("test.tar")
+FULL_FS = os.statvfs_result((4096, 4096, 1000, 0, 0, 1000, 0, 0, 0, 255))
 
 
-@given(lib.builds, testkit.console, testkit.publisher, testkit.tmpdir, lib.cd)
+@given(
+    lib.builds, lib.worker, testkit.console, testkit.publisher, testkit.tmpdir, lib.cd
+)
 @given(stdin=testkit.patch)
 @where(stdin__target="gbp_archive.cli.restore.sys.stdin")
 @given(argparse_stdout=testkit.patch)
@@ -99,6 +107,82 @@ class RestoreTests(TestCase):
 
         self.assertEqual(expected, console.err.file.getvalue())
 
+    def test_exclude_content_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore -f {PATH} --exclude-content binpkgs"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        status = restore(args, console)
+
+        self.assertEqual(0, status)
+
+        for build in builds:
+            self.assertTrue(publisher.repo.build_records.exists(build))
+            self.assertFalse(publisher.storage.pulled(build))
+            path = publisher.storage.get_path(build, Content.BINPKGS)
+            self.assertFalse(path.exists())
+
+    def test_staged_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore -f {PATH} --staged"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        status = restore(args, console)
+
+        self.assertEqual(0, status)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_priority_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore -f {PATH} --priority"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        status = restore(args, console)
+
+        self.assertEqual(0, status)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_sync_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        restore_image = fixtures.stdin.buffer = io.BytesIO()
+        archive.dump(builds[3:], restore_image)
+        delete_builds(builds[3:])
+        restore_image.seek(0)
+
+        cmdline = "gbp restore --sync"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        with mock.patch("gbp_archive.cli.restore.sys.stdout") as stdout:
+            stdout.buffer = io.BytesIO()
+            status = restore(args, console)
+
+        self.assertEqual(0, status)
+        handshake = json.loads(stdout.buffer.getvalue())
+        self.assertEqual({str(build) for build in builds[:3]}, set(handshake["builds"]))
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
     def test_list_flag(self, fixtures: Fixtures) -> None:
         builds = fixtures.builds
         dump_builds(builds, PATH)
@@ -121,6 +205,118 @@ class RestoreTests(TestCase):
         for build in builds:
             self.assertIn(str(build), lines)
 
+    def test_inspect_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore -if {PATH}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = restore(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(0, publisher.repo.build_records.count())
+
+        output = console.out.file.getvalue()
+        for build in builds:
+            self.assertIn(str(build), output)
+        self.assertIn("Total (after hard-link dedupe):", output)
+
+    def test_inspect_flag_without_summary(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+
+        cmdline = f"gbp restore -if {PATH}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+
+        with mock.patch.object(archive, "inspect", side_effect=LookupError("Nope")):
+            status = restore(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual("Nope.\n", console.err.file.getvalue())
+
+    def test_not_enough_space(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        args = parse_args(f"gbp restore -f {PATH}")
+        console = fixtures.console
+
+        with mock.patch("gbp_archive.storage.os.statvfs", return_value=FULL_FS):
+            status = restore(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual(0, publisher.repo.build_records.count())
+        # The console wraps the message so compare it without the line breaks
+        error = " ".join(console.err.file.getvalue().split())
+        self.assertTrue(error.startswith("Not enough space in the storage root"))
+        self.assertIn("Use --skip-preflight to restore anyway.", error)
+
+    def test_skip_preflight_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore --skip-preflight -f {PATH}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        with mock.patch("gbp_archive.storage.os.statvfs", return_value=FULL_FS):
+            status = restore(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(len(builds), publisher.repo.build_records.count())
+
+    def test_background_flag(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        dump_builds(builds, PATH)
+        delete_builds(builds)
+
+        cmdline = f"gbp restore --background -f {PATH}"
+        args = parse_args(cmdline)
+        console = fixtures.console
+        print_command(cmdline, console)
+
+        status = restore(args, console)
+
+        self.assertEqual(0, status)
+        self.assertEqual(0, publisher.repo.build_records.count())
+
+        lib.run_tasks(fixtures.worker)
+
+        job_id = console.out.file.getvalue().split()[-1]
+        self.assertEqual("done", jobs.get(job_id)["state"])
+        self.assertEqual(len(builds), publisher.repo.build_records.count())
+
+    def test_background_flag_without_file(self, fixtures: Fixtures) -> None:
+        args = parse_args("gbp restore --background")
+        console = fixtures.console
+
+        status = restore(args, console)
+
+        self.assertEqual(1, status)
+        self.assertEqual("--background requires --file.\n", console.err.file.getvalue())
+
+    def test_content_help_lists_every_content_type(self, fixtures: Fixtures) -> None:
+        # pylint: disable=unused-argument
+        with mock.patch.dict(os.environ, {"COLUMNS": "1000"}):
+            parser = argparse.ArgumentParser()
+            parse_restore_args(parser)
+            text = parser.format_help()
+
+        names = ", ".join(content.value for content in Content)
+        self.assertIn(f"Only restore the given content type ({names})", text)
+
+    def test_content_names(self, fixtures: Fixtures) -> None:
+        # pylint: disable=unused-argument
+        self.assertEqual(tuple(content.value for content in Content), CONTENT_NAMES)
+
     def test_help_flag(self, fixtures: Fixtures) -> None:
         # pylint: disable=duplicate-code
         cmdline = "gbp restore --help"
@@ -132,6 +328,36 @@ class RestoreTests(TestCase):
             parse_args(cmdline)
 
 
+@given(lib.builds, testkit.console, testkit.publisher, lib.object_store)
+class RestoreFromURLTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        store = fixtures.object_store
+        fp = io.BytesIO()
+        archive.dump(builds, fp)
+        store.objects["test.tar"] = fp.getvalue()
+        delete_builds(builds)
+
+        args = parse_args(f"gbp restore -f {store.url('test.tar')}")
+        status = restore(args, fixtures.console)
+
+        self.assertEqual(0, status)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_not_found(self, fixtures: Fixtures) -> None:
+        url = fixtures.object_store.url("bogus.tar")
+
+        status = restore(parse_args(f"gbp restore -f {url}"), fixtures.console)
+
+        self.assertEqual(1, status)
+        self.assertEqual(
+            f"HEAD {url} failed: 404 Not Found.\n", fixtures.console.err.file.getvalue()
+        )
+
+
 def restore(args: argparse.Namespace, console: Console) -> int:
     """Call the restore handler with a mock gbp instance"""
     return handler(args, mock.Mock(), console)
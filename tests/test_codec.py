@@ -0,0 +1,81 @@
+"""Tests for the codec module"""
+
+# pylint: disable=missing-docstring
+import datetime as dt
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+
+from gbp_testkit import TestCase
+
+from gbp_archive import codec, utils
+
+
+@dataclass(frozen=True)
+class Account:
+    name: str
+    balance: Decimal
+    due: dt.date | None = None
+
+
+@utils.convert_to(Account, "balance")
+def _(value: str) -> Decimal:
+    return Decimal(value)
+
+
+@utils.convert_to(Account, "due")
+def _(value: str | None) -> dt.date | None:  # pylint: disable=function-redefined
+    return None if value is None else dt.date.fromisoformat(value)
+
+
+@dataclass(frozen=True)
+class Name:
+    value: str
+
+
+class EncoderTests(TestCase):
+    def test(self) -> None:
+        account = Account("marduk", Decimal("5.00"), dt.date(2025, 2, 16))
+        encode = codec.encoder(Account)
+
+        self.assertEqual(asdict(account), encode(account))
+
+    def test_single_field(self) -> None:
+        encode = codec.encoder(Name)
+
+        self.assertEqual({"value": "marduk"}, encode(Name("marduk")))
+
+
+class DecoderTests(TestCase):
+    def test(self) -> None:
+        decode = codec.decoder(Account)
+
+        result = decode({"name": "marduk", "balance": "5.00", "due": "2025-02-16"})
+
+        expected = Account("marduk", Decimal("5.00"), dt.date(2025, 2, 16))
+        self.assertEqual(expected, result)
+
+    def test_missing_field(self) -> None:
+        decode = codec.decoder(Account)
+
+        result = decode({"name": "marduk", "balance": "5.00"})
+
+        self.assertEqual(Account("marduk", Decimal("5.00")), result)
+
+    def test_same_as_decode_to(self) -> None:
+        data = {"name": "marduk", "balance": "5.00", "due": None}
+        decode = codec.decoder(Account)
+
+        self.assertEqual(utils.decode_to(Account, dict(data)), decode(dict(data)))
+
+    def test_single_field(self) -> None:
+        decode = codec.decoder(Name)
+
+        self.assertEqual(Name("marduk"), decode({"value": "marduk"}))
+
+    def test_round_trip(self) -> None:
+        account = Account("marduk", Decimal("5.00"), dt.date(2025, 2, 16))
+        encoded = {
+            key: str(value) for key, value in codec.encoder(Account)(account).items()
+        }
+
+        self.assertEqual(account, codec.decoder(Account)(encoded))
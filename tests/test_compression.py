@@ -0,0 +1,122 @@
+"""Tests for the compression module"""
+
+# pylint: disable=missing-docstring
+
+import io
+import os
+import tarfile as tar
+from pathlib import Path
+from unittest import TestCase
+
+import gbp_testkit.fixtures as testkit
+from unittest_fixtures import Fixtures, Param, given, where
+
+from gbp_archive import compression
+
+from . import lib
+
+TEXT = b"".join(f"line {i} of some text\n".encode() for i in range(1000))
+
+
+class WorthwhileTests(TestCase):
+    def test_text(self) -> None:
+        self.assertTrue(worthwhile("Packages", TEXT))
+
+    def test_small_file(self) -> None:
+        self.assertFalse(worthwhile("Packages", TEXT[: compression.MIN_SIZE - 1]))
+
+    def test_compressed_suffix(self) -> None:
+        self.assertFalse(worthwhile("bash-5.2-1.gpkg.tar", TEXT))
+
+    def test_random_data(self) -> None:
+        self.assertFalse(worthwhile("Packages", os.urandom(len(TEXT))))
+
+    def test_rewinds(self) -> None:
+        fileobj = io.BytesIO(TEXT)
+
+        compression.worthwhile(Path("Packages"), len(TEXT), fileobj)
+
+        self.assertEqual(0, fileobj.tell())
+
+
+@given(testkit.tmpdir, lib.cd)
+@where(cd=Param(lambda fixtures: fixtures.tmpdir))
+class ExtractTests(TestCase):
+    # pylint: disable=unused-argument
+    def test(self, fixtures: Fixtures) -> None:
+        archive = make_archive("test.txt", TEXT)
+
+        with tar.open(fileobj=archive, mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            compression.extract(tarfile, tarinfo)
+
+        path = Path("test.txt")
+        self.assertEqual(TEXT, path.read_bytes())
+        self.assertEqual(0o640, path.stat().st_mode & 0o777)
+        self.assertEqual(1740000000, path.stat().st_mtime)
+
+    def test_corrupt_data(self, fixtures: Fixtures) -> None:
+        archive = make_archive("test.txt", TEXT)
+        data = bytearray(archive.getvalue())
+        # The pax header, its records and the file's header come before the data
+        offset = 3 * tar.BLOCKSIZE + 100
+        data[offset : offset + 16] = bytes(16)
+
+        with tar.open(fileobj=io.BytesIO(data), mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            with self.assertRaises(tar.ReadError):
+                compression.extract(tarfile, tarinfo)
+
+    def test_unsupported_codec(self, fixtures: Fixtures) -> None:
+        archive = make_archive("test.txt", TEXT, codec="bogus")
+
+        with tar.open(fileobj=archive, mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            with self.assertRaises(tar.ReadError):
+                compression.extract(tarfile, tarinfo)
+
+        self.assertFalse(Path("test.txt").exists())
+
+
+class FileSizeTests(TestCase):
+    def test_compressed(self) -> None:
+        archive = make_archive("test.txt", TEXT)
+
+        with tar.open(fileobj=archive) as tarfile:
+            tarinfo = tarfile.getmember("test.txt")
+
+        self.assertTrue(compression.is_compressed(tarinfo))
+        self.assertLess(tarinfo.size, len(TEXT))
+        self.assertEqual(len(TEXT), compression.file_size(tarinfo))
+
+    def test_uncompressed(self) -> None:
+        tarinfo = tar.TarInfo("test.txt")
+        tarinfo.size = 10
+
+        self.assertFalse(compression.is_compressed(tarinfo))
+        self.assertEqual(10, compression.file_size(tarinfo))
+
+
+def worthwhile(name: str, data: bytes) -> bool:
+    return compression.worthwhile(Path(name), len(data), io.BytesIO(data))
+
+
+def make_archive(name: str, data: bytes, codec: str = compression.CODEC) -> io.BytesIO:
+    """Return a tar archive of the given file, compressed"""
+    tarinfo = tar.TarInfo(name)
+    tarinfo.size = len(data)
+    tarinfo.mode = 0o640
+    tarinfo.mtime = 1740000000
+    fp = io.BytesIO()
+
+    with tar.open(fileobj=fp, mode="w", format=tar.PAX_FORMAT) as tarfile:
+        with compression.compress(tarinfo, io.BytesIO(data)) as compressed:
+            tarinfo.pax_headers[compression.HEADER] = codec
+            tarfile.addfile(tarinfo, compressed)
+
+    fp.seek(0)
+
+    return fp
@@ -0,0 +1,180 @@
+"""Tests for the delta module"""
+
+# pylint: disable=missing-docstring
+
+import io
+import os
+import tarfile as tar
+from pathlib import Path
+from unittest import TestCase
+
+import gbp_testkit.fixtures as testkit
+from unittest_fixtures import Fixtures, Param, given, where
+
+from gbp_archive import compression, delta
+
+from . import lib
+
+BASE = b"".join(f"line {i} of some text\n".encode() for i in range(1000))
+TEXT = BASE.replace(b"line 500 of", b"line 500 (changed) of") + b"a new line\n"
+
+
+class DiffTests(TestCase):
+    def test_round_trip(self) -> None:
+        encoded = delta.diff(BASE, TEXT)
+
+        self.assertLess(len(encoded), len(TEXT) // 10)
+        self.assertEqual(TEXT, delta.patch(BASE, encoded))
+
+    def test_reordered_lines(self) -> None:
+        lines = BASE.splitlines(keepends=True)
+        text = b"".join(lines[500:] + lines[:500])
+
+        encoded = delta.diff(BASE, text)
+
+        self.assertLess(len(encoded), len(text) // 10)
+        self.assertEqual(text, delta.patch(BASE, encoded))
+
+    def test_unrelated_data(self) -> None:
+        data = os.urandom(len(BASE))
+
+        self.assertEqual(data, delta.patch(BASE, delta.diff(BASE, data)))
+
+    def test_empty(self) -> None:
+        self.assertEqual(b"", delta.diff(BASE, b""))
+        self.assertEqual(BASE, delta.patch(b"", delta.diff(b"", BASE)))
+
+    def test_corrupt_delta(self) -> None:
+        encoded = delta.diff(BASE, TEXT)
+
+        for corrupt in [encoded[:-1], b"X" + encoded[1:], encoded[:5]]:
+            with self.assertRaises(ValueError):
+                delta.patch(BASE, corrupt)
+
+    def test_copy_past_end_of_base(self) -> None:
+        with self.assertRaises(ValueError):
+            delta.patch(BASE[:100], delta.diff(BASE, TEXT))
+
+
+@given(testkit.tmpdir, lib.cd)
+@where(cd=Param(lambda fixtures: fixtures.tmpdir))
+class WorthwhileTests(TestCase):
+    # pylint: disable=unused-argument
+    def test_text(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+
+        self.assertTrue(delta.worthwhile(Path("Packages"), len(TEXT), Path("base")))
+
+    def test_small_file(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+
+        self.assertFalse(delta.worthwhile(Path("Packages"), 10, Path("base")))
+
+    def test_compressed_suffix(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+
+        self.assertFalse(delta.worthwhile(Path("a.gpkg.tar"), len(TEXT), Path("base")))
+
+    def test_no_base(self, fixtures: Fixtures) -> None:
+        self.assertFalse(delta.worthwhile(Path("Packages"), len(TEXT), Path("base")))
+        self.assertFalse(
+            delta.worthwhile(Path("Packages"), len(TEXT), Path("base/Packages"))
+        )
+
+    def test_base_is_not_a_file(self, fixtures: Fixtures) -> None:
+        Path("base").mkdir()
+
+        self.assertFalse(delta.worthwhile(Path("Packages"), len(TEXT), Path("base")))
+
+
+@given(testkit.tmpdir, lib.cd)
+@where(cd=Param(lambda fixtures: fixtures.tmpdir))
+class EncodeTests(TestCase):
+    # pylint: disable=unused-argument
+    def test(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+        tarinfo = make_tarinfo("test.txt", TEXT)
+
+        encoded = delta.encode(tarinfo, io.BytesIO(TEXT), Path("base")).read()
+
+        self.assertTrue(delta.is_delta(tarinfo))
+        self.assertEqual("base", tarinfo.pax_headers[delta.HEADER])
+        self.assertEqual(len(encoded), tarinfo.size)
+        self.assertEqual(len(TEXT), compression.file_size(tarinfo))
+        self.assertEqual(TEXT, delta.decode(tarinfo, encoded, BASE))
+
+    def test_not_worth_it(self, fixtures: Fixtures) -> None:
+        data = os.urandom(len(BASE))
+        Path("base").write_bytes(BASE)
+        tarinfo = make_tarinfo("test.txt", data)
+
+        encoded = delta.encode(tarinfo, io.BytesIO(data), Path("base")).read()
+
+        self.assertFalse(delta.is_delta(tarinfo))
+        self.assertEqual(len(data), tarinfo.size)
+        self.assertEqual(data, encoded)
+
+
+@given(testkit.tmpdir, lib.cd)
+@where(cd=Param(lambda fixtures: fixtures.tmpdir))
+class ExtractTests(TestCase):
+    # pylint: disable=unused-argument
+    def test(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+        archive = make_archive("test.txt", TEXT, Path("base"))
+
+        with tar.open(fileobj=archive, mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            delta.extract(tarfile, tarinfo, Path("base"))
+
+        path = Path("test.txt")
+        self.assertEqual(TEXT, path.read_bytes())
+        self.assertEqual(0o640, path.stat().st_mode & 0o777)
+        self.assertEqual(1740000000, path.stat().st_mtime)
+
+    def test_wrong_base(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+        archive = make_archive("test.txt", TEXT, Path("base"))
+        Path("base").write_bytes(BASE[:-1])
+
+        with tar.open(fileobj=archive, mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            with self.assertRaises(tar.ReadError):
+                delta.extract(tarfile, tarinfo, Path("base"))
+
+    def test_missing_base(self, fixtures: Fixtures) -> None:
+        Path("base").write_bytes(BASE)
+        archive = make_archive("test.txt", TEXT, Path("base"))
+        Path("base").unlink()
+
+        with tar.open(fileobj=archive, mode="r|") as tarfile:
+            tarinfo = tarfile.next()
+            assert tarinfo is not None
+            with self.assertRaises(tar.ReadError):
+                delta.extract(tarfile, tarinfo, Path("base"))
+
+        self.assertFalse(Path("test.txt").exists())
+
+
+def make_tarinfo(name: str, data: bytes) -> tar.TarInfo:
+    tarinfo = tar.TarInfo(name)
+    tarinfo.size = len(data)
+    tarinfo.mode = 0o640
+    tarinfo.mtime = 1740000000
+
+    return tarinfo
+
+
+def make_archive(name: str, data: bytes, base: Path) -> io.BytesIO:
+    """Return a tar archive of the given file, delta-encoded against base"""
+    tarinfo = make_tarinfo(name, data)
+    fp = io.BytesIO()
+
+    with tar.open(fileobj=fp, mode="w", format=tar.PAX_FORMAT) as tarfile:
+        tarfile.addfile(tarinfo, delta.encode(tarinfo, io.BytesIO(data), base))
+
+    fp.seek(0)
+
+    return fp
@@ -0,0 +1,69 @@
+"""Tests for the digests module"""
+
+# pylint: disable=missing-docstring
+
+import hashlib
+import os
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from unittest_fixtures import Fixtures, given
+
+from gbp_archive.digests import DigestCache, signed
+
+
+@given(testkit.tmpdir)
+class DigestCacheTests(TestCase):
+    def test_digest(self, fixtures: Fixtures) -> None:
+        (fixtures.tmpdir / "test.txt").write_bytes(b"test")
+
+        with DigestCache(fixtures.tmpdir) as digests:
+            digest = digests.digest("test.txt")
+
+        self.assertEqual(f"sha256:{hashlib.sha256(b'test').hexdigest()}", digest)
+
+    def test_unchanged_files_not_hashed(self, fixtures: Fixtures) -> None:
+        (fixtures.tmpdir / "test.txt").write_bytes(b"test")
+
+        with DigestCache(fixtures.tmpdir) as digests:
+            digest = digests.digest("test.txt")
+
+        with mock.patch("gbp_archive.digests.hashlib.file_digest") as file_digest:
+            with DigestCache(fixtures.tmpdir) as digests:
+                self.assertEqual(digest, digests.digest("test.txt"))
+
+        file_digest.assert_not_called()
+
+    def test_changed_files_hashed(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.txt"
+        path.write_bytes(b"test")
+
+        with DigestCache(fixtures.tmpdir) as digests:
+            digests.digest("test.txt")
+            path.write_bytes(b"changed")
+            os.utime(path, ns=(0, 0))
+
+            digest = digests.digest("test.txt")
+
+        self.assertEqual(f"sha256:{hashlib.sha256(b'changed').hexdigest()}", digest)
+
+    def test_prune(self, fixtures: Fixtures) -> None:
+        for name in ["deleted", "changed", "unchanged"]:
+            (fixtures.tmpdir / name).write_bytes(name.encode())
+
+        with DigestCache(fixtures.tmpdir) as digests:
+            for name in ["deleted", "changed", "unchanged"]:
+                digests.digest(name)
+
+            (fixtures.tmpdir / "deleted").unlink()
+            os.utime(fixtures.tmpdir / "changed", ns=(0, 0))
+
+            self.assertEqual(2, digests.prune())
+            self.assertEqual(1, len(digests))
+
+
+class SignedTests(TestCase):
+    def test(self) -> None:
+        self.assertEqual(5, signed(5))
+        self.assertEqual(-1, signed((1 << 64) - 1))
+        self.assertEqual(-(1 << 63), signed(1 << 63))
@@ -0,0 +1,90 @@
+"""Import-time benchmark for the gbpcli subcommand modules"""
+
+# pylint: disable=missing-docstring
+import subprocess
+import sys
+from unittest import TestCase
+
+SUBCOMMAND_MODULES = (
+    "gbp_archive.cli.archive",
+    "gbp_archive.cli.dump",
+    "gbp_archive.cli.restore",
+)
+
+# Modules which should only be loaded when a subcommand handler actually runs
+HEAVY_MODULES = (
+    "dateparser",
+    "django",
+    "gbp_archive.core",
+    "gbp_archive.jobs",
+    "gbp_archive.remote",
+    "gbp_archive.rewrite",
+    "gbp_archive.sync",
+    "gentoo_build_publisher.publisher",
+    "gentoo_build_publisher.records",
+    "gentoo_build_publisher.types",
+)
+
+# Cumulative time (in microseconds) that importing our subcommand modules, and building
+# their parsers, may add to every `gbp` invocation. This is generous as it should only be
+# a few milliseconds.
+IMPORT_BUDGET = 25_000
+
+MARKER = "--- gbp-archive ---"
+
+
+class ImportTimeTests(TestCase):
+    def test_heavy_modules_not_imported(self) -> None:
+        times, loaded = import_times()
+        imported = {name for name, _ in times}
+
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, imported)
+            self.assertNotIn(module, loaded)
+
+    def test_within_budget(self) -> None:
+        # Take the best of a few runs to keep the noise down
+        best = min(sum(t for _, t in import_times()[0]) for _ in range(3))
+
+        self.assertLess(best, IMPORT_BUDGET)
+
+
+def import_times() -> tuple[list[tuple[str, int]], set[str]]:
+    """Return the (module, cumulative µs) imported by our gbpcli subcommand modules
+
+    The modules are imported, and their parsers built, in a fresh interpreter using
+    `-X importtime`, as gbpcli does on every invocation. gbpcli is imported first as it
+    would already be loaded when it imports the subcommands. Only modules imported after
+    that are returned, and nested imports are included in the cumulative time of their
+    top-level import.
+
+    Also return the names of all the modules loaded afterwards.
+    """
+    code = (
+        "import argparse, sys, gbpcli.gbp, gbpcli.types, gbpcli.utils\n"
+        f"print({MARKER!r}, file=sys.stderr, flush=True)\n"
+        f"import {', '.join(SUBCOMMAND_MODULES)}\n"
+        f"for module in [{', '.join(SUBCOMMAND_MODULES)}]:\n"
+        "    module.parse_args(argparse.ArgumentParser())\n"
+        "print('\\n'.join(sys.modules))\n"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    )
+    _, _, output = proc.stderr.partition(f"{MARKER}\n")
+    times: list[tuple[str, int]] = []
+
+    for line in output.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        if name.startswith("  "):
+            # nested import. It's accounted for in its parent's cumulative time
+            times.append((name.strip(), 0))
+        else:
+            times.append((name.strip(), int(cumulative)))
+
+    return times, set(proc.stdout.splitlines())
@@ -0,0 +1,181 @@
+"""Tests for the jobs module"""
+
+# pylint: disable=missing-docstring
+
+from pathlib import Path
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import jobs
+from gbp_archive.core import dump, tabulate
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+@given(testkit.publisher, lib.builds, lib.worker, testkit.tmpdir)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class SubmitDumpTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        path = fixtures.tmpdir / "test.tar"
+
+        job = jobs.submit_dump(builds, path)
+
+        self.assertEqual("queued", job["state"])
+        self.assertEqual("queued", jobs.get(job["id"])["state"])
+        self.assertFalse(path.exists())
+
+        lib.run_tasks(fixtures.worker)
+
+        job = jobs.get(job["id"])
+        self.assertEqual("done", job["state"])
+        self.assertEqual(12, job["progress"])
+        self.assertEqual(12, job["total"])
+
+        with path.open("rb") as fp:
+            self.assertEqual(set(builds), set(tabulate(fp)))
+
+        log = jobs.log_path(job["id"]).read_text(encoding="utf8").splitlines()
+        self.assertEqual(12, len(log))
+        self.assertIn(f"dumping records for {builds[0]}", log)
+
+    def test_options(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.tar"
+
+        job = jobs.submit_dump(
+            fixtures.builds, path, options=DumpOptions(reproducible=True)
+        )
+
+        self.assertTrue(job["reproducible"])
+
+        with mock.patch("gbp_archive.core.dump") as core_dump:
+            lib.run_tasks(fixtures.worker)
+
+        options = core_dump.call_args.kwargs["options"]
+        self.assertTrue(options.reproducible)
+        self.assertIsNone(options.limiter)
+
+    def test_cancel_queued(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.tar"
+        job = jobs.submit_dump(fixtures.builds, path)
+
+        job = jobs.cancel(job["id"])
+
+        self.assertEqual("cancelling", job["state"])
+
+        lib.run_tasks(fixtures.worker)
+
+        self.assertEqual("cancelled", jobs.get(job["id"])["state"])
+        self.assertFalse(path.exists())
+        self.assertFalse(jobs.cancel_path(job["id"]).exists())
+
+    def test_cancel_running(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.tar"
+        job = jobs.submit_dump(fixtures.builds, path)
+
+        with mock.patch.object(
+            jobs, "cancel_requested", side_effect=[False, False, False, True]
+        ):
+            lib.run_tasks(fixtures.worker)
+
+        job = jobs.get(job["id"])
+        self.assertEqual("cancelled", job["state"])
+        self.assertEqual(1, job["progress"])
+        self.assertFalse(path.exists())
+
+    def test_cancel_finished(self, fixtures: Fixtures) -> None:
+        job = jobs.submit_dump(fixtures.builds, fixtures.tmpdir / "test.tar")
+        lib.run_tasks(fixtures.worker)
+
+        job = jobs.cancel(job["id"])
+
+        self.assertEqual("done", job["state"])
+        self.assertFalse(jobs.cancel_path(job["id"]).exists())
+
+    def test_failure(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "missing" / "test.tar"
+        job = jobs.submit_dump(fixtures.builds, path)
+
+        with self.assertLogs("gbp_archive.jobs", level="ERROR"):
+            lib.run_tasks(fixtures.worker)
+
+        job = jobs.get(job["id"])
+        self.assertEqual("failed", job["state"])
+        self.assertIn("No such file or directory", job["error"])
+
+
+@given(testkit.publisher, lib.builds, lib.worker, testkit.tmpdir)
+class SubmitRestoreTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        path = fixtures.tmpdir / "test.tar"
+        dump_builds(builds, path)
+
+        for build in builds:
+            publisher.delete(build)
+
+        job = jobs.submit_restore(path)
+        lib.run_tasks(fixtures.worker)
+
+        job = jobs.get(job["id"])
+        self.assertEqual("done", job["state"], job.get("error"))
+        self.assertEqual(12, job["total"])
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+        self.assertTrue(path.exists())
+
+    def test_corrupt_archive(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.tar"
+        path.write_bytes(b"This is not a dump")
+
+        job = jobs.submit_restore(path)
+
+        with self.assertLogs("gbp_archive.jobs", level="ERROR"):
+            lib.run_tasks(fixtures.worker)
+
+        job = jobs.get(job["id"])
+        self.assertEqual("failed", job["state"])
+        self.assertTrue(path.exists())
+
+
+@given(testkit.publisher, lib.builds, lib.worker, testkit.tmpdir)
+class ListJobsTests(TestCase):
+    # pylint: disable=unused-argument
+    def test(self, fixtures: Fixtures) -> None:
+        second = jobs.new_job("restore", "test.tar", contents=[])
+        second["submitted"] = "2025-02-17T00:00:00+00:00"
+        jobs.save(second)
+        first = jobs.new_job("dump", "test.tar", contents=[])
+        first["submitted"] = "2025-02-16T00:00:00+00:00"
+        jobs.save(first)
+
+        self.assertEqual(
+            [first["id"], second["id"]], [job["id"] for job in jobs.list_jobs()]
+        )
+
+    def test_no_jobs(self, fixtures: Fixtures) -> None:
+        self.assertEqual([], jobs.list_jobs())
+
+
+@given(testkit.publisher)
+class GetTests(TestCase):
+    # pylint: disable=unused-argument
+    def test_not_found(self, fixtures: Fixtures) -> None:
+        with self.assertRaises(jobs.JobNotFoundError):
+            jobs.get("bogus")
+
+        with self.assertRaises(jobs.JobNotFoundError):
+            jobs.cancel("bogus")
+
+
+def dump_builds(builds: list[Build], path: Path) -> None:
+    with path.open("wb") as fp:
+        dump(builds, fp)
@@ -0,0 +1,124 @@
+"""Tests for the manifests module"""
+
+# pylint: disable=missing-docstring
+
+import os
+import stat
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Content
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import manifests, summary
+from gbp_archive.digests import DigestCache
+
+from . import lib
+
+ENABLED = {manifests.ENABLE_VARIABLE: "1"}
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 2)])
+class PrecomputeTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        storage = publisher.storage
+
+        manifests.precompute(build)
+
+        with manifests.Manifests(storage.root) as store:
+            self.assertEqual(len(Content), len(store))
+            path = storage.get_path(build, Content.REPOS)
+            records = store.get(path.relative_to(storage.root))
+
+        assert records is not None
+        self.assertEqual(
+            sorted(name for name, _ in manifests.walk(path)),
+            sorted(str(storage.root / record.name) for record in records),
+        )
+
+    def test_caches_digests(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        root = publisher.storage.root
+
+        manifests.precompute(build)
+
+        with DigestCache(root) as digests:
+            cached = len(digests)
+        files = [
+            name
+            for content in Content
+            for name, st in manifests.walk(publisher.storage.get_path(build, content))
+            if stat.S_ISREG(st.st_mode)
+        ]
+        self.assertEqual(len({os.lstat(name).st_ino for name in files}), cached)
+
+    def test_changed_directory(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        storage = publisher.storage
+        path = storage.get_path(build, Content.REPOS)
+
+        manifests.precompute(build)
+        (path / "new.txt").write_bytes(b"test")
+
+        self.assertEqual({}, manifests.lookup([path]))
+
+    def test_prunes_purged_builds(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        manifests.precompute(builds[0])
+
+        publisher.delete(builds[0])
+        manifests.precompute(builds[1])
+
+        with manifests.Manifests(publisher.storage.root) as store:
+            self.assertEqual(len(Content), len(store))
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 2)])
+class LookupTests(TestCase):
+    def test_none_precomputed(self, fixtures: Fixtures) -> None:
+        path = publisher.storage.get_path(fixtures.builds[0], Content.REPOS)
+
+        self.assertEqual({}, manifests.lookup([path]))
+        self.assertFalse((publisher.storage.root / manifests.MANIFESTS_PATH).exists())
+
+    def test_summary_uses_manifests(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        expected = summary.summarize(builds)
+
+        for build in builds:
+            manifests.precompute(build)
+
+        with mock.patch.object(summary, "stat_tree") as stat_tree:
+            self.assertEqual(expected, summary.summarize(builds))
+
+        stat_tree.assert_not_called()
+
+
+@given(testkit.publisher, lib.builds, lib.worker)
+@where(builds__machines=[("foo", 1)])
+class HandlePostpullTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+
+        with mock.patch.dict(os.environ, ENABLED):
+            manifests.handle_postpull(build=build, packages=[], gbp_metadata=None)
+
+        self.assertEqual(
+            [(manifests.precompute_task, (str(build),), {})], fixtures.worker
+        )
+        lib.run_tasks(fixtures.worker)
+
+        with manifests.Manifests(publisher.storage.root) as store:
+            self.assertEqual(len(Content), len(store))
+
+    def test_disabled(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+
+        with mock.patch.dict(os.environ, {manifests.ENABLE_VARIABLE: "0"}):
+            manifests.handle_postpull(build=build, packages=[], gbp_metadata=None)
+
+        self.assertEqual([], fixtures.worker)
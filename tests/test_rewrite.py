@@ -0,0 +1,390 @@
+"""Tests for the rewrite module"""
+
+# pylint: disable=missing-docstring
+
+import datetime as dt
+import io
+import tarfile as tar
+from pathlib import Path
+from typing import Any, Iterable
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import delta, rewrite
+from gbp_archive.core import dump, read_metadata, restore, tabulate
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class CopyTests(TestCase):
+    def test_filter(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        outfile = io.BytesIO()
+
+        selected = [build for build in builds if build.machine == "foo"][-1:]
+        selected.append(builds[-1])
+        select = rewrite.select_builds([str(build) for build in selected])
+        copied = rewrite.copy([archive], outfile, select=select)
+
+        self.assertEqual(set(selected), set(copied))
+
+        outfile.seek(0)
+        self.assertEqual(set(selected), set(tabulate(outfile)))
+
+        delete_builds(builds)
+        outfile.seek(0)
+        restore(outfile)
+
+        for build in builds:
+            self.assertEqual(build in selected, publisher.storage.pulled(build))
+            self.assertEqual(
+                build in selected, publisher.repo.build_records.exists(build)
+            )
+
+    def test_filter_by_machine(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        outfile = io.BytesIO()
+
+        copied = rewrite.copy([archive], outfile, select=rewrite.select_builds(["bar"]))
+
+        self.assertEqual([build for build in builds if build.machine == "bar"], copied)
+
+    def test_summary(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+        outfile = io.BytesIO()
+
+        rewrite.copy([archive], outfile)
+
+        archive.seek(0)
+        outfile.seek(0)
+        self.assertEqual(
+            read_metadata(archive)["summary"], read_metadata(outfile)["summary"]
+        )
+
+    def test_compressed_summary(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        repos = publisher.storage.get_path(builds[0], Content.REPOS)
+        (repos / "Packages").write_bytes(b"Packages\n" * 10_000)
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(compress=True))
+        archive.seek(0)
+        outfile = io.BytesIO()
+
+        rewrite.copy([archive], outfile)
+
+        archive.seek(0)
+        outfile.seek(0)
+        self.assertEqual(
+            read_metadata(archive)["summary"], read_metadata(outfile)["summary"]
+        )
+
+    def test_keeps_deltas(self, fixtures: Fixtures) -> None:
+        builds = [build for build in fixtures.builds if build.machine == "foo"]
+        lib.write_packages(builds)
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(delta=True))
+        archive.seek(0)
+        outfile = io.BytesIO()
+
+        rewrite.copy([archive], outfile, select=rewrite.select_builds(["foo"]))
+
+        self.assertEqual(
+            [f"repos/{build}/Packages" for build in builds[1:]],
+            [name for name in delta_members(outfile) if name.endswith("/Packages")],
+        )
+
+    def test_delta_base_dropped(self, fixtures: Fixtures) -> None:
+        builds = [build for build in fixtures.builds if build.machine == "foo"]
+        texts = lib.write_packages(builds)
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(delta=True))
+        archive.seek(0)
+        outfile = io.BytesIO()
+        selected = [builds[0], builds[2]]
+        select = rewrite.select_builds([str(build) for build in selected])
+
+        rewrite.copy([archive], outfile, select=select)
+
+        self.assertEqual([], delta_members(outfile))
+        delete_builds(builds)
+        outfile.seek(0)
+        restore(outfile)
+
+        self.assertFalse(publisher.storage.pulled(builds[1]))
+        for build, text in zip(builds, texts):
+            if build in selected:
+                repos = publisher.storage.get_path(build, Content.REPOS)
+                self.assertEqual(text, (repos / "Packages").read_bytes())
+
+    def test_holds_only_needed_files(self, fixtures: Fixtures) -> None:
+        builds = [build for build in fixtures.builds if build.machine == "foo"]
+        lib.write_packages(builds)
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(delta=True))
+        archive.seek(0)
+        select = rewrite.select_builds([str(builds[0]), str(builds[2])])
+        held: list[str] = []
+        hold = rewrite.StorageCopier.hold
+
+        def spy(copier: rewrite.StorageCopier, tarinfo: tar.TarInfo, fp: Any) -> None:
+            held.append(tarinfo.name)
+            hold(copier, tarinfo, fp)
+
+        with mock.patch.object(rewrite.StorageCopier, "hold", spy):
+            rewrite.copy([archive], io.BytesIO(), select=select)
+
+        # Of the dropped build, only the delta base of the next build's Packages
+        self.assertEqual(
+            [f"repos/{builds[1]}/Packages"],
+            [name for name in held if name.split("/")[1] == str(builds[1])],
+        )
+
+    def test_keeps_contents(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(contents=(Content.REPOS,)))
+        archive.seek(0)
+        outfile = io.BytesIO()
+
+        rewrite.copy([archive], outfile)
+
+        outfile.seek(0)
+        self.assertEqual(["repos"], read_metadata(outfile)["contents"])
+
+    def test_reproducible_archive(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = io.BytesIO()
+        dump(builds, archive, options=DumpOptions(reproducible=True))
+        archive.seek(0)
+        outfile = io.BytesIO()
+
+        copied = rewrite.copy([archive], outfile, select=rewrite.select_builds(["bar"]))
+
+        self.assertEqual([build for build in builds if build.machine == "bar"], copied)
+
+    def test_corrupt_archive(self, fixtures: Fixtures) -> None:
+        archive = dump_builds(fixtures.builds)
+        data = bytearray(archive.getvalue())
+        index = data.index(b'"machine":"foo"')
+        data[index : index + 15] = b'"machine":"fox"'
+
+        with self.assertRaises(tar.ReadError):
+            rewrite.copy([io.BytesIO(data)], io.BytesIO())
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class MergeTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        foo_builds = [build for build in builds if build.machine == "foo"]
+        others = [build for build in builds if build.machine != "foo"]
+        outfile = io.BytesIO()
+
+        merged = rewrite.merge(
+            [dump_builds(foo_builds), dump_builds(others), dump_builds(foo_builds[:1])],
+            outfile,
+        )
+
+        self.assertEqual(len(builds), len(merged))
+        self.assertEqual(set(builds), set(merged))
+
+        delete_builds(builds)
+        outfile.seek(0)
+        restore(outfile)
+
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+
+@given(testkit.publisher, lib.builds, testkit.tmpdir)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class SplitTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = dump_builds(builds)
+
+        paths = rewrite.split(archive, fixtures.tmpdir)
+
+        self.assertEqual(["bar.tar", "baz.tar", "foo.tar"], [p.name for p in paths])
+
+        for path in paths:
+            with path.open("rb") as fp:
+                machines = {build.machine for build in tabulate(fp)}
+            self.assertEqual({path.stem}, machines)
+
+    def test_unseekable(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        archive = lib.Unseekable(dump_builds(builds).getvalue())
+
+        paths = rewrite.split(archive, fixtures.tmpdir)
+
+        self.assertEqual(["bar.tar", "baz.tar", "foo.tar"], [p.name for p in paths])
+
+        for path in paths:
+            with path.open("rb") as fp:
+                restored = set(tabulate(fp))
+            self.assertEqual(
+                {build for build in builds if build.machine == path.stem}, restored
+            )
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class ConsolidateTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        base = dump_builds(builds[:4])
+        incremental = dump_builds(builds[4:])
+        outfile = io.BytesIO()
+
+        consolidated = rewrite.consolidate([base, incremental], outfile)
+
+        self.assertEqual(set(builds), set(consolidated))
+        outfile.seek(0)
+        self.assertEqual(set(builds), set(tabulate(outfile)))
+
+    def test_newest_wins(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        base = dump_builds(builds)
+        records = publisher.repo.build_records
+        records.save(records.get(builds[0]), note="newest")
+        incremental = dump_builds(builds[:1])
+        outfile = io.BytesIO()
+
+        rewrite.consolidate([base, incremental], outfile)
+
+        records.save(records.get(builds[0]), note=None)
+        delete_builds(builds)
+        outfile.seek(0)
+        restore(outfile)
+        self.assertEqual("newest", records.get(builds[0]).note)
+
+    def test_drops_purged_builds(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        base = dump_builds(builds[:4])
+        incremental = dump_builds(builds[4:])
+        publisher.delete(builds[0])
+        outfile = io.BytesIO()
+
+        consolidated = rewrite.consolidate(
+            [base, incremental], outfile, select=rewrite.select_existing
+        )
+
+        self.assertEqual(set(builds[1:]), set(consolidated))
+
+    def test_tags_from_newest(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        foo_builds = [build for build in builds if build.machine == "foo"]
+        publisher.tag(foo_builds[0], "stable")
+        base = dump_builds(builds)
+        publisher.untag("foo", "stable")
+        publisher.tag(foo_builds[1], "stable")
+        incremental = dump_builds(foo_builds[1:2])
+        outfile = io.BytesIO()
+
+        rewrite.consolidate([base, incremental], outfile)
+
+        delete_builds(builds)
+        outfile.seek(0)
+        restore(outfile)
+        self.assertEqual(["stable"], publisher.tags(foo_builds[1]))
+        self.assertEqual([], publisher.tags(foo_builds[0]))
+
+
+@given(testkit.publisher, lib.builds, testkit.tmpdir)
+class ExpireTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        chain = []
+
+        for day in [3, 1, 2]:
+            path = fixtures.tmpdir / f"{day}.tar"
+            dump_at(builds, path, dt.datetime(2025, 2, day, tzinfo=dt.UTC))
+            chain.append(path)
+
+        self.assertEqual(
+            ["1.tar", "2.tar", "3.tar"], [p.name for p in rewrite.chain_order(chain)]
+        )
+
+        expired = rewrite.expire(chain, 1)
+
+        self.assertEqual(["1.tar", "2.tar"], [path.name for path in expired])
+        self.assertEqual([True, False, False], [path.exists() for path in chain])
+
+    def test_keep_more_than_chain(self, fixtures: Fixtures) -> None:
+        path = fixtures.tmpdir / "test.tar"
+        dump_at(fixtures.builds, path, dt.datetime(2025, 2, 16, tzinfo=dt.UTC))
+
+        self.assertEqual([], rewrite.expire([path], 2))
+        self.assertTrue(path.exists())
+
+
+class MemberBuildIdTests(TestCase):
+    build_ids = {"lighthouse.1", "lighthouse.2"}
+
+    def test_content(self) -> None:
+        tarinfo = tar.TarInfo("repos/lighthouse.2/gentoo/metadata")
+
+        self.assertEqual(
+            "lighthouse.2", rewrite.member_build_id(tarinfo, self.build_ids)
+        )
+
+    def test_tag(self) -> None:
+        tarinfo = tar.TarInfo("repos/lighthouse@stable")
+        tarinfo.type = tar.SYMTYPE
+        tarinfo.linkname = "lighthouse.1"
+
+        self.assertEqual(
+            "lighthouse.1", rewrite.member_build_id(tarinfo, self.build_ids)
+        )
+
+    def test_other(self) -> None:
+        tarinfo = tar.TarInfo("repos/polaris.1")
+
+        self.assertIsNone(rewrite.member_build_id(tarinfo, self.build_ids))
+
+
+def dump_builds(builds: Iterable[Build]) -> io.BytesIO:
+    fp = io.BytesIO()
+    dump(builds, fp)
+    fp.seek(0)
+
+    return fp
+
+
+def dump_at(builds: Iterable[Build], path: Path, timestamp: dt.datetime) -> None:
+    with mock.patch("gbp_archive.metadata.time.localtime", return_value=timestamp):
+        with path.open("wb") as fp:
+            dump(builds, fp)
+
+
+def delete_builds(builds: Iterable[Build]) -> None:
+    for build in builds:
+        publisher.delete(build)
+
+
+def delta_members(fp: io.BytesIO) -> list[str]:
+    """Return the names of the delta files in the storage of the given archive"""
+    fp.seek(0)
+
+    with tar.open(fileobj=fp) as tarfile:
+        storage_fp = tarfile.extractfile("storage.tar")
+        assert storage_fp is not None
+        with tar.open(fileobj=storage_fp) as storage_tarfile:
+            return [
+                member.name
+                for member in storage_tarfile.getmembers()
+                if delta.is_delta(member)
+            ]
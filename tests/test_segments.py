@@ -0,0 +1,117 @@
+"""Tests for the segments module"""
+
+# pylint: disable=missing-docstring
+
+import json
+from pathlib import Path
+from typing import Any
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher.types import Build, Content
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import core, segments
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+@given(testkit.publisher, testkit.tmpdir, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class DumpTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+
+        paths = segments.dump(builds, directory)
+
+        self.assertEqual(
+            [directory / f"{machine}.tar" for machine in ["bar", "baz", "foo"]], paths
+        )
+        for path in paths:
+            self.assertEqual(
+                {build for build in builds if build.machine == path.stem},
+                set(tabulate(path)),
+            )
+        checkpoint = json.loads((directory / segments.CHECKPOINT_NAME).read_text())
+        self.assertEqual(
+            ["bar.tar", "baz.tar", "foo.tar"],
+            [segment["name"] for segment in checkpoint["segments"]],
+        )
+
+    def test_resume(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+        dump = core.dump
+
+        def fail_on_foo(builds: list[Build], *args: Any, **kwargs: Any) -> None:
+            if builds[0].machine == "foo":
+                raise OSError("No space left on device")
+            dump(builds, *args, **kwargs)
+
+        with mock.patch.object(segments.core, "dump", side_effect=fail_on_foo):
+            with self.assertRaises(OSError):
+                segments.dump(builds, directory)
+        self.assertFalse(any(directory.glob(".*.partial")))
+        self.assertFalse((directory / "foo.tar").exists())
+
+        with mock.patch.object(segments.core, "dump", wraps=dump) as core_dump:
+            segments.dump(builds, directory, resume=True)
+
+        self.assertEqual(1, core_dump.call_count)
+        self.assertEqual(
+            {build for build in builds if build.machine == "foo"},
+            set(tabulate(directory / "foo.tar")),
+        )
+
+    def test_resume_redoes_corrupt_last_segment(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+        segments.dump(builds, directory)
+        with (directory / "foo.tar").open("r+b") as fp:
+            fp.truncate(1024)
+
+        with mock.patch.object(segments.core, "dump", wraps=core.dump) as core_dump:
+            segments.dump(builds, directory, resume=True)
+
+        self.assertEqual(1, core_dump.call_count)
+        self.assertEqual("foo", core_dump.call_args[0][0][0].machine)
+        self.assertEqual(3, len(tabulate(directory / "foo.tar")))
+
+    def test_resume_redoes_changed_machines(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+        segments.dump(builds[1:], directory)
+
+        with mock.patch.object(segments.core, "dump", wraps=core.dump) as core_dump:
+            segments.dump(builds, directory, resume=True)
+
+        self.assertEqual(1, core_dump.call_count)
+        self.assertEqual(builds[0].machine, core_dump.call_args[0][0][0].machine)
+
+    def test_resume_other_contents(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+        segments.dump(builds, directory)
+        options = DumpOptions(contents=(Content.REPOS,))
+
+        with mock.patch.object(segments.core, "dump", wraps=core.dump) as core_dump:
+            segments.dump(builds, directory, options=options, resume=True)
+
+        self.assertEqual(3, core_dump.call_count)
+
+    def test_without_resume_starts_over(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        directory = fixtures.tmpdir / "dump"
+        segments.dump(builds, directory)
+
+        with mock.patch.object(segments.core, "dump", wraps=core.dump) as core_dump:
+            segments.dump(builds, directory)
+
+        self.assertEqual(3, core_dump.call_count)
+
+
+def tabulate(path: Path) -> list[Build]:
+    with path.open("rb") as fp:
+        return core.tabulate(fp)
@@ -0,0 +1,103 @@
+"""Tests for the staging module"""
+
+# pylint: disable=missing-docstring
+
+from unittest import TestCase
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build, Content
+from unittest_fixtures import Fixtures, given
+
+from gbp_archive.staging import Stage
+
+from . import lib
+
+
+@given(testkit.publisher, lib.pulled_build)
+class StageTests(TestCase):
+    def test_commit_replaces_existing_build(self, fixtures: Fixtures) -> None:
+        build = fixtures.pulled_build
+        live = publisher.storage.get_path(build, Content.REPOS)
+
+        with Stage() as stage:
+            staged = stage.path / Content.REPOS.value / str(build)
+            staged.mkdir(parents=True)
+            (staged / "new").write_text("test")
+
+            stage.commit(build)
+
+        self.assertEqual(["new"], [path.name for path in live.iterdir()])
+        self.assertTrue(publisher.storage.get_path(build, Content.BINPKGS).exists())
+        self.assertFalse(stage.path.exists())
+
+    def test_records_are_saved_on_commit(self, fixtures: Fixtures) -> None:
+        build = fixtures.pulled_build
+        record = publisher.record(build)
+        publisher.repo.build_records.delete(record)
+
+        with Stage() as stage:
+            stage.add_record(record)
+            self.assertFalse(publisher.repo.build_records.exists(build))
+
+            stage.commit(build)
+
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_finish_drops_remaining_records(self, fixtures: Fixtures) -> None:
+        build = fixtures.pulled_build
+        record = publisher.record(build)
+        publisher.repo.build_records.delete(record)
+
+        with Stage() as stage:
+            stage.add_record(record)
+            stage.finish()
+
+        self.assertFalse(publisher.repo.build_records.exists(build))
+
+    def test_unstaged(self, fixtures: Fixtures) -> None:
+        build = fixtures.pulled_build
+        record = publisher.record(build)
+        publisher.repo.build_records.delete(record)
+        live = publisher.storage.get_path(build, Content.REPOS)
+        files = list(live.iterdir())
+
+        with Stage(staged=False) as stage:
+            self.assertEqual(publisher.storage.root, stage.path)
+            stage.add_record(record)
+            stage.commit(build)
+
+        self.assertTrue(publisher.repo.build_records.exists(build))
+        self.assertEqual(files, list(live.iterdir()))
+        self.assertTrue(publisher.storage.root.exists())
+
+    def test_deferred_commits_on_finish(self, fixtures: Fixtures) -> None:
+        build = fixtures.pulled_build
+        record = publisher.record(build)
+        publisher.repo.build_records.delete(record)
+        committed: list[Build] = []
+
+        with Stage(on_commit=committed.append, deferred=True) as stage:
+            stage.add_record(record)
+            stage.commit(build)
+
+            self.assertEqual([], committed)
+            self.assertFalse(publisher.repo.build_records.exists(build))
+
+            stage.finish()
+
+        self.assertEqual([build], committed)
+        self.assertTrue(publisher.repo.build_records.exists(build))
+
+    def test_link_target(self, fixtures: Fixtures) -> None:
+        # pylint: disable=unused-argument
+        with Stage() as stage:
+            (stage.path / "repos").mkdir()
+            (stage.path / "repos/staged").write_text("test")
+
+            self.assertEqual(
+                stage.path / "repos/staged", stage.link_target("repos/staged")
+            )
+            self.assertEqual(
+                publisher.storage.root / "repos/live", stage.link_target("repos/live")
+            )
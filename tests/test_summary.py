@@ -0,0 +1,77 @@
+"""Tests for the summary module"""
+
+# pylint: disable=missing-docstring
+import os
+from pathlib import Path
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Content
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import summary as summary_module
+from gbp_archive.summary import summarize, walk_builds
+
+from . import lib
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("lighthouse", 3)])
+class SummarizeTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+
+        summary = summarize(builds)
+
+        self.assertEqual([str(build) for build in builds], list(summary["builds"]))
+        for build in builds:
+            build_summary = summary["builds"][str(build)]
+            packages = publisher.storage.get_packages(build)
+            self.assertEqual(len(packages), build_summary["binpkgs"])
+            self.assertGreater(build_summary["files"], len(packages))
+
+        build_sizes = sum(i["size"] for i in summary["builds"].values())
+        self.assertLessEqual(summary["size"], build_sizes)
+        self.assertGreater(summary["inodes"], summary["files"])
+
+    def test_counts_hard_links_once(self, fixtures: Fixtures) -> None:
+        build = fixtures.builds[0]
+        before = summarize([build])
+        path = publisher.storage.get_path(build, Content.ETC_PORTAGE)
+        (path / "make.conf").write_bytes(b"x" * 1000)
+        os.link(path / "make.conf", path / "make.conf.bak")
+
+        after = summarize([build])
+
+        self.assertEqual(before["size"] + 1000, after["size"])
+        self.assertEqual(before["files"] + 1, after["files"])
+        self.assertEqual(before["inodes"] + 1, after["inodes"])
+        self.assertEqual(
+            before["builds"][str(build)]["size"] + 1000,
+            after["builds"][str(build)]["size"],
+        )
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("lighthouse", 3)])
+class WalkBuildsTests(TestCase):
+    def test_walks_one_build_ahead(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        walked: set[str] = set()
+        stat_tree = summary_module.stat_tree
+
+        def spy(path: Path) -> tuple[summary_module.Entry, ...]:
+            walked.add(path.name)
+            return stat_tree(path)
+
+        with mock.patch.object(summary_module, "stat_tree", side_effect=spy):
+            walker = walk_builds(builds)
+            build, entries = next(walker)
+
+            self.assertEqual(builds[0], build)
+            self.assertTrue(entries)
+            self.assertEqual({str(b) for b in builds[:2]}, walked)
+
+            self.assertEqual(builds[1:], [build for build, _ in walker])
+        self.assertEqual({str(b) for b in builds}, walked)
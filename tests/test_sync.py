@@ -0,0 +1,93 @@
+"""Tests for the sync module"""
+
+# pylint: disable=missing-docstring
+
+import io
+import json
+from typing import Iterable
+from unittest import TestCase
+
+import gbp_testkit.fixtures as testkit
+from gentoo_build_publisher import publisher
+from gentoo_build_publisher.types import Build
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import sync
+from gbp_archive.core import dump, tabulate
+
+from . import lib
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class SendTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        infile = handshake(builds[:4])
+        outfile = io.BytesIO()
+
+        sent = sync.send(builds, infile, outfile)
+
+        self.assertEqual(set(builds[4:]), set(sent))
+        outfile.seek(0)
+        self.assertEqual(set(builds[4:]), set(tabulate(outfile)))
+
+    def test_nothing_missing(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        outfile = io.BytesIO()
+
+        sent = sync.send(builds, handshake(builds), outfile)
+
+        self.assertEqual([], sent)
+        outfile.seek(0)
+        self.assertEqual([], tabulate(outfile))
+
+    def test_invalid_handshake(self, fixtures: Fixtures) -> None:
+        outfile = io.BytesIO()
+
+        with self.assertRaises(sync.ProtocolError):
+            sync.send(fixtures.builds, io.BytesIO(b"This is a test\n"), outfile)
+
+        self.assertEqual(b"", outfile.getvalue())
+
+    def test_unsupported_version(self, fixtures: Fixtures) -> None:
+        infile = io.BytesIO(
+            json.dumps(
+                {"protocol": sync.PROTOCOL, "version": 99, "builds": []}
+            ).encode()
+        )
+
+        with self.assertRaises(sync.ProtocolError):
+            sync.send(fixtures.builds, infile, io.BytesIO())
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class ReceiveTests(TestCase):
+    def test(self, fixtures: Fixtures) -> None:
+        builds = fixtures.builds
+        infile = io.BytesIO()
+        dump(builds[4:], infile)
+        infile.seek(0)
+        for build in builds[4:]:
+            publisher.delete(build)
+        outfile = io.BytesIO()
+
+        sync.receive(infile, outfile)
+
+        line = outfile.getvalue()
+        self.assertTrue(line.endswith(b"\n"))
+        self.assertEqual(
+            {str(build) for build in builds[:4]}, sync.read_handshake(io.BytesIO(line))
+        )
+        for build in builds:
+            self.assertTrue(publisher.storage.pulled(build))
+            self.assertTrue(publisher.repo.build_records.exists(build))
+
+
+def handshake(builds: Iterable[Build]) -> io.BytesIO:
+    fp = io.BytesIO()
+    sync.write_handshake(fp, builds)
+    fp.seek(0)
+
+    return fp
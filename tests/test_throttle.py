@@ -0,0 +1,127 @@
+"""Tests for the throttle module"""
+
+# pylint: disable=missing-docstring
+import io
+import subprocess
+from unittest import TestCase, mock
+
+import gbp_testkit.fixtures as testkit
+from unittest_fixtures import Fixtures, given, where
+
+from gbp_archive import throttle
+from gbp_archive.core import dump
+from gbp_archive.types import DumpOptions
+
+from . import lib
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TokenBucketTests(TestCase):
+    def test_within_capacity_does_not_block(self) -> None:
+        clock = FakeClock()
+        bucket = throttle.TokenBucket(1000, clock=clock, sleep=clock.sleep)
+
+        bucket.consume(600)
+        bucket.consume(400)
+
+        self.assertEqual([], clock.sleeps)
+
+    def test_blocks_until_debt_is_paid(self) -> None:
+        clock = FakeClock()
+        bucket = throttle.TokenBucket(1000, clock=clock, sleep=clock.sleep)
+
+        bucket.consume(2500)
+        bucket.consume(500)
+
+        self.assertEqual([1.5, 0.5], clock.sleeps)
+
+    def test_refills_over_time(self) -> None:
+        clock = FakeClock()
+        bucket = throttle.TokenBucket(1000, clock=clock, sleep=clock.sleep)
+        bucket.consume(1000)
+
+        clock.now += 10.0
+        bucket.consume(1000)
+
+        # The bucket is only refilled to its capacity
+        bucket.consume(500)
+        self.assertEqual([0.5], clock.sleeps)
+
+    def test_rate_must_be_positive(self) -> None:
+        with self.assertRaises(ValueError):
+            throttle.TokenBucket(0)
+
+
+class ThrottledIOTests(TestCase):
+    def test_reader(self) -> None:
+        bucket = mock.Mock()
+        reader = throttle.ThrottledReader(io.BytesIO(b"x" * 100), bucket)
+
+        self.assertEqual(b"x" * 60, reader.read(60))
+        self.assertEqual(b"x" * 40, reader.read(60))
+        self.assertEqual([mock.call(60), mock.call(40)], bucket.consume.call_args_list)
+
+    def test_writer(self) -> None:
+        bucket = mock.Mock()
+        fp = io.BytesIO()
+        writer = throttle.ThrottledWriter(fp, bucket)
+
+        writer.write(b"hello")
+
+        self.assertEqual(b"hello", fp.getvalue())
+        bucket.consume.assert_called_once_with(5)
+
+
+@given(testkit.publisher, lib.builds)
+@where(builds__machines=[("foo", 3), ("bar", 2), ("baz", 1)])
+class DumpRateTests(TestCase):
+    def test_achieves_requested_rate(self, fixtures: Fixtures) -> None:
+        clock = FakeClock()
+        rate = 1_000_000
+        bucket = throttle.TokenBucket(rate, 1, clock=clock, sleep=clock.sleep)
+        outfile = io.BytesIO()
+        consumed: list[int] = []
+
+        consume = bucket.consume
+
+        def record(amount: int) -> None:
+            consumed.append(amount)
+            consume(amount)
+
+        with mock.patch.object(bucket, "consume", side_effect=record):
+            dump(fixtures.builds, outfile, options=DumpOptions(limiter=bucket))
+
+        # The storage reads and the archive's output take from the same bucket, and
+        # together they go at the requested rate
+        reads = sum(consumed) - len(outfile.getvalue())
+        self.assertGreater(reads, 0)
+        self.assertAlmostEqual(1.0, sum(consumed) / clock.now / rate, places=2)
+
+
+@mock.patch("gbp_archive.throttle.subprocess.run")
+class SetIdleIOPriorityTests(TestCase):
+    def test(self, run: mock.Mock) -> None:
+        with mock.patch("gbp_archive.throttle.os.getpid", return_value=1234):
+            throttle.set_idle_io_priority()
+
+        run.assert_called_once_with(
+            ["ionice", "-c", "3", "-p", "1234"], check=True, capture_output=True
+        )
+
+    def test_failure(self, run: mock.Mock) -> None:
+        run.side_effect = subprocess.CalledProcessError(1, "ionice", stderr=b"nope")
+
+        with self.assertRaises(OSError):
+            throttle.set_idle_io_priority()
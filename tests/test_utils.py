@@ -2,9 +2,12 @@
 
 # pylint: disable=missing-docstring
 import datetime as dt
+import io
 import tarfile as tar
+import tracemalloc
 from dataclasses import dataclass
 from decimal import Decimal
+from typing import Any
 
 from gbp_testkit import TestCase
 from unittest_fixtures import Fixtures, given, where
@@ -62,3 +65,71 @@ class TarfileExtractTests(TestCase):
 
         with self.assertRaises(tar.ReadError):
             utils.tarfile_extract(tarfile, member)
+
+
+class TarfileMembersTests(TestCase):
+    def test_members_not_kept(self) -> None:
+        # Scaled down from millions of members so as to run in a few seconds. Were the
+        # members kept, they would take ~10MB
+        count = 20_000
+        tracemalloc.start()
+        try:
+            with tar.open(fileobj=HeaderStream(count), mode="r|") as tarfile:
+                total = sum(1 for _ in utils.tarfile_members(tarfile))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(count, total)
+        self.assertLess(peak, 256 * 1024)
+
+    def test_tarfile_add(self) -> None:
+        fp = io.BytesIO()
+
+        with tar.open(fileobj=fp, mode="w|") as tarfile:
+            for i in range(3):
+                utils.tarfile_add(tarfile, tar.TarInfo(f"dir/{i}"))
+            self.assertEqual([], tarfile.members)
+
+        fp.seek(0)
+        with tar.open(fileobj=fp, mode="r|") as tarfile:
+            names = [member.name for member in utils.tarfile_members(tarfile)]
+
+        self.assertEqual(["dir/0", "dir/1", "dir/2"], names)
+
+
+class TarfileReadModeTests(TestCase):
+    def test_seekable(self) -> None:
+        self.assertEqual("r:", utils.tarfile_read_mode(io.BytesIO()))
+
+    def test_stream(self) -> None:
+        self.assertEqual("r|", utils.tarfile_read_mode(HeaderStream(0)))
+
+
+class HeaderStream(io.RawIOBase):
+    """Stream of a tar archive of the given number of (empty) members"""
+
+    def __init__(self, count: int) -> None:
+        self.header = tar.TarInfo("repos/lighthouse.1/file").tobuf(tar.USTAR_FORMAT)
+        self.remaining = count
+        self.buffer = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        if not self.buffer:
+            if self.remaining:
+                self.remaining -= 1
+                self.buffer = memoryview(self.header)
+            elif self.remaining == 0:
+                self.remaining = -1
+                self.buffer = memoryview(bytes(2 * tar.BLOCKSIZE))
+            else:
+                return 0
+
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+
+        return size